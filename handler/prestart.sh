@@ -12,4 +12,5 @@ echo $DB
 python src/pre_start.py
 
 # Start application
-python src/main.py
+# exec: the SIGTERM of docker stop reaches the handler, it drains its workers
+exec python src/main.py
@@ -0,0 +1,25 @@
+import asyncio
+
+from src.consumer import BaseConsumer
+from src.core.abs import AsyncHandler
+from src.core.async_message_handlers import AsyncMessageHandler
+from src.queues.async_consumer_connection import AsyncConnectionManager
+
+
+class AsyncConsumer(BaseConsumer[AsyncHandler]):
+    """The Consumer of the asyncio handler, both share the loop of this consumer."""
+
+    def __init__(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._handler = AsyncMessageHandler()
+        self._loop.run_until_complete(self._handler.start())
+        self._connection = self.new_connection()
+        self._reconnect_delay = 0
+
+    def new_connection(self) -> AsyncConnectionManager:
+        return AsyncConnectionManager(handler=self._handler, loop=self._loop)
+
+    def close_handler(self) -> None:
+        self._loop.run_until_complete(self._handler.close())
+        self._loop.close()
@@ -1,6 +1,6 @@
 from typing import Literal
 
-from pydantic import computed_field, PostgresDsn
+from pydantic import computed_field, model_validator, PostgresDsn
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic_core import MultiHostUrl
 
@@ -26,7 +26,68 @@ class Settings(BaseSettings):
     MESSAGES_QUEUE: str
     MESSAGES_DECLARE_EXCHANGE: bool = True
 
+    # Sharding: the receivers publish each device to one of MESSAGES_SHARDS queues,
+    # 0 disables it. The handler consumes HANDLER_SHARDS or, when empty, the share of
+    # its replica: each of the HANDLER_REPLICAS handlers is given its own
+    # HANDLER_REPLICA, from 0, and consumes the shards with that remainder.
+    MESSAGES_SHARDS: int = 0
+    HANDLER_SHARDS: list[int] = []
+    HANDLER_REPLICA: int = 0
+    HANDLER_REPLICAS: int = 1
+
+    # Priority lane: the receivers publish the alarms to ALARMS_QUEUE. It is consumed
+    # on its own channel, with ALARMS_PREFETCH_COUNT messages in flight, so the alarms
+    # never wait behind the telemetry backlog.
+    PRIORITY_LANE: bool = False
+    ALARMS_PREFETCH_COUNT: int = 32
+
+    # Batching: the telemetry deliveries are saved BATCH_SIZE at a time, or
+    # BATCH_MAX_DELAY seconds after the first one, in one transaction, and acked
+    # together. The prefetch count follows BATCH_SIZE, 1 disables it.
+    BATCH_SIZE: int = 1
+    BATCH_MAX_DELAY: float = 0.05  # seconds
+
+    # Bulk inserts: the batches are streamed with COPY ... FROM STDIN, in the "text"
+    # or "binary" format. Empty keeps the ORM inserts.
+    COPY_FORMAT: Literal["", "text", "binary"] = ""
+
+    # Supervisor: HANDLER_WORKERS processes, each with its own AMQP connection, DB
+    # engine and device cache. The ones that exit are restarted, waiting up to
+    # WORKERS_MAX_RESTART_DELAY when they keep crashing. 1 runs a single consumer.
+    HANDLER_WORKERS: int = 1
+    WORKERS_CHECK_INTERVAL: float = 1  # seconds
+    WORKERS_MAX_RESTART_DELAY: float = 30  # seconds
+    WORKERS_DRAIN_TIMEOUT: float = 30  # seconds
+
+    # Asyncio handler: the consumer runs on pika's asyncio connection and the database
+    # on asyncpg, up to ASYNC_PREFETCH_COUNT messages handled at once, so their DB
+    # round trips overlap. It does not batch, BATCH_SIZE is not used.
+    ASYNC_HANDLER: bool = False
+    ASYNC_PREFETCH_COUNT: int = 64
+    ASYNC_DB_POOL_SIZE: int = 10
+
     RPC_QUEUE: str
+    # The device add/remove events of the user API, every worker consumes them through
+    # its own queue. The RPC queue is shared, only the worker answering gets its requests.
+    DEVICE_EVENTS_EXCHANGE: str = "device_events"
+
+    # Bound of the messages kept compressed by the receivers (content_encoding)
+    MAX_DECOMPRESSED_BYTES: int = 1024 * 1024  # bytes
+
+    # Messages with a message_id already saved in the last DEDUPE_WINDOW seconds
+    # are skipped. 0 disables it.
+    DEDUPE_WINDOW: float = 600
+    DEDUPE_MAX_KEYS: int = 500_000
+
+    # Unknown devices: the ids not found are remembered UNKNOWN_DEVICES_TTL seconds,
+    # their messages dropped with no query. DEVICE_BLOOM_FILTER adds a Bloom filter
+    # over all the device ids, rejecting the ones never seen with no query at all.
+    # Both are rebuilt from the database every DEVICE_CACHE_REBUILD seconds, 0 never.
+    UNKNOWN_DEVICES_TTL: float = 60  # seconds
+    UNKNOWN_DEVICES_MAX_KEYS: int = 100_000
+    DEVICE_BLOOM_FILTER: bool = False
+    DEVICE_BLOOM_ERROR_RATE: float = 0.01
+    DEVICE_CACHE_REBUILD: float = 300  # seconds
 
     @computed_field  # type: ignore
     @property
@@ -38,6 +99,31 @@ class Settings(BaseSettings):
     def MESSAGES_ROUTING_KEY(self) -> str:
         return f"{self.HANDLER_EXCHANGE}.*"
 
+    @computed_field  # type: ignore
+    @property
+    def REPLICA_SHARDS(self) -> list[int]:
+        if self.HANDLER_SHARDS:
+            return self.HANDLER_SHARDS
+        return list(
+            range(self.HANDLER_REPLICA, self.MESSAGES_SHARDS, self.HANDLER_REPLICAS)
+        )
+
+    @model_validator(mode="after")
+    def check_replica(self) -> "Settings":
+        if not 0 <= self.HANDLER_REPLICA < self.HANDLER_REPLICAS:
+            raise ValueError("HANDLER_REPLICA must be from 0 to HANDLER_REPLICAS - 1")
+        return self
+
+    @computed_field  # type: ignore
+    @property
+    def ALARMS_QUEUE(self) -> str:
+        return f"{self.MESSAGES_QUEUE}.alarms"
+
+    @computed_field  # type: ignore
+    @property
+    def ALARMS_ROUTING_KEY(self) -> str:
+        return f"{self.HANDLER_EXCHANGE}.alarms.*"
+
     # Postgres Config
     POSTGRES_SERVER: str
     POSTGRES_PORT: int = 5432
@@ -57,5 +143,17 @@ class Settings(BaseSettings):
             path=self.POSTGRES_DB,
         )
 
+    @computed_field  # type: ignore
+    @property
+    def SQL_ASYNC_DATABASE_URI(self) -> PostgresDsn:
+        return MultiHostUrl.build(
+            scheme="postgresql+asyncpg",
+            username=self.POSTGRES_USER,
+            password=self.POSTGRES_PASSWORD,
+            host=self.POSTGRES_SERVER,
+            port=self.POSTGRES_PORT,
+            path=self.POSTGRES_DB,
+        )
+
 
 settings = Settings()
@@ -1,19 +1,27 @@
 import logging
+from abc import ABC, abstractmethod
 from time import sleep
+from typing import Generic
 
+from src.config import settings
 from src.core.abs import Handler
-from src.queues.consumer_connection import ConnectionManager
+from src.queues.consumer_connection import (
+    BaseConnectionManager,
+    ConnectionManager,
+    HandlerT,
+)
 from src.core.message_handlers import get_handler
 
 
 logger = logging.getLogger(__name__)
 
 
-class Consumer:
-    def __init__(self) -> None:
-        self._handler: Handler = get_handler()
-        self._connection: ConnectionManager = ConnectionManager(handler=self._handler)
-        self._reconnect_delay = 0
+class BaseConsumer(ABC, Generic[HandlerT]):
+    """Runs the connection of its handler, a new one after each disconnection."""
+
+    _handler: HandlerT
+    _connection: BaseConnectionManager[HandlerT]
+    _reconnect_delay: int
 
     def run(self) -> None:
         while True:
@@ -22,8 +30,9 @@ class Consumer:
                 self._connection.run()
             except KeyboardInterrupt as e:
                 logger.warning("KeyboardInterrupt in consumer: %s", e)
-                self._handler.close()
+                # Stopped first, the pending batch is saved before the handler closes
                 self._connection.stop()
+                self.close_handler()
                 break
             except Exception as e:
                 logger.error("Error in consumer: %s", e)
@@ -36,7 +45,13 @@ class Consumer:
             reconnect_delay = self._get_reconnect_delay()
             logger.info("Reconnecting after %d seconds", reconnect_delay)
             sleep(reconnect_delay)
-            self._connection = ConnectionManager(handler=self._handler)
+            self._connection = self.new_connection()
+
+    @abstractmethod
+    def new_connection(self) -> BaseConnectionManager[HandlerT]: ...
+
+    @abstractmethod
+    def close_handler(self) -> None: ...
 
     def _get_reconnect_delay(self):
         if self._connection.was_consuming:
@@ -46,3 +61,25 @@ class Consumer:
         if self._reconnect_delay > 30:
             self._reconnect_delay = 30
         return self._reconnect_delay
+
+
+class Consumer(BaseConsumer[Handler]):
+    def __init__(self) -> None:
+        self._handler = get_handler()
+        self._connection = self.new_connection()
+        self._reconnect_delay = 0
+
+    def new_connection(self) -> ConnectionManager:
+        return ConnectionManager(handler=self._handler)
+
+    def close_handler(self) -> None:
+        self._handler.close()
+
+
+def new_consumer() -> BaseConsumer:
+    """The Consumer of the handler set up: the asyncio one with ASYNC_HANDLER."""
+    if settings.ASYNC_HANDLER:
+        from src.async_consumer import AsyncConsumer
+
+        return AsyncConsumer()
+    return Consumer()
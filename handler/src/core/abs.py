@@ -1,5 +1,9 @@
 from abc import ABC, abstractmethod
 from threading import Lock
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from src.core.batch import MessageBatch
 
 
 class SingletonConnection(type):
@@ -14,9 +18,41 @@ class SingletonConnection(type):
         return cls._instances[cls]
 
 
-class Handler(ABC):
+class BaseHandler(ABC):
+    """The device requests, answered in the I/O loop callback by every handler."""
+
+    @abstractmethod
+    def handle_rpc_request(self, corr_id: str, request: bytes) -> str: ...
+
+    @abstractmethod
+    def handle_device_event(self, corr_id: str, event: bytes) -> None: ...
+
+
+class Handler(BaseHandler):
     @abstractmethod
     def handle_message(self, msg: str | bytes, *args, **kwargs) -> None: ...  # type: ignore
 
+    @abstractmethod
+    def handle_envelope(self, msg: bytes, *args, **kwargs) -> None: ...  # type: ignore
+
+    @abstractmethod
+    def save_batch(self, batch: "MessageBatch") -> None: ...  # type: ignore
+
     @abstractmethod
     def close(self) -> None: ...  # type: ignore
+
+
+class AsyncHandler(BaseHandler):
+    """The Handler of the asyncio consumer, its messages are awaited in their tasks."""
+
+    @abstractmethod
+    async def start(self) -> None: ...
+
+    @abstractmethod
+    async def handle_message(self, msg: str | bytes, *args, **kwargs) -> None: ...  # type: ignore
+
+    @abstractmethod
+    async def handle_envelope(self, msg: bytes, *args, **kwargs) -> None: ...  # type: ignore
+
+    @abstractmethod
+    async def close(self) -> None: ...
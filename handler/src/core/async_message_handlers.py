@@ -0,0 +1,172 @@
+from logging import getLogger
+from typing import Any
+import json
+
+from src.core.abs import AsyncHandler
+from src.core.batch import MessageBatch
+from src.core.database.async_db import AsyncDB
+from src.core.dedupe import DedupeWindow
+from src.core.envelope import decode_envelope
+from src.core.message_handlers import parse_message
+
+
+class AsyncMessageHandler(AsyncHandler):
+    """
+    Message_Handler for the asyncio consumer: the messages are handled concurrently,
+    each awaiting its own DB round trips. The message ids being saved count as seen,
+    so a redelivery handled at the same time is skipped too.
+    """
+
+    def __init__(self, db: AsyncDB | None = None) -> None:
+        self.db: AsyncDB = db or AsyncDB()
+        self.dedupe = DedupeWindow()
+        self._saving: set[tuple[int, str]] = set()
+        self.logger = getLogger(self.__class__.__name__)
+
+    async def start(self) -> None:
+        await self.db.start()
+        self.logger.info("Message Handler initialized")
+
+    def _seen(self, device_id: int, message_id: str) -> bool:
+        return (device_id, message_id) in self._saving or self.dedupe.seen(
+            device_id, message_id
+        )
+
+    async def handle_message(
+        self,
+        msg: str | bytes,
+        corr_id: str,
+        headers: dict[str, Any] | None = None,
+        content_encoding: str | None = None,
+        content_type: str | None = None,
+        message_id: str | None = None,
+    ) -> None:
+        key = None
+        try:
+            device_id, body = parse_message(
+                msg, headers, content_encoding, content_type
+            )
+
+            self.logger.info(
+                "Handling message from device: %s",
+                device_id,
+                extra={"corrid": corr_id},
+            )
+
+            if message_id:
+                if self._seen(device_id, message_id):
+                    self.logger.info(
+                        "Duplicate message %s skipped",
+                        message_id,
+                        extra={"corrid": corr_id},
+                    )
+                    return
+                key = (device_id, message_id)
+                self._saving.add(key)
+
+            if await self.db.verify_device_id(device_id):
+                await self.db.save_message(body, device_id)
+                if key:
+                    self.dedupe.add(*key)
+                self.logger.info("Message saved", extra={"corrid": corr_id})
+            else:
+                self.logger.warning("Device ID not found", extra={"corrid": corr_id})
+
+        except Exception as e:
+            self.logger.error(
+                "Error handling message: %s", e, extra={"corrid": corr_id}
+            )
+        finally:
+            if key:
+                self._saving.discard(key)
+
+    async def handle_envelope(self, msg: bytes, corr_id: str) -> None:
+        """
+        Handles an envelope of messages coalesced by the receiver. The invalid messages
+        are skipped, the others are saved together.
+        """
+        envelope = MessageBatch()
+        try:
+            for body, properties in decode_envelope(msg):
+                item_corr_id = properties.get("correlation_id") or corr_id
+                message_id = properties.get("message_id")
+                try:
+                    device_id, payload = parse_message(
+                        body,
+                        properties.get("headers"),
+                        properties.get("content_encoding"),
+                        properties.get("content_type"),
+                    )
+                    if message_id and (
+                        envelope.seen(device_id, message_id)
+                        or self._seen(device_id, message_id)
+                    ):
+                        self.logger.info(
+                            "Duplicate message %s skipped",
+                            message_id,
+                            extra={"corrid": item_corr_id},
+                        )
+                    elif await self.db.verify_device_id(device_id):
+                        envelope.add(payload, device_id, message_id)
+                        if message_id:
+                            self._saving.add((device_id, message_id))
+                    else:
+                        self.logger.warning(
+                            "Device ID not found", extra={"corrid": item_corr_id}
+                        )
+                except Exception as e:
+                    self.logger.error(
+                        "Error handling message: %s", e, extra={"corrid": item_corr_id}
+                    )
+
+            await self.db.save_messages(envelope.messages)
+            for device_id, message_id in envelope.message_ids:
+                self.dedupe.add(device_id, message_id)
+            self.logger.info(
+                "Envelope of %d messages saved",
+                len(envelope),
+                extra={"corrid": corr_id},
+            )
+
+        except Exception as e:
+            self.logger.error(
+                "Error handling envelope: %s", e, extra={"corrid": corr_id}
+            )
+        finally:
+            self._saving -= envelope.message_ids
+
+    def handle_rpc_request(self, corr_id: str, request: bytes) -> str:
+        """See Message_Handler.handle_rpc_request."""
+        self.logger.info("Handling RPC request", extra={"corrid": corr_id})
+        self.handle_device_event(corr_id, request)
+        return "ok"
+
+    def handle_device_event(self, corr_id: str, event: bytes) -> None:
+        # Only the cache is updated, it runs in the I/O loop callback as it is
+        self.logger.debug("Device event: %s", event, extra={"corrid": corr_id})
+        try:
+            body = dict(json.loads(event.decode("utf-8")))
+            if body["method"] == "add":
+                device_id = int(body["device_id"])
+                self.db.add_device_to_cache(device_id)
+                self.logger.info(
+                    "Device added to cache: %s", device_id, extra={"corrid": corr_id}
+                )
+
+            elif body["method"] == "remove":
+                device_id = int(body["device_id"])
+                self.db.remove_device_from_cache(device_id)
+                self.logger.info(
+                    "Device removed from cache: %s",
+                    device_id,
+                    extra={"corrid": corr_id},
+                )
+
+        except Exception as e:
+            self.logger.error(
+                "Error handling device event: %s", e, extra={"corrid": corr_id}
+            )
+
+    async def close(self) -> None:
+        await self.db.close()
+        self.logger.info("Message Handler closed")
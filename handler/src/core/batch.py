@@ -0,0 +1,25 @@
+class MessageBatch:
+    """
+    The messages of several deliveries (or of one envelope), saved together in a
+    single transaction. Keeps the message ids added, so a device retry inside the
+    batch is skipped before it reaches the dedupe window.
+    """
+
+    def __init__(self) -> None:
+        self.messages: list[tuple[dict, int]] = []  # (body, device_id)
+        self.message_ids: set[tuple[int, str]] = set()
+
+    def seen(self, device_id: int, message_id: str) -> bool:
+        return (device_id, message_id) in self.message_ids
+
+    def add(self, body: dict, device_id: int, message_id: str | None = None) -> None:
+        self.messages.append((body, device_id))
+        if message_id:
+            self.message_ids.add((device_id, message_id))
+
+    def extend(self, other: "MessageBatch") -> None:
+        self.messages.extend(other.messages)
+        self.message_ids |= other.message_ids
+
+    def __len__(self) -> int:
+        return len(self.messages)
@@ -0,0 +1,131 @@
+import json
+import logging
+
+import asyncpg  # type: ignore
+from sqlalchemy import Select, insert, select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.config import settings
+from src.core.database.db import Device, Message, User
+from src.core.devices import DeviceCache
+
+
+class AsyncDB:
+    """
+    The database of the asyncio handler, on asyncpg. Each query checks out its own
+    pooled connection, so the lookups and inserts of different messages overlap.
+    Same cache and saving rules as DB.
+    """
+
+    def __init__(self) -> None:
+        self.engine = create_async_engine(
+            str(settings.SQL_ASYNC_DATABASE_URI),
+            pool_size=settings.ASYNC_DB_POOL_SIZE,
+        )
+        self.devices = DeviceCache()
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    @property
+    def active_devices(self) -> set:  # A 'cache' of active devices
+        return self.devices.active
+
+    async def start(self) -> None:
+        await self._get_devices()
+        self.logger.info("Database instance initialized")
+
+    def _active_devices(self) -> Select:
+        # The devices of the inactive users are not accepted, until reactivated
+        return (
+            select(Device.id)
+            .join(User, Device.owner_id == User.id)
+            .where(User.is_active)
+        )
+
+    async def _get_devices(self) -> None:
+        self.logger.info("Getting active devices")
+        async with self.engine.connect() as conn:
+            result = await conn.execute(self._active_devices())
+            self.devices.load(result.scalars())
+
+    def add_device_to_cache(self, device_id: int) -> None:
+        self.devices.add(device_id)
+
+    def remove_device_from_cache(self, device_id: int) -> None:
+        self.devices.remove(device_id)
+
+    async def verify_device_id(self, device_id: int) -> bool:
+        if self.devices.due():
+            await self._get_devices()
+        known = self.devices.check(device_id)
+        if known is not None:
+            return known
+        async with self.engine.connect() as conn:
+            result = await conn.execute(
+                self._active_devices().where(Device.id == device_id)
+            )
+            exists = result.first() is not None
+        self.devices.found(device_id, exists)
+        return exists
+
+    async def save_message(self, body: dict, device_id: int) -> None:
+        await self.save_messages([(body, device_id)])
+
+    async def save_messages(self, messages: list[tuple[dict, int]]) -> None:
+        """
+        Saves (body, device_id) pairs in a single transaction, with asyncpg binary COPY
+        when settings.COPY_FORMAT is set. If it fails, they are saved one by one so a
+        bad row only loses its own message. Raises when none could be saved.
+        """
+        if not messages:
+            return
+        try:
+            async with self.engine.begin() as conn:
+                if settings.COPY_FORMAT:
+                    raw = await conn.get_raw_connection()
+                    driver: asyncpg.Connection = raw.driver_connection
+                    await driver.copy_records_to_table(
+                        "message",
+                        records=[
+                            (json.dumps(body), device_id)
+                            for body, device_id in messages
+                        ],
+                        columns=["message", "device_id"],
+                    )
+                else:
+                    await conn.execute(
+                        insert(Message.__table__),
+                        [
+                            {"message": body, "device_id": device_id}
+                            for body, device_id in messages
+                        ],
+                    )
+        except Exception as e:
+            if len(messages) == 1:
+                raise
+            self.logger.warning(
+                "Saving %d messages failed, saving them one by one: %s",
+                len(messages),
+                e,
+            )
+            await self._save_one_by_one(messages)
+
+    async def _save_one_by_one(self, messages: list[tuple[dict, int]]) -> None:
+        saved = 0
+        error: Exception | None = None
+        for body, device_id in messages:
+            try:
+                async with self.engine.begin() as conn:
+                    await conn.execute(
+                        insert(Message.__table__),
+                        {"message": body, "device_id": device_id},
+                    )
+                saved += 1
+            except Exception as e:
+                error = e
+                self.logger.error("Message of device %s not saved: %s", device_id, e)
+        if not saved and error is not None:
+            raise error
+
+    async def close(self) -> None:
+        self.logger.info("Closing database instance")
+        await self.engine.dispose()
@@ -0,0 +1,55 @@
+import io
+import json
+import struct
+from collections.abc import Iterable
+
+# Signature, flags and header extension length of the binary COPY format
+_BINARY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+_BINARY_TRAILER = struct.pack(">h", -1)
+_FIELDS = struct.Struct(">hi")  # field count, then the length of the message
+_INT4 = struct.Struct(">ii")  # length, value
+_INT8 = struct.Struct(">iq")
+
+# The backslash first, the escapes added after it must stay as they are
+_TEXT_ESCAPES = (("\\", "\\\\"), ("\n", "\\n"), ("\r", "\\r"), ("\t", "\\t"))
+
+
+def _escape(value: str) -> str:
+    for char, escaped in _TEXT_ESCAPES:
+        value = value.replace(char, escaped)
+    return value
+
+
+def copy_text(messages: Iterable[tuple[dict, int]]) -> io.StringIO:
+    """
+    The (body, device_id) pairs as the rows of COPY ... FROM STDIN, text format:
+    tab separated, one per line, the JSON escaped so its backslashes survive.
+    """
+    buffer = io.StringIO()
+    for body, device_id in messages:
+        buffer.write(f"{_escape(json.dumps(body))}\t{int(device_id)}\n")
+    buffer.seek(0)
+    return buffer
+
+
+def copy_binary(
+    messages: Iterable[tuple[dict, int]], bigint: bool = False, jsonb: bool = False
+) -> io.BytesIO:
+    """
+    The (body, device_id) pairs as COPY ... FROM STDIN (FORMAT binary). The fields are
+    sent in their column binary representation, so it depends on the column types:
+    the device_id as int4 or int8 (`bigint`), and jsonb is prefixed with its version.
+    """
+    device_id_field = _INT8 if bigint else _INT4
+    buffer = io.BytesIO()
+    buffer.write(_BINARY_HEADER)
+    for body, device_id in messages:
+        data = json.dumps(body).encode("utf-8")
+        if jsonb:
+            data = b"\x01" + data
+        buffer.write(_FIELDS.pack(2, len(data)))
+        buffer.write(data)
+        buffer.write(device_id_field.pack(device_id_field.size - 4, int(device_id)))
+    buffer.write(_BINARY_TRAILER)
+    buffer.seek(0)
+    return buffer
@@ -1,9 +1,14 @@
 import logging
 
+from sqlalchemy import BigInteger
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import declarative_base
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Query, Session
 
+from src.config import settings
+from src.core.database.copy import copy_binary, copy_text
 from src.core.database.engine import engine
+from src.core.devices import DeviceCache
 
 
 Base = declarative_base()
@@ -29,38 +34,118 @@ class User(Base):  # type: ignore
 class DB:
     def __init__(self) -> None:
         self.session: Session = Session(engine)
-        self.active_devices: set = set()  # A 'cache' of active devices
+        self.devices = DeviceCache()
         self.logger = logging.getLogger(self.__class__.__name__)
 
         self._get_devices()
         self.logger.info("Database instance initialized")
 
+    @property
+    def active_devices(self) -> set:  # A 'cache' of active devices
+        return self.devices.active
+
+    def _active_devices(self) -> Query:
+        # The devices of the inactive users are not accepted, until reactivated
+        return (
+            self.session.query(Device.id)
+            .join(User, Device.owner_id == User.id)
+            .filter(User.is_active)
+        )
+
     def _get_devices(self) -> None:
         self.logger.info("Getting active devices")
-        query = self.session.query(Device)
-        self.active_devices = {device.id for device in query}
+        query = self._active_devices()
+        self.devices.load(device_id for (device_id,) in query)
 
     def add_device_to_cache(self, device_id: int) -> None:
-        self.active_devices.add(device_id)
+        self.devices.add(device_id)
 
     def remove_device_from_cache(self, device_id: int) -> None:
-        self.active_devices.remove(device_id)
+        self.devices.remove(device_id)
 
     def verify_device_id(self, device_id: int) -> bool:
-        if device_id in self.active_devices:
-            return True
-        else:
-            query = self.session.query(Device).filter(Device.id == device_id)
-            if query.first():
-                self.active_devices.add(device_id)
-                return True
-            return False
+        if self.devices.due():
+            self._get_devices()
+        known = self.devices.check(device_id)
+        if known is not None:
+            return known
+        query = self._active_devices().filter(Device.id == device_id)
+        exists = query.first() is not None
+        self.devices.found(device_id, exists)
+        return exists
 
     def save_message(self, body: dict, device_id: int) -> None:
         message = Message(message=body, device_id=device_id)
         self.session.add(message)
         self.session.commit()
 
+    def save_messages(self, messages: list[tuple[dict, int]]) -> None:
+        """
+        Saves (body, device_id) pairs in a single transaction, streamed with COPY when
+        settings.COPY_FORMAT is set. If it fails, they are saved one by one so a bad
+        row only loses its own message. Raises when none could be saved.
+        """
+        if not messages:
+            return
+        try:
+            if settings.COPY_FORMAT:
+                self._copy_messages(messages)
+            else:
+                self.session.add_all(
+                    [
+                        Message(message=body, device_id=device_id)
+                        for body, device_id in messages
+                    ]
+                )
+            self.session.commit()
+        except Exception as e:
+            self.session.rollback()
+            if len(messages) == 1:
+                raise
+            self.logger.warning(
+                "Saving %d messages failed, saving them one by one: %s",
+                len(messages),
+                e,
+            )
+            self._save_one_by_one(messages)
+
+    def _copy_messages(self, messages: list[tuple[dict, int]]) -> None:
+        columns = Message.__table__.c
+        cursor = self.session.connection().connection.cursor()
+        try:
+            if settings.COPY_FORMAT == "binary":
+                cursor.copy_expert(
+                    "COPY message (message, device_id) FROM STDIN WITH (FORMAT binary)",
+                    copy_binary(
+                        messages,
+                        bigint=isinstance(columns.device_id.type, BigInteger),
+                        jsonb=isinstance(columns.message.type, JSONB),
+                    ),
+                )
+            else:
+                cursor.copy_expert(
+                    "COPY message (message, device_id) FROM STDIN", copy_text(messages)
+                )
+        finally:
+            cursor.close()
+
+    def _save_one_by_one(self, messages: list[tuple[dict, int]]) -> None:
+        """Each message in its own savepoint, the ones that fail are logged and dropped."""
+        saved = 0
+        error: Exception | None = None
+        for body, device_id in messages:
+            try:
+                with self.session.begin_nested():
+                    self.session.add(Message(message=body, device_id=device_id))
+                saved += 1
+            except Exception as e:
+                error = e
+                self.logger.error("Message of device %s not saved: %s", device_id, e)
+        if not saved and error is not None:
+            self.session.rollback()
+            raise error
+        self.session.commit()
+
     def close(self) -> None:
         self.logger.info("Closing database instance")
         self.session.close()
@@ -0,0 +1,46 @@
+from collections import OrderedDict
+from time import monotonic
+
+from src.config import settings
+
+
+class DedupeWindow:
+    """
+    The message ids (the device idempotency keys, AMQP message_id) saved for each
+    device in the last `window` seconds, to skip the broker redeliveries and the
+    device retries that reached another receiver worker.
+
+    The ids are kept in the order they were saved, so the expired ones are always at
+    the front, and at most `max_keys` of them, dropping the oldest first.
+    """
+
+    def __init__(
+        self,
+        window: float = settings.DEDUPE_WINDOW,
+        max_keys: int = settings.DEDUPE_MAX_KEYS,
+    ) -> None:
+        self._window = window
+        self._max_keys = max_keys
+        self._keys: OrderedDict[tuple[int, str], float] = (
+            OrderedDict()
+        )  # key -> expires
+
+    def seen(self, device_id: int, message_id: str) -> bool:
+        if self._window <= 0:
+            return False
+        expires = self._keys.get((device_id, message_id))
+        return expires is not None and expires >= monotonic()
+
+    def add(self, device_id: int, message_id: str) -> None:
+        if self._window <= 0:
+            return
+        now = monotonic()
+        self._keys[(device_id, message_id)] = now + self._window
+        self._keys.move_to_end((device_id, message_id))
+        while self._keys and (
+            len(self._keys) > self._max_keys or next(iter(self._keys.values())) < now
+        ):
+            self._keys.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._keys)
@@ -0,0 +1,168 @@
+import hashlib
+import math
+from collections import OrderedDict
+from collections.abc import Iterable, Iterator
+from time import monotonic
+
+from src.config import settings
+
+
+class UnknownDevices:
+    """
+    The device ids not found in the database in the last `ttl` seconds, at most
+    `max_keys` of them, dropping the oldest first. Their messages are dropped with no
+    query, so a fleet with stale tokens can not hammer the database.
+    """
+
+    def __init__(
+        self,
+        ttl: float = settings.UNKNOWN_DEVICES_TTL,
+        max_keys: int = settings.UNKNOWN_DEVICES_MAX_KEYS,
+    ) -> None:
+        self._ttl = ttl
+        self._max_keys = max_keys
+        self._ids: OrderedDict[int, float] = OrderedDict()  # device_id -> expires
+
+    def __contains__(self, device_id: int) -> bool:
+        expires = self._ids.get(device_id)
+        if expires is None:
+            return False
+        if expires < monotonic():
+            del self._ids[device_id]
+            return False
+        return True
+
+    def add(self, device_id: int) -> None:
+        if self._ttl <= 0:
+            return
+        now = monotonic()
+        self._ids[device_id] = now + self._ttl
+        self._ids.move_to_end(device_id)
+        while self._ids and (
+            len(self._ids) > self._max_keys or next(iter(self._ids.values())) < now
+        ):
+            self._ids.popitem(last=False)
+
+    def discard(self, device_id: int) -> None:
+        self._ids.pop(device_id, None)
+
+    def clear(self) -> None:
+        self._ids.clear()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+class BloomFilter:
+    """
+    A Bloom filter over device ids: an id it does not contain is certainly not in the
+    set it was built from, one it contains may be (at `error_rate`). Ids can be added,
+    not removed, so it is rebuilt from time to time.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01) -> None:
+        capacity = max(capacity, 1)
+        self.size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    @classmethod
+    def from_ids(
+        cls, device_ids: Iterable[int], error_rate: float = 0.01
+    ) -> "BloomFilter":
+        device_ids = list(device_ids)
+        # Room for the devices added before the next rebuild
+        bloom = cls(max(2 * len(device_ids), 1024), error_rate)
+        for device_id in device_ids:
+            bloom.add(device_id)
+        return bloom
+
+    def _positions(self, device_id: int) -> Iterator[int]:
+        # Double hashing: the k positions out of the two halves of one digest
+        digest = hashlib.blake2b(
+            device_id.to_bytes(8, "big", signed=True), digest_size=16
+        ).digest()
+        first = int.from_bytes(digest[:8], "big")
+        second = int.from_bytes(digest[8:], "big") | 1
+        for i in range(self.hashes):
+            yield (first + i * second) % self.size
+
+    def add(self, device_id: int) -> None:
+        for position in self._positions(device_id):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, device_id: int) -> bool:
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(device_id)
+        )
+
+
+class DeviceCache:
+    """
+    What the handler knows of the devices, in front of the database lookups: the
+    active ones, the unknown ones (negative cache) and, when enabled, a Bloom filter
+    over all the device ids. Rebuilt from the database every `rebuild_interval`
+    seconds, and updated on the device add/remove events in between, which every
+    worker receives: a device created since the rebuild is added to the Bloom filter
+    before its messages come.
+    """
+
+    def __init__(
+        self,
+        bloom: bool = settings.DEVICE_BLOOM_FILTER,
+        error_rate: float = settings.DEVICE_BLOOM_ERROR_RATE,
+        rebuild_interval: float = settings.DEVICE_CACHE_REBUILD,
+    ) -> None:
+        self.active: set[int] = set()
+        self.unknown = UnknownDevices()
+        self.bloom: BloomFilter | None = None
+        self._bloom = bloom
+        self._error_rate = error_rate
+        self._rebuild_interval = rebuild_interval
+        self._loaded_at: float | None = None
+
+    def load(self, device_ids: Iterable[int]) -> None:
+        self.active = set(device_ids)
+        self.unknown.clear()
+        if self._bloom:
+            self.bloom = BloomFilter.from_ids(self.active, self._error_rate)
+        self._loaded_at = monotonic()
+
+    def due(self) -> bool:
+        """Whether to rebuild it now. Only the first caller is told so."""
+        if (
+            self._rebuild_interval <= 0
+            or self._loaded_at is None
+            or monotonic() - self._loaded_at < self._rebuild_interval
+        ):
+            return False
+        self._loaded_at = monotonic()
+        return True
+
+    def check(self, device_id: int) -> bool | None:
+        """True if the device is active, False if it is unknown, None to ask the database."""
+        if device_id in self.active:
+            return True
+        if device_id in self.unknown:
+            return False
+        if self.bloom is not None and device_id not in self.bloom:
+            return False
+        return None
+
+    def found(self, device_id: int, exists: bool) -> None:
+        if exists:
+            self.active.add(device_id)
+        else:
+            self.unknown.add(device_id)
+
+    def add(self, device_id: int) -> None:
+        self.active.add(device_id)
+        self.unknown.discard(device_id)
+        if self.bloom is not None:
+            self.bloom.add(device_id)
+
+    def remove(self, device_id: int) -> None:
+        # Also told by the device events, after the RPC request
+        self.active.discard(device_id)
+        self.unknown.add(device_id)
@@ -0,0 +1,39 @@
+import io
+import zlib
+
+try:
+    import zstandard  # type: ignore
+except ImportError:  # zstd is optional, the receivers do not accept it without it
+    zstandard = None
+
+
+class UnsupportedEncodingError(Exception):
+    pass
+
+
+class DecompressedTooLargeError(Exception):
+    pass
+
+
+def decompress(body: bytes, encoding: str, limit: int) -> bytes:
+    """
+    Decompresses a gzip or zstd body, never producing more than `limit` bytes, so a
+    small compressed body can not expand into an unbounded one (zip bomb).
+    """
+    if encoding == "gzip":
+        decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+        data = decompressor.decompress(body, limit)
+        if decompressor.unconsumed_tail or decompressor.decompress(b"", 1):
+            raise DecompressedTooLargeError()
+        if not decompressor.eof:
+            raise zlib.error("Truncated gzip body")
+        return data
+
+    if encoding == "zstd" and zstandard is not None:
+        with zstandard.ZstdDecompressor().stream_reader(io.BytesIO(body)) as reader:
+            data = reader.read(limit + 1)
+        if len(data) > limit:
+            raise DecompressedTooLargeError()
+        return data
+
+    raise UnsupportedEncodingError(encoding)
@@ -0,0 +1,25 @@
+import json
+import struct
+from collections.abc import Iterator
+from typing import Any
+
+# Content type of the messages coalesced by the receiver into one envelope
+ENVELOPE_CONTENT_TYPE = "application/vnd.iot-server.envelope"
+
+_LENGTH = struct.Struct(">I")
+
+
+def decode_envelope(envelope: bytes) -> Iterator[tuple[bytes, dict[str, Any]]]:
+    """
+    Yields (body, properties) for each message of the envelope. The envelope is a
+    sequence of length-prefixed records, each a JSON properties line followed by the body.
+    """
+    offset = 0
+    while offset + _LENGTH.size <= len(envelope):
+        (length,) = _LENGTH.unpack_from(envelope, offset)
+        start = offset + _LENGTH.size
+        if start + length > len(envelope):
+            raise ValueError("Truncated envelope")
+        header, _, body = envelope[start : start + length].partition(b"\n")
+        yield body, json.loads(header)
+        offset = start + length
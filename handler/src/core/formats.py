@@ -0,0 +1,58 @@
+import base64
+import datetime
+import json
+from decimal import Decimal
+from typing import Any
+
+try:
+    import msgpack  # type: ignore
+except ImportError:
+    msgpack = None
+try:
+    import cbor2  # type: ignore
+except ImportError:
+    cbor2 = None
+
+JSON_CONTENT_TYPE = "application/json"
+MSGPACK_CONTENT_TYPE = "application/msgpack"
+CBOR_CONTENT_TYPE = "application/cbor"
+
+
+def decode(body: bytes, content_type: str | None = None) -> Any:
+    """
+    Decodes a device payload by its content type into JSON compatible values, so the
+    messages are stored the same whatever the format the device sent them in.
+    """
+    if content_type == MSGPACK_CONTENT_TYPE:
+        if msgpack is None:
+            raise ValueError("msgpack is not installed")
+        return _to_json(msgpack.unpackb(body, raw=False, strict_map_key=False))
+    if content_type == CBOR_CONTENT_TYPE:
+        if cbor2 is None:
+            raise ValueError("cbor2 is not installed")
+        return _to_json(cbor2.loads(body))
+    return json.loads(body.decode("utf-8"))
+
+
+def _to_json(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {_key(k): _to_json(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_json(v) for v in value]
+    if isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(value).decode("ascii")
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)  # Tags, uuids, ... with no JSON peer
+
+
+def _key(key: Any) -> str:
+    if isinstance(key, str):
+        return key
+    if isinstance(key, (bytes, bytearray)):
+        return base64.b64encode(key).decode("ascii")
+    return str(key)
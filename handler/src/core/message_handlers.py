@@ -1,23 +1,63 @@
 from logging import getLogger
+from typing import Any
 import json
 
+from src.config import settings
 from src.core.abs import Handler
+from src.core.batch import MessageBatch
 from src.core.database.db import DB
+from src.core.dedupe import DedupeWindow
+from src.core.encoding import decompress
+from src.core.envelope import decode_envelope
+from src.core.formats import decode
+
+
+def parse_message(
+    msg: str | bytes,
+    headers: dict[str, Any] | None = None,
+    content_encoding: str | None = None,
+    content_type: str | None = None,
+) -> tuple[int, dict]:
+    """Decompresses and decodes the message, returns its (device_id, body)."""
+    if isinstance(msg, str):
+        msg = msg.encode("utf-8")
+    if content_encoding:
+        msg = decompress(msg, content_encoding, settings.MAX_DECOMPRESSED_BYTES)
+    body = dict(decode(msg, content_type))
+    # Raw passthrough messages carry the device_id in the headers,
+    # the body is the device payload untouched
+    if headers and "device_id" in headers:
+        device_id = int(headers["device_id"])
+    else:
+        device_id = int(body.pop("device_id"))
+    return device_id, body
 
 
 class Message_Handler(Handler):
     def __init__(self) -> None:
         self.db: DB = DB()
+        self.dedupe = DedupeWindow()
         self.logger = getLogger(self.__class__.__name__)
 
         self.logger.info("Message Handler initialized")
 
-    def handle_message(self, msg: str | bytes, corr_id: str) -> None:
+    def handle_message(
+        self,
+        msg: str | bytes,
+        corr_id: str,
+        headers: dict[str, Any] | None = None,
+        content_encoding: str | None = None,
+        content_type: str | None = None,
+        message_id: str | None = None,
+        batch: MessageBatch | None = None,
+    ) -> None:
+        """
+        Saves the message, or adds it to the `batch` the caller saves with save_batch.
+        """
         try:
-            body = dict(
-                json.loads(msg.decode("utf-8") if isinstance(msg, bytes) else msg)
+            device_id, body = parse_message(
+                msg, headers, content_encoding, content_type
             )
-            device_id = int(body["device_id"])
 
             self.logger.info(
                 "Handling message from device: %s",
@@ -25,23 +65,107 @@ class Message_Handler(Handler):
                 extra={"corrid": corr_id},
             )
 
-            if self.db.verify_device_id(device_id):
-                body.pop("device_id")
+            if message_id and (
+                (batch is not None and batch.seen(device_id, message_id))
+                or self.dedupe.seen(device_id, message_id)
+            ):
+                self.logger.info(
+                    "Duplicate message %s skipped",
+                    message_id,
+                    extra={"corrid": corr_id},
+                )
+            elif not self.db.verify_device_id(device_id):
+                self.logger.warning("Device ID not found", extra={"corrid": corr_id})
+            elif batch is not None:
+                batch.add(body, device_id, message_id)
+            else:
                 self.db.save_message(body, device_id)
+                if message_id:
+                    self.dedupe.add(device_id, message_id)
                 self.logger.info("Message saved", extra={"corrid": corr_id})
-            else:
-                self.logger.warning("Device ID not found", extra={"corrid": corr_id})
 
         except Exception as e:
             self.logger.error(
                 "Error handling message: %s", e, extra={"corrid": corr_id}
             )
 
+    def handle_envelope(
+        self, msg: bytes, corr_id: str, batch: MessageBatch | None = None
+    ) -> None:
+        """
+        Handles an envelope of messages coalesced by the receiver. The invalid messages
+        are skipped, the others are saved together, or added to the `batch`.
+        """
+        envelope = MessageBatch()
+        try:
+            for body, properties in decode_envelope(msg):
+                item_corr_id = properties.get("correlation_id") or corr_id
+                message_id = properties.get("message_id")
+                try:
+                    device_id, payload = parse_message(
+                        body,
+                        properties.get("headers"),
+                        properties.get("content_encoding"),
+                        properties.get("content_type"),
+                    )
+                    if message_id and (
+                        envelope.seen(device_id, message_id)
+                        or (batch is not None and batch.seen(device_id, message_id))
+                        or self.dedupe.seen(device_id, message_id)
+                    ):
+                        self.logger.info(
+                            "Duplicate message %s skipped",
+                            message_id,
+                            extra={"corrid": item_corr_id},
+                        )
+                    elif self.db.verify_device_id(device_id):
+                        envelope.add(payload, device_id, message_id)
+                    else:
+                        self.logger.warning(
+                            "Device ID not found", extra={"corrid": item_corr_id}
+                        )
+                except Exception as e:
+                    self.logger.error(
+                        "Error handling message: %s", e, extra={"corrid": item_corr_id}
+                    )
+
+            if batch is not None:
+                batch.extend(envelope)
+                return
+            self.save_batch(envelope)
+            self.logger.info(
+                "Envelope of %d messages saved",
+                len(envelope),
+                extra={"corrid": corr_id},
+            )
+
+        except Exception as e:
+            self.logger.error(
+                "Error handling envelope: %s", e, extra={"corrid": corr_id}
+            )
+
+    def save_batch(self, batch: MessageBatch) -> None:
+        """
+        Saves the messages of the batch in one transaction, raises if it fails. Only
+        then their message ids count as seen.
+        """
+        self.db.save_messages(batch.messages)
+        for device_id, message_id in batch.message_ids:
+            self.dedupe.add(device_id, message_id)
+
     def handle_rpc_request(self, corr_id: str, request: bytes) -> str:
+        """
+        The device add/remove requests of the user API, answered once this worker
+        updated its cache. The other workers get the same change as a device event.
+        """
         self.logger.info("Handling RPC request", extra={"corrid": corr_id})
-        self.logger.debug("Request body: %s", request, extra={"corrid": corr_id})
+        self.handle_device_event(corr_id, request)
+        return "ok"
+
+    def handle_device_event(self, corr_id: str, event: bytes) -> None:
+        self.logger.debug("Device event: %s", event, extra={"corrid": corr_id})
         try:
-            body = dict(json.loads(request.decode("utf-8")))
+            body = dict(json.loads(event.decode("utf-8")))
             if body["method"] == "add":
                 device_id = int(body["device_id"])
                 self.db.add_device_to_cache(device_id)
@@ -60,10 +184,8 @@ class Message_Handler(Handler):
 
         except Exception as e:
             self.logger.error(
-                "Error handling RPC request: %s", e, extra={"corrid": corr_id}
+                "Error handling device event: %s", e, extra={"corrid": corr_id}
             )
-        finally:
-            return "ok"
 
     def close(self) -> None:
         self.db.close()
@@ -1,16 +1,22 @@
 import logging.config
 import logging.handlers
 
-from src.consumer import Consumer
+from src.config import settings
 from src.logger.setup import setup_logging_config
 
 
-setup_logging_config()
-
-
 if __name__ == "__main__":
-    logger = logging.getLogger(__name__)
-    logger.info("Starting the Handler service")
+    if settings.HANDLER_WORKERS > 1:
+        from src.supervisor import Supervisor
+
+        # The workers set up their own logging
+        logging.basicConfig(level=settings.LOG_LEVEL)
+        logging.getLogger(__name__).info("Starting the Handler service supervisor")
+        Supervisor().run()
+    else:
+        setup_logging_config()
+        logging.getLogger(__name__).info("Starting the Handler service")
+        from src.consumer import new_consumer
 
-    consumer = Consumer()
-    consumer.run()
+        consumer = new_consumer()
+        consumer.run()
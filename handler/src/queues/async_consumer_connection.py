@@ -0,0 +1,131 @@
+import asyncio
+import functools
+
+from pika import BasicProperties  # type: ignore
+from pika.adapters.asyncio_connection import AsyncioConnection  # type: ignore
+from pika.channel import Channel  # type: ignore
+from pika.frame import Method  # type: ignore
+from pika.spec import Basic  # type: ignore
+
+from src.config import settings
+from src.core.abs import AsyncHandler
+from src.core.envelope import ENVELOPE_CONTENT_TYPE
+from src.queues.consumer_connection import BaseConnectionManager
+
+
+class AsyncConnectionManager(BaseConnectionManager[AsyncHandler]):
+    """
+    The consumer on pika's asyncio connection. Each delivery is handled in its own
+    task, acked when it is done, so the DB round trips of the messages overlap and
+    never stall the I/O loop (heartbeats, the RPC queue). ASYNC_PREFETCH_COUNT bounds
+    the messages handled at once; their saving order is not kept, but when sharding,
+    where each device's messages must be saved in order, the deliveries of a shard
+    queue are handled one after the other, the shards still overlapping.
+    """
+
+    def __init__(
+        self,
+        handler: AsyncHandler | None = None,
+        loop: asyncio.AbstractEventLoop | None = None,
+    ) -> None:
+        super().__init__(handler)
+        self._prefetch_count = settings.ASYNC_PREFETCH_COUNT
+        self._loop = loop or asyncio.new_event_loop()
+        self._tasks: set[asyncio.Task[None]] = set()
+        self._lanes: dict[str, asyncio.Task[None]] = {}  # consumer_tag -> last task
+
+    def connect(self) -> None:
+        self.logger.info("Connecting to RabbitMQ server")
+
+        self._connection = AsyncioConnection(
+            self.parameters(),
+            on_open_callback=self.on_connection_open,
+            on_open_error_callback=self.on_connection_open_error,
+            on_close_callback=self.on_connection_closed,
+            custom_ioloop=self._loop,
+        )
+
+    # ----------------------------------------
+    def on_message(
+        self,
+        channel: Channel,
+        method: Basic.Deliver,
+        properties: BasicProperties,
+        body: bytes,
+    ) -> None:
+        self.logger.debug("Received message")
+        previous = None
+        if settings.MESSAGES_SHARDS:
+            previous = self._lanes.get(method.consumer_tag)
+        task = self._loop.create_task(
+            self.handle(channel, method, properties, body, previous)
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        if settings.MESSAGES_SHARDS:
+            self._lanes[method.consumer_tag] = task
+            task.add_done_callback(
+                functools.partial(self._end_lane, method.consumer_tag)
+            )
+
+    def _end_lane(self, consumer_tag: str, task: asyncio.Task[None]) -> None:
+        if self._lanes.get(consumer_tag) is task:
+            del self._lanes[consumer_tag]
+
+    async def handle(
+        self,
+        channel: Channel,
+        method: Basic.Deliver,
+        properties: BasicProperties,
+        body: bytes,
+        previous: asyncio.Task[None] | None = None,
+    ) -> None:
+        if previous is not None:
+            await asyncio.wait([previous])  # The delivery before it on its shard
+        try:
+            if properties.content_type == ENVELOPE_CONTENT_TYPE:
+                await self._handler.handle_envelope(body, properties.correlation_id)
+            else:
+                await self._handler.handle_message(
+                    body,
+                    properties.correlation_id,
+                    properties.headers,
+                    properties.content_encoding,
+                    properties.content_type,
+                    properties.message_id,
+                )
+            # The channel may have closed meanwhile, the broker redelivers the message
+            if channel.is_open:
+                channel.basic_ack(delivery_tag=method.delivery_tag)
+        except AttributeError as e:
+            self.logger.error("Handler not set: %s", e)
+        except Exception as e:
+            self.logger.error("Error handling message: %s", e)
+
+    # ----------------------------------------
+    def on_cancelok(self, frame: Method) -> None:
+        self.logger.info("RabbitMQ acknowledged the cancellation")
+        self._consuming = False
+        self._loop.create_task(self._drain(frame))
+
+    async def _drain(self, frame: Method) -> None:
+        """The messages being handled are saved and acked before the channels close."""
+        if self._tasks:
+            self.logger.info("Waiting for %d messages being handled", len(self._tasks))
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        super().on_cancelok(frame)
+
+    def stop(self) -> None:
+        if not self._closing:
+            self._closing = True
+            self.logger.info("Stopping")
+            if self._consuming:
+                self.stop_consuming()
+                self._loop.run_forever()  # Until the connection is closed
+            else:
+                self._loop.stop()
+            self.logger.info("Stopped")
+
+    def run(self) -> None:
+        self.connect()
+        self._loop.run_forever()
@@ -1,5 +1,6 @@
 import logging
 import functools
+from typing import Generic, TypeVar
 
 from pika import (  # type: ignore
     BasicProperties,
@@ -15,23 +16,34 @@ from pika.spec import Basic  # type: ignore
 from pika.frame import Method  # type: ignore
 
 from src.config import settings
-from src.core.abs import SingletonConnection, Handler
+from src.core.abs import SingletonConnection, BaseHandler, Handler
+from src.core.batch import MessageBatch
+from src.core.envelope import ENVELOPE_CONTENT_TYPE
 
 
-class ConnectionManager(metaclass=SingletonConnection):
+HandlerT = TypeVar("HandlerT", bound=BaseHandler)
+
+
+class BaseConnectionManager(Generic[HandlerT], metaclass=SingletonConnection):
+    """
+    The connection, the channels and the queues of a consumer, its RPC requests and
+    device events. How the messages are handled is up to its subclasses.
+    """
+
     EXCHANGE = settings.HANDLER_EXCHANGE
     EXCHANGE_TYPE = ExchangeType.topic
     QUEUE = settings.MESSAGES_QUEUE
     ROUTING_KEY = settings.MESSAGES_ROUTING_KEY
     RPC_QUEUE = settings.RPC_QUEUE
 
-    def __init__(self, handler: Handler | None = None) -> None:
+    def __init__(self, handler: HandlerT | None = None) -> None:
         self._connection: BaseConnection = None
         self._channel: Channel = None
         self._consumer_tag: str = ""
+        self._alarms_channel: Channel | None = None
 
         # ---
-        self._handler: Handler | None = handler
+        self._handler: HandlerT | None = handler
         # ---
 
         self._consuming: bool = False
@@ -40,8 +52,6 @@ class ConnectionManager(metaclass=SingletonConnection):
         self.should_reconnect: bool = False
         self.was_consuming: bool = False
 
-        # TODO: In production, try higher prefetch values
-        # for higher consumer throughput
         self._prefetch_count: int = 1
 
         self.logger = logging.getLogger(self.__class__.__name__)
@@ -55,10 +65,8 @@ class ConnectionManager(metaclass=SingletonConnection):
             self._connection.close()
 
     # ----------------------------------------
-    def connect(self) -> None:
-        self.logger.info("Connecting to RabbitMQ server")
-
-        parameters = ConnectionParameters(
+    def parameters(self) -> ConnectionParameters:
+        return ConnectionParameters(
             host=settings.RABBITMQ_DNS,
             port=settings.RABBITMQ_PORT,
             credentials=PlainCredentials(
@@ -67,8 +75,11 @@ class ConnectionManager(metaclass=SingletonConnection):
             heartbeat=0,
         )
 
+    def connect(self) -> None:
+        self.logger.info("Connecting to RabbitMQ server")
+
         self._connection = SelectConnection(
-            parameters,
+            self.parameters(),
             on_open_callback=self.on_connection_open,
             on_open_error_callback=self.on_connection_open_error,
             on_close_callback=self.on_connection_closed,
@@ -114,7 +125,6 @@ class ConnectionManager(metaclass=SingletonConnection):
 
     def on_channel_closed(self, channel: Channel, reason: Exception) -> None:
         self.logger.warning("Channel %i was closed: %s", channel, reason)
-
         self.close_connection()
 
     # ----------------------------------------
@@ -135,21 +145,41 @@ class ConnectionManager(metaclass=SingletonConnection):
         self.setup_queues()
 
     # ----------------------------------------
-    def setup_queues(self) -> None:
-        self.logger.info("Declaring queue '%s'", self.QUEUE)
-        message_cb = functools.partial(
-            self.on_queue_declareok,
-            sets={
+    def message_queues(self) -> list[dict]:
+        """
+        The message queues to consume. When sharding, one per shard of this replica
+        (or worker), each with a single active consumer so the devices messages are
+        handled in order.
+        """
+        if not settings.MESSAGES_SHARDS:
+            return [
+                {
+                    "exchange": self.EXCHANGE,
+                    "queue": self.QUEUE,
+                    "routing_key": self.ROUTING_KEY,
+                    "arguments": None,
+                }
+            ]
+        return [
+            {
                 "exchange": self.EXCHANGE,
-                "queue": self.QUEUE,
-                "routing_key": self.ROUTING_KEY,
-            },
-        )
-        self._channel.queue_declare(
-            queue=self.QUEUE,
-            durable=True,
-            callback=message_cb,
-        )
+                "queue": f"{self.QUEUE}.{shard}",
+                "routing_key": f"{self.EXCHANGE}.{shard}.*",
+                "arguments": {"x-single-active-consumer": True},
+            }
+            for shard in settings.REPLICA_SHARDS
+        ]
+
+    def setup_queues(self) -> None:
+        for sets in self.message_queues():
+            self.logger.info("Declaring queue '%s'", sets["queue"])
+            message_cb = functools.partial(self.on_queue_declareok, sets=sets)
+            self._channel.queue_declare(
+                queue=sets["queue"],
+                durable=True,
+                arguments=sets["arguments"],
+                callback=message_cb,
+            )
 
         # Note to self. RPC queue for the handler load the new device id on its cache
         #   I prefer to declare a queue instead of using just the routing key, so the on_message function
@@ -164,11 +194,16 @@ class ConnectionManager(metaclass=SingletonConnection):
             callback=rpc_cb,
         )
 
+        self.setup_device_events()
+
+        if settings.PRIORITY_LANE:
+            self.open_alarms_channel()
+
     def on_queue_declareok(self, frame: Method, sets: dict) -> None:
         self.logger.info(
             "Queue '%s' declared, binding to exchange. Routing key: '%s'",
             frame.method.queue,
-            self.ROUTING_KEY,
+            sets["routing_key"],
         )
 
         cb = functools.partial(self.on_bindok, sets=sets)
@@ -190,6 +225,100 @@ class ConnectionManager(metaclass=SingletonConnection):
 
         self.start_consuming(queue=sets["queue"])
 
+    # ----------------------------------------
+    def setup_device_events(self) -> None:
+        """
+        Every worker binds its own exclusive queue to the device events fanout
+        exchange, so each one updates its device cache on every add/remove.
+        """
+        self.logger.info("Declaring exchange '%s'", settings.DEVICE_EVENTS_EXCHANGE)
+        self._channel.exchange_declare(
+            exchange=settings.DEVICE_EVENTS_EXCHANGE,
+            exchange_type=ExchangeType.fanout,
+            durable=True,
+            callback=self.on_device_events_exchange_declareok,
+        )
+
+    def on_device_events_exchange_declareok(self, _unused_frame: Method) -> None:
+        self._channel.queue_declare(
+            queue="",
+            exclusive=True,
+            auto_delete=True,
+            callback=self.on_device_events_queue_declareok,
+        )
+
+    def on_device_events_queue_declareok(self, frame: Method) -> None:
+        queue = frame.method.queue
+        cb = functools.partial(self.on_device_events_bindok, queue=queue)
+        self._channel.queue_bind(
+            exchange=settings.DEVICE_EVENTS_EXCHANGE, queue=queue, callback=cb
+        )
+
+    def on_device_events_bindok(self, _unused_frame: Method, queue: str) -> None:
+        self.logger.info("Consuming device events from '%s'", queue)
+        self._channel.basic_consume(
+            queue=queue, on_message_callback=self.on_device_event, auto_ack=True
+        )
+
+    def on_device_event(
+        self,
+        _unused_channel: Channel,
+        _unused_method: Basic.Deliver,
+        properties: BasicProperties,
+        body: bytes,
+    ) -> None:
+        try:
+            self._handler.handle_device_event(properties.correlation_id, body)
+        except Exception as e:
+            self.logger.error("Error handling device event: %s", e)
+
+    # ----------------------------------------
+    def open_alarms_channel(self) -> None:
+        """
+        The alarms lane has its own channel: its prefetch does not share the telemetry
+        one, and its deliveries are dispatched between the telemetry ones.
+        """
+        self.logger.info("Creating the alarms channel")
+        self._connection.channel(on_open_callback=self.on_alarms_channel_open)
+
+    def on_alarms_channel_open(self, channel: Channel) -> None:
+        self.logger.info("Alarms channel opened")
+
+        self._alarms_channel = channel
+        self._alarms_channel.add_on_close_callback(self.on_channel_closed)
+        self._alarms_channel.queue_declare(
+            queue=settings.ALARMS_QUEUE,
+            durable=True,
+            callback=self.on_alarms_queue_declareok,
+        )
+
+    def on_alarms_queue_declareok(self, _unused_frame: Method) -> None:
+        self.logger.info(
+            "Queue '%s' declared, binding to exchange. Routing key: '%s'",
+            settings.ALARMS_QUEUE,
+            settings.ALARMS_ROUTING_KEY,
+        )
+        self._alarms_channel.queue_bind(
+            exchange=self.EXCHANGE,
+            queue=settings.ALARMS_QUEUE,
+            routing_key=settings.ALARMS_ROUTING_KEY,
+            callback=self.on_alarms_bindok,
+        )
+
+    def on_alarms_bindok(self, _unused_frame: Method) -> None:
+        self._alarms_channel.basic_qos(
+            prefetch_count=settings.ALARMS_PREFETCH_COUNT,
+            callback=self.on_alarms_qos_ok,
+        )
+
+    def on_alarms_qos_ok(self, _unused_frame: Method) -> None:
+        self.logger.info("Starting consumer. Queue: '%s'", settings.ALARMS_QUEUE)
+        self._alarms_channel.add_on_cancel_callback(self.on_consumer_cancelled)
+        self._alarms_channel.basic_consume(
+            queue=settings.ALARMS_QUEUE,
+            on_message_callback=self.on_message,
+        )
+
     # ----------------------------------------
     def start_consuming(
         self, _unused_frame: Method | None = None, queue: str | None = None
@@ -197,10 +326,10 @@ class ConnectionManager(metaclass=SingletonConnection):
         self.logger.info("Adding consumer cancellation callback")
         self._channel.add_on_cancel_callback(self.on_consumer_cancelled)
 
-        if queue == self.QUEUE:
-            cb = self.on_message
-        elif queue == self.RPC_QUEUE:
+        if queue == self.RPC_QUEUE:
             cb = self.on_rpc_request
+        else:
+            cb = self.on_message
 
         self.logger.info("Starting consumer. Queue: '%s'", queue)
         self._consumer_tag = self._channel.basic_consume(
@@ -217,19 +346,12 @@ class ConnectionManager(metaclass=SingletonConnection):
 
     def on_message(
         self,
-        _unused_channel: Channel,
+        channel: Channel,
         method: Basic.Deliver,
         properties: BasicProperties,
         body: bytes,
     ) -> None:
-        self.logger.debug("Received message")
-        try:
-            self._handler.handle_message(body, properties.correlation_id)
-            self._channel.basic_ack(delivery_tag=method.delivery_tag)
-        except AttributeError as e:
-            self.logger.error("Handler not set: %s", e)
-        except Exception as e:
-            self.logger.error("Error handling message: %s", e)
+        raise NotImplementedError
 
     def on_rpc_request(
         self,
@@ -282,6 +404,8 @@ class ConnectionManager(metaclass=SingletonConnection):
     def on_cancelok(self, _unused_frame: Method) -> None:
         self.logger.info("RabbitMQ acknowledged the cancellation")
         self._consuming = False
+        if self._alarms_channel is not None and self._alarms_channel.is_open:
+            self._alarms_channel.close()
         self._channel.close()
 
     # ----------------------------------------
@@ -290,5 +414,118 @@ class ConnectionManager(metaclass=SingletonConnection):
         self._connection.ioloop.start()
 
 
+class ConnectionManager(BaseConnectionManager[Handler]):
+    """
+    The consumer on pika's SelectConnection: the deliveries are handled one after the
+    other in the I/O loop, saved one by one or in batches of BATCH_SIZE.
+    """
+
+    def __init__(self, handler: Handler | None = None) -> None:
+        super().__init__(handler)
+        # Enough deliveries in flight to fill a batch
+        self._prefetch_count = max(1, settings.BATCH_SIZE)
+        self._batch: MessageBatch | None = None
+        self._batch_deliveries: int = 0
+        self._batch_tag: int = 0  # The last delivery of the batch
+        self._batch_timer: object | None = None
+
+    def on_channel_closed(self, channel: Channel, reason: Exception) -> None:
+        # Its deliveries can no longer be acked, the broker redelivers them
+        self.discard_batch()
+        super().on_channel_closed(channel, reason)
+
+    def on_cancelok(self, _unused_frame: Method) -> None:
+        self.flush_batch()
+        super().on_cancelok(_unused_frame)
+
+    def on_message(
+        self,
+        channel: Channel,
+        method: Basic.Deliver,
+        properties: BasicProperties,
+        body: bytes,
+    ) -> None:
+        self.logger.debug("Received message")
+        try:
+            # The alarms lane is never batched, they are saved as they come
+            if settings.BATCH_SIZE > 1 and channel is self._channel:
+                self.batch_message(method, properties, body)
+                return
+            self._dispatch(properties, body)
+            # Acked on the channel it came from, the alarms lane has its own
+            channel.basic_ack(delivery_tag=method.delivery_tag)
+        except AttributeError as e:
+            self.logger.error("Handler not set: %s", e)
+        except Exception as e:
+            self.logger.error("Error handling message: %s", e)
+
+    def _dispatch(
+        self,
+        properties: BasicProperties,
+        body: bytes,
+        batch: MessageBatch | None = None,
+    ) -> None:
+        if properties.content_type == ENVELOPE_CONTENT_TYPE:
+            self._handler.handle_envelope(body, properties.correlation_id, batch=batch)
+        else:
+            self._handler.handle_message(
+                body,
+                properties.correlation_id,
+                properties.headers,
+                properties.content_encoding,
+                properties.content_type,
+                properties.message_id,
+                batch=batch,
+            )
+
+    # ----------------------------------------
+    def batch_message(
+        self, method: Basic.Deliver, properties: BasicProperties, body: bytes
+    ) -> None:
+        """
+        Adds the delivery to the current batch. The batch is saved when it holds
+        BATCH_SIZE deliveries (or messages), or BATCH_MAX_DELAY seconds after its first one.
+        """
+        if self._batch is None:
+            self._batch = MessageBatch()
+            self._batch_timer = self._connection.ioloop.call_later(
+                settings.BATCH_MAX_DELAY, self.flush_batch
+            )
+        self._dispatch(properties, body, self._batch)
+        self._batch_tag = method.delivery_tag
+        self._batch_deliveries += 1
+        if (
+            self._batch_deliveries >= settings.BATCH_SIZE
+            or len(self._batch) >= settings.BATCH_SIZE
+        ):
+            self.flush_batch()
+
+    def flush_batch(self) -> None:
+        """
+        Saves the batch in one transaction, then acks all its deliveries with one
+        multiple ack. As for a single message, a failed save is logged, not retried.
+        """
+        batch, deliveries = self._batch, self._batch_deliveries
+        self.discard_batch()
+        if batch is None:
+            return
+        try:
+            self._handler.save_batch(batch)
+            self.logger.info(
+                "Batch of %d messages saved (%d deliveries)", len(batch), deliveries
+            )
+        except Exception as e:
+            self.logger.error("Error saving batch of %d messages: %s", len(batch), e)
+        if self._channel is not None and self._channel.is_open:
+            self._channel.basic_ack(delivery_tag=self._batch_tag, multiple=True)
+
+    def discard_batch(self) -> None:
+        if self._batch_timer is not None:
+            self._connection.ioloop.remove_timeout(self._batch_timer)
+            self._batch_timer = None
+        self._batch = None
+        self._batch_deliveries = 0
+
+
 def get_connection_manager() -> ConnectionManager:
     return ConnectionManager()
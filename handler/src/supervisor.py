@@ -0,0 +1,140 @@
+import logging
+import multiprocessing
+import signal
+from multiprocessing.process import BaseProcess
+from threading import Event
+from time import monotonic
+from types import FrameType
+from typing import Callable
+
+from src.config import settings
+from src.logger.setup import setup_logging_config
+
+
+logger = logging.getLogger(__name__)
+
+
+def worker_shards(index: int, workers: int) -> list[int]:
+    """
+    The shards a worker consumes: its share of the replica's shards, so the workers
+    do not wait on each other's single active consumer. With fewer shards than
+    workers, every worker consumes them all and stands by for the active one.
+    """
+    shards = settings.REPLICA_SHARDS
+    if len(shards) < workers:
+        return shards
+    return shards[index::workers]
+
+
+def run_worker(index: int, workers: int) -> None:
+    """A worker process: a Consumer with its own connection, DB engine and device cache."""
+    if settings.MESSAGES_SHARDS:
+        settings.HANDLER_SHARDS = worker_shards(index, workers)
+    setup_logging_config()
+    # SIGTERM drains the worker as Ctrl-C does: the consumer is cancelled, the pending
+    # batch saved and acked, then the connection closed.
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    # Imported here, the database is reflected in each worker, not in the supervisor
+    from src.consumer import new_consumer
+
+    logger.info("Starting handler worker %d", index)
+    new_consumer().run()
+
+
+class Supervisor:
+    """
+    Runs `workers` handler processes. A worker that exits is restarted, after a
+    delay growing with its consecutive crashes. SIGTERM (or SIGINT) drains the
+    workers, the ones still running after WORKERS_DRAIN_TIMEOUT are killed.
+    """
+
+    def __init__(
+        self,
+        workers: int = settings.HANDLER_WORKERS,
+        target: Callable[[int, int], None] = run_worker,
+    ) -> None:
+        self._workers = workers
+        self._target = target
+        # Spawned, not forked: no connection nor pool is shared with the supervisor
+        self._context = multiprocessing.get_context("spawn")
+        self._processes: dict[int, BaseProcess | None] = {}  # None: to be restarted
+        self._started: dict[int, float] = {}
+        self._restart_at: dict[int, float] = {}
+        self._crashes: dict[int, int] = {}
+        self._stopping = Event()
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self._on_signal)
+        signal.signal(signal.SIGINT, self._on_signal)
+
+        logger.info("Starting %d handler workers", self._workers)
+        for index in range(self._workers):
+            self._start(index)
+        while not self._stopping.wait(settings.WORKERS_CHECK_INTERVAL):
+            self.check()
+        self.drain()
+
+    def _on_signal(self, signum: int, _frame: FrameType | None) -> None:
+        logger.info("Signal %d received, draining the workers", signum)
+        self._stopping.set()
+
+    def _start(self, index: int) -> None:
+        process = self._context.Process(
+            target=self._target,
+            args=(index, self._workers),
+            name=f"handler-worker-{index}",
+        )
+        process.start()
+        self._processes[index] = process
+        self._started[index] = monotonic()
+        logger.info("Worker %d started, pid %s", index, process.pid)
+
+    def check(self) -> None:
+        """Restarts the workers that exited, the ones crashing in a loop less often."""
+        now = monotonic()
+        for index, process in self._processes.items():
+            if process is not None:
+                if process.is_alive():
+                    continue
+                uptime = now - self._started[index]
+                logger.warning(
+                    "Worker %d (pid %s) exited with code %s after %.0fs",
+                    index,
+                    process.pid,
+                    process.exitcode,
+                    uptime,
+                )
+                process.close()
+                self._processes[index] = None
+                # Restarted at once, unless it keeps crashing: then 1, 3, 7... seconds later
+                if uptime > settings.WORKERS_MAX_RESTART_DELAY:
+                    self._crashes[index] = 1
+                else:
+                    self._crashes[index] = self._crashes.get(index, 0) + 1
+                self._restart_at[index] = now + min(
+                    2 ** (self._crashes[index] - 1) - 1,
+                    settings.WORKERS_MAX_RESTART_DELAY,
+                )
+            if now >= self._restart_at[index]:
+                self._start(index)
+
+    def drain(self) -> None:
+        """Asks the running workers to drain, then waits for them up to the timeout."""
+        running = [
+            process
+            for process in self._processes.values()
+            if process is not None and process.is_alive()
+        ]
+        for process in running:
+            process.terminate()  # SIGTERM
+        deadline = monotonic() + settings.WORKERS_DRAIN_TIMEOUT
+        for process in running:
+            process.join(max(0.0, deadline - monotonic()))
+            if process.is_alive():
+                logger.warning(
+                    "Worker pid %s did not drain in time, killing it", process.pid
+                )
+                process.kill()
+                process.join()
+        logger.info("Workers stopped")
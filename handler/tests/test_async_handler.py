@@ -0,0 +1,151 @@
+import asyncio
+import json
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from src.config import settings
+from src.core.abs import SingletonConnection
+from src.core.async_message_handlers import AsyncMessageHandler
+from src.core.database.async_db import AsyncDB
+from src.core.envelope import ENVELOPE_CONTENT_TYPE
+from src.queues.async_consumer_connection import AsyncConnectionManager
+
+
+def make_handler() -> AsyncMessageHandler:
+    db_mock = AsyncMock(spec=AsyncDB)
+    db_mock.verify_device_id.return_value = True
+    return AsyncMessageHandler(db=db_mock)
+
+
+def test_handle_message():
+    handler = make_handler()
+    body = json.dumps({"device_id": 123, "data": 1}).encode("utf-8")
+
+    asyncio.run(handler.handle_message(body, corr_id="abc"))
+
+    handler.db.verify_device_id.assert_awaited_once_with(123)
+    handler.db.save_message.assert_awaited_once_with({"data": 1}, 123)
+
+
+def test_handle_messages_overlap():
+    handler = make_handler()
+    release = asyncio.Event()
+    saving = []
+
+    async def save_message(body: dict, device_id: int) -> None:
+        saving.append(device_id)
+        await release.wait()
+
+    handler.db.save_message.side_effect = save_message
+
+    async def run() -> None:
+        tasks = [
+            asyncio.create_task(
+                handler.handle_message(json.dumps({"device_id": i}).encode(), corr_id="")
+            )
+            for i in (1, 2, 3)
+        ]
+        await asyncio.sleep(0.01)
+        assert saving == [1, 2, 3], "The saves should be in flight together"
+        release.set()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+
+
+def test_handle_message_concurrent_duplicate_skipped():
+    handler = make_handler()
+    release = asyncio.Event()
+
+    async def save_message(body: dict, device_id: int) -> None:
+        await release.wait()
+
+    handler.db.save_message.side_effect = save_message
+    body = json.dumps({"device_id": 123}).encode("utf-8")
+
+    async def run() -> None:
+        first = asyncio.create_task(
+            handler.handle_message(body, corr_id="", message_id="reading-1")
+        )
+        await asyncio.sleep(0.01)
+        await handler.handle_message(body, corr_id="", message_id="reading-1")
+        release.set()
+        await first
+        await handler.handle_message(body, corr_id="", message_id="reading-1")
+
+    asyncio.run(run())
+
+    assert handler.db.save_message.await_count == 1
+    assert not handler._saving
+
+
+def test_handle_message_failed_save_is_not_deduplicated():
+    handler = make_handler()
+    handler.db.save_message.side_effect = [Exception("DB down"), None]
+    body = json.dumps({"device_id": 123}).encode("utf-8")
+
+    async def run() -> None:
+        await handler.handle_message(body, corr_id="", message_id="reading-1")
+        await handler.handle_message(body, corr_id="", message_id="reading-1")
+
+    asyncio.run(run())
+
+    assert handler.db.save_message.await_count == 2
+
+
+def test_handle_rpc_request_add_device_to_cache():
+    handler = make_handler()
+    request = json.dumps({"method": "add", "device_id": 123}).encode("utf-8")
+
+    assert handler.handle_rpc_request(corr_id="abc", request=request) == "ok"
+    handler.db.add_device_to_cache.assert_called_once_with(123)
+
+
+def test_connection_manager_acks_when_handled():
+    async def run() -> None:
+        handler = AsyncMock(spec=AsyncMessageHandler)
+        manager = AsyncConnectionManager(handler, loop=asyncio.get_running_loop())
+        channel = MagicMock(is_open=True)
+
+        manager.on_message(channel, MagicMock(delivery_tag=1), MagicMock(content_type="application/json"), b"{}")
+        manager.on_message(channel, MagicMock(delivery_tag=2), MagicMock(content_type=ENVELOPE_CONTENT_TYPE), b"")
+        channel.basic_ack.assert_not_called()
+        await asyncio.gather(*manager._tasks)
+
+        assert [c.kwargs["delivery_tag"] for c in channel.basic_ack.call_args_list] == [1, 2]
+        handler.handle_envelope.assert_awaited_once()
+
+    asyncio.run(run())
+
+
+def test_connection_manager_keeps_shard_order():
+    async def run() -> None:
+        handler = AsyncMock(spec=AsyncMessageHandler)
+        release = asyncio.Event()
+        handled = []
+
+        async def handle_message(body: bytes, *args) -> None:
+            handled.append(body)
+            if body == b"1":
+                await release.wait()
+
+        handler.handle_message.side_effect = handle_message
+        manager = AsyncConnectionManager(handler, loop=asyncio.get_running_loop())
+        channel = MagicMock(is_open=True)
+        properties = MagicMock(content_type="application/json")
+
+        for tag, body in (("shard.0", b"1"), ("shard.0", b"2"), ("shard.1", b"3")):
+            method = MagicMock(delivery_tag=int(body), consumer_tag=tag)
+            manager.on_message(channel, method, properties, body)
+        await asyncio.sleep(0.01)
+        assert handled == [b"1", b"3"], "2 waits for 1, on the same shard"
+
+        release.set()
+        await asyncio.gather(*manager._tasks)
+        assert handled == [b"1", b"3", b"2"]
+        assert not manager._lanes
+
+    # A new manager on this loop, not the singleton of the other tests
+    with patch.object(settings, "MESSAGES_SHARDS", 2), patch.dict(
+        SingletonConnection._instances, clear=True
+    ):
+        asyncio.run(run())
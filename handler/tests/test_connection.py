@@ -3,6 +3,7 @@ from unittest.mock import patch, MagicMock
 
 from src.queues.consumer_connection import ConnectionManager
 from src.config import settings
+from src.core.batch import MessageBatch
 
 
 @pytest.fixture
@@ -111,6 +112,90 @@ def test_connection_manager_setup_queues(connection_manager):
         assert connection_manager._channel.queue_declare.call_count == 2
 
 
+def test_connection_manager_setup_sharded_queues(connection_manager):
+    channel = MagicMock()  # The manager is a singleton, not its earlier calls
+    with patch.object(settings, "MESSAGES_SHARDS", 4), patch.object(
+        settings, "HANDLER_SHARDS", [1, 3]
+    ), patch.object(connection_manager, "_channel", channel), patch(
+        "src.queues.consumer_connection.ConnectionManager.on_queue_declareok"
+    ):
+        connection_manager.setup_queues()
+        declared = [c.kwargs["queue"] for c in channel.queue_declare.call_args_list]
+        assert declared == [
+            f"{settings.MESSAGES_QUEUE}.1",
+            f"{settings.MESSAGES_QUEUE}.3",
+            settings.RPC_QUEUE,
+        ]
+
+
+def test_connection_manager_setup_alarms_lane(connection_manager):
+    connection_manager._connection = MagicMock()
+    with patch.object(settings, "PRIORITY_LANE", True), patch(
+        "src.queues.consumer_connection.ConnectionManager.on_queue_declareok"
+    ):
+        connection_manager.setup_queues()
+        connection_manager._connection.channel.assert_called_once_with(
+            on_open_callback=connection_manager.on_alarms_channel_open
+        )
+
+
+def test_connection_manager_device_events_consumer(connection_manager):
+    channel = MagicMock()
+    with patch.object(connection_manager, "_channel", channel), patch.object(
+        connection_manager, "_handler", MagicMock()
+    ) as handler:
+        connection_manager.setup_device_events()
+        connection_manager.on_device_events_exchange_declareok(MagicMock())
+        frame = MagicMock()
+        frame.method.queue = "amq.gen-worker"
+        connection_manager.on_device_events_queue_declareok(frame)
+        connection_manager.on_device_events_bindok(MagicMock(), queue="amq.gen-worker")
+
+        channel.queue_declare.assert_called_once_with(
+            queue="",
+            exclusive=True,
+            auto_delete=True,
+            callback=connection_manager.on_device_events_queue_declareok,
+        )
+        assert (
+            channel.queue_bind.call_args.kwargs["exchange"]
+            == settings.DEVICE_EVENTS_EXCHANGE
+        )
+        channel.basic_consume.assert_called_once_with(
+            queue="amq.gen-worker",
+            on_message_callback=connection_manager.on_device_event,
+            auto_ack=True,
+        )
+
+        properties = MagicMock(correlation_id="abc")
+        connection_manager.on_device_event(channel, MagicMock(), properties, b"{}")
+        handler.handle_device_event.assert_called_once_with("abc", b"{}")
+
+
+def test_connection_manager_alarms_consumer(connection_manager):
+    channel = MagicMock()
+    connection_manager.on_alarms_channel_open(channel)
+    connection_manager.on_alarms_queue_declareok(MagicMock())
+    connection_manager.on_alarms_bindok(MagicMock())
+    connection_manager.on_alarms_qos_ok(MagicMock())
+
+    channel.queue_bind.assert_called_once_with(
+        exchange=connection_manager.EXCHANGE,
+        queue=settings.ALARMS_QUEUE,
+        routing_key=settings.ALARMS_ROUTING_KEY,
+        callback=connection_manager.on_alarms_bindok,
+    )
+    channel.basic_qos.assert_called_once_with(
+        prefetch_count=settings.ALARMS_PREFETCH_COUNT,
+        callback=connection_manager.on_alarms_qos_ok,
+    )
+    channel.basic_consume.assert_called_once_with(
+        queue=settings.ALARMS_QUEUE,
+        on_message_callback=connection_manager.on_message,
+    )
+    connection_manager._alarms_channel = None
+
+
 def test_connection_manager_start_consuming(connection_manager):
     with patch(
         "src.queues.consumer_connection.ConnectionManager.on_consumer_cancelled"
@@ -186,3 +271,69 @@ def test_connection_manager_run(connection_manager):
     connection_manager.run()
     connection_manager.connect.assert_called_once()
     connection_manager._connection.ioloop.start.assert_called_once()
+
+
+def test_connection_manager_batch_flushed_when_full(connection_manager):
+    connection_manager._connection = MagicMock()
+    connection_manager._channel = MagicMock(is_open=True)
+    connection_manager._handler = MagicMock()
+    connection_manager._handler.handle_message.side_effect = (
+        lambda *args, batch, **kwargs: batch.add({}, 1)
+    )
+    properties = MagicMock(content_type="application/json")
+    with patch.object(settings, "BATCH_SIZE", 3):
+        for tag in (1, 2, 3):
+            connection_manager.on_message(
+                connection_manager._channel, MagicMock(delivery_tag=tag), properties, b"{}"
+            )
+
+    connection_manager._handler.save_batch.assert_called_once()
+    connection_manager._channel.basic_ack.assert_called_once_with(
+        delivery_tag=3, multiple=True
+    )
+    connection_manager._connection.ioloop.remove_timeout.assert_called_once()
+    assert connection_manager._batch is None
+
+
+def test_connection_manager_batch_flushed_on_timeout(connection_manager):
+    connection_manager._connection = MagicMock()
+    connection_manager._channel = MagicMock(is_open=True)
+    connection_manager._handler = MagicMock()
+    properties = MagicMock(content_type="application/json")
+    with patch.object(settings, "BATCH_SIZE", 100):
+        connection_manager.on_message(
+            connection_manager._channel, MagicMock(delivery_tag=7), properties, b"{}"
+        )
+        connection_manager._channel.basic_ack.assert_not_called()
+
+        delay, flush = connection_manager._connection.ioloop.call_later.call_args.args
+        assert delay == settings.BATCH_MAX_DELAY
+        flush()
+
+    connection_manager._channel.basic_ack.assert_called_once_with(
+        delivery_tag=7, multiple=True
+    )
+
+
+def test_connection_manager_alarms_not_batched(connection_manager):
+    connection_manager._channel = MagicMock(is_open=True)
+    connection_manager._handler = MagicMock()
+    alarms_channel = MagicMock()
+    properties = MagicMock(content_type="application/json")
+    with patch.object(settings, "BATCH_SIZE", 100):
+        connection_manager.on_message(
+            alarms_channel, MagicMock(delivery_tag=1), properties, b"{}"
+        )
+
+    assert connection_manager._handler.handle_message.call_args.kwargs["batch"] is None
+    alarms_channel.basic_ack.assert_called_once_with(delivery_tag=1)
+
+
+def test_connection_manager_batch_discarded_on_channel_closed(connection_manager):
+    connection_manager._connection = MagicMock()
+    connection_manager._batch = MessageBatch()
+    connection_manager._batch_timer = MagicMock()
+    connection_manager.on_channel_closed(MagicMock(), Exception())
+
+    assert connection_manager._batch is None
+    assert connection_manager._batch_timer is None
@@ -0,0 +1,43 @@
+import json
+import struct
+
+from src.core.database.copy import copy_binary, copy_text
+
+
+def test_copy_text():
+    buffer = copy_text([({"data": 1}, 1), ({"note": "a\tb\nc\\d"}, 2)])
+
+    rows = buffer.read().split("\n")
+    assert rows == ['{"data": 1}\t1', '{"note": "a\\\\tb\\\\nc\\\\\\\\d"}\t2', ""]
+
+
+def test_copy_text_round_trip():
+    body = {"note": "tab\there", "path": "C:\\dir", "unicode": "\u00e9\u2028"}
+    line = copy_text([(body, 7)]).read()
+
+    # How the server reads a text COPY field back
+    field, device_id = line.rstrip("\n").split("\t")
+    unescaped = field.encode().decode("unicode_escape").encode("latin-1").decode()
+    assert json.loads(unescaped) == body
+    assert device_id == "7"
+
+
+def test_copy_binary():
+    data = copy_binary([({"data": 1}, 3)]).read()
+
+    assert data.startswith(b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0))
+    assert data.endswith(struct.pack(">h", -1))
+    row = data[19:-2]
+    fields, length = struct.unpack_from(">hi", row)
+    assert fields == 2
+    assert row[6 : 6 + length] == b'{"data": 1}'
+    assert struct.unpack_from(">ii", row, 6 + length) == (4, 3)
+
+
+def test_copy_binary_bigint_jsonb():
+    data = copy_binary([({}, 3)], bigint=True, jsonb=True).read()
+
+    row = data[19:-2]
+    _, length = struct.unpack_from(">hi", row)
+    assert row[6 : 6 + length] == b"\x01{}"
+    assert struct.unpack_from(">iq", row, 6 + length) == (8, 3)
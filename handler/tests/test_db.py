@@ -1,11 +1,14 @@
 from typing import Generator
+from unittest.mock import patch
 
 from sqlalchemy.orm.session import Session
 import pytest
 
 from tests.conftest import create_test_data
 
+from src.config import settings
 from src.core.database.db import engine, DB, Message, Device, Environment, User
+from src.core.devices import DeviceCache
 
 
 class TestDB:
@@ -45,6 +48,34 @@ class TestDB:
         session.commit()
         assert not db.verify_device_id(id_.id), "Device should not exist"
 
+    def test_unknown_device_not_queried_again(self, session: Session) -> None:
+        db = DB()
+        db.verify_device_id(-1)
+        with patch.object(db.session, "query") as query:
+            assert not db.verify_device_id(-1), "Device should not exist"
+            query.assert_not_called()
+
+    def test_bloom_filter_rejects_without_query(self, session: Session) -> None:
+        db = DB()
+        db.devices = DeviceCache(bloom=True)
+        db._get_devices()
+        with patch.object(db.session, "query") as query:
+            assert not db.verify_device_id(-1), "Device should not exist"
+            query.assert_not_called()
+
+    def test_device_of_inactive_user_not_found(self, session: Session) -> None:
+        device = session.query(Device).first()
+        session.query(User).update({User.is_active: False})
+        session.commit()
+        db = DB()
+        assert not db.verify_device_id(device.id), "Owner is deactivated"
+
+    def test_added_device_not_unknown(self, session: Session) -> None:
+        db = DB()
+        db.verify_device_id(123_456)
+        db.add_device_to_cache(123_456)
+        assert db.verify_device_id(123_456), "Device should be known"
+
     # --- Save Message ---
     def test_save_message(self, session: Session) -> None:
         db = DB()
@@ -57,6 +88,32 @@ class TestDB:
         db.save_message(message, device_id)
         assert session.query(Message).count() == 1, "Message should be saved"
 
+    @pytest.mark.parametrize("copy_format", ["", "text", "binary"])
+    def test_save_messages(self, session: Session, copy_format: str) -> None:
+        db = DB()
+        device_id = session.query(Device).first().id
+        messages = [({"data": i, "note": "a\tb\\c"}, device_id) for i in range(10)]
+        with patch.object(settings, "COPY_FORMAT", copy_format):
+            db.save_messages(messages)
+        saved = session.query(Message).order_by(Message.id).all()
+        assert [m.message for m in saved] == [body for body, _ in messages]
+
+    @pytest.mark.parametrize("copy_format", ["", "text", "binary"])
+    def test_save_messages_isolates_bad_row(
+        self, session: Session, copy_format: str
+    ) -> None:
+        db = DB()
+        device_id = session.query(Device).first().id
+        messages = [({"data": 1}, device_id), ({"data": 2}, -1), ({"data": 3}, device_id)]
+        with patch.object(settings, "COPY_FORMAT", copy_format):
+            db.save_messages(messages)
+        assert session.query(Message).count() == 2, "Only the bad row is dropped"
+
+    def test_save_messages_none_saved_raises(self, session: Session) -> None:
+        db = DB()
+        with pytest.raises(Exception):
+            db.save_messages([({"data": 1}, -1), ({"data": 2}, -2)])
+
     def test_add_device_to_cache(self, session: Session) -> None:
         db = DB()
         device_id = 123
@@ -0,0 +1,88 @@
+from unittest.mock import patch
+
+from src.core.devices import BloomFilter, DeviceCache, UnknownDevices
+
+
+def test_unknown_devices_expire():
+    unknown = UnknownDevices(ttl=10, max_keys=100)
+    with patch("src.core.devices.monotonic", return_value=0):
+        unknown.add(1)
+        assert 1 in unknown
+    with patch("src.core.devices.monotonic", return_value=11):
+        assert 1 not in unknown
+        assert len(unknown) == 0
+
+
+def test_unknown_devices_bounded():
+    unknown = UnknownDevices(ttl=10, max_keys=2)
+    for device_id in (1, 2, 3):
+        unknown.add(device_id)
+
+    assert 1 not in unknown
+    assert 2 in unknown and 3 in unknown
+
+
+def test_unknown_devices_disabled():
+    unknown = UnknownDevices(ttl=0)
+    unknown.add(1)
+    assert 1 not in unknown
+
+
+def test_bloom_filter_no_false_negatives():
+    bloom = BloomFilter.from_ids(range(0, 20_000, 2))
+
+    assert all(device_id in bloom for device_id in range(0, 20_000, 2))
+    false_positives = sum(device_id in bloom for device_id in range(1, 20_000, 2))
+    assert false_positives < 10_000 * 0.02
+
+
+def test_device_cache_check():
+    cache = DeviceCache(bloom=True, rebuild_interval=0)
+    cache.load([1, 2])
+
+    assert cache.check(1) is True
+    assert cache.check(1_000_003) is False, "Rejected by the Bloom filter"
+    cache.active.discard(2)
+    assert cache.check(2) is None, "In the Bloom filter, asks the database"
+    cache.found(2, False)
+    assert cache.check(2) is False
+
+
+def test_device_cache_add_remove():
+    cache = DeviceCache(bloom=True, rebuild_interval=0)
+    cache.load([1])
+    cache.found(5, False)
+
+    cache.add(5)
+    assert cache.check(5) is True
+
+    cache.remove(5)
+    assert cache.check(5) is False
+    cache.remove(5)  # Again, as a device event after the RPC request
+
+
+def test_device_cache_added_device_passes_bloom():
+    cache = DeviceCache(bloom=True, rebuild_interval=0)
+    cache.load([1])
+    assert cache.check(7) is False
+
+    cache.add(7)
+    cache.active.discard(7)
+    assert cache.check(7) is None, "In the Bloom filter, asks the database"
+
+
+def test_device_cache_without_bloom_asks_database():
+    cache = DeviceCache(bloom=False, rebuild_interval=0)
+    cache.load([1])
+
+    assert cache.check(7) is None
+
+
+def test_device_cache_rebuild_due_once():
+    cache = DeviceCache(rebuild_interval=60)
+    with patch("src.core.devices.monotonic", return_value=0):
+        assert not cache.due(), "Not loaded yet"
+        cache.load([1])
+    with patch("src.core.devices.monotonic", return_value=61):
+        assert cache.due()
+        assert not cache.due()
@@ -1,7 +1,13 @@
+import gzip
 import json
+import struct
 from logging import Logger
 from unittest.mock import MagicMock
 
+import pytest
+
+from src.config import settings
+from src.core.batch import MessageBatch
 from src.core.database.db import DB
 from src.core.message_handlers import Message_Handler
 
@@ -21,6 +27,87 @@ def test_handle_message_with_existing_device_id():
     db_mock.save_message.assert_called_once()
 
 
+def test_handle_message_with_device_id_header():
+    body = json.dumps({"data": {"temperature": 22.5, "humidity": 45}}).encode("utf-8")
+    db_mock = MagicMock(spec=DB)
+    db_mock.verify_device_id.return_value = True
+    handler = Message_Handler()
+    handler.db = db_mock
+
+    handler.handle_message(body, corr_id="abc", headers={"device_id": 123})
+
+    db_mock.verify_device_id.assert_called_once_with(123)
+    db_mock.save_message.assert_called_once_with(
+        {"data": {"temperature": 22.5, "humidity": 45}}, 123
+    )
+
+
+def test_handle_message_gzip_encoded():
+    body = gzip.compress(json.dumps({"data": 1}).encode("utf-8"))
+    db_mock = MagicMock(spec=DB)
+    db_mock.verify_device_id.return_value = True
+    handler = Message_Handler()
+    handler.db = db_mock
+
+    handler.handle_message(
+        body, corr_id="abc", headers={"device_id": 123}, content_encoding="gzip"
+    )
+
+    db_mock.save_message.assert_called_once_with({"data": 1}, 123)
+
+
+def test_handle_message_msgpack():
+    msgpack = pytest.importorskip("msgpack")
+    body = msgpack.packb({"data": {"temperature": 22.5}, "raw": b"\x01"})
+    db_mock = MagicMock(spec=DB)
+    db_mock.verify_device_id.return_value = True
+    handler = Message_Handler()
+    handler.db = db_mock
+
+    handler.handle_message(
+        body,
+        corr_id="abc",
+        headers={"device_id": 123},
+        content_type="application/msgpack",
+    )
+
+    db_mock.save_message.assert_called_once_with(
+        {"data": {"temperature": 22.5}, "raw": "AQ=="}, 123
+    )
+
+
+def test_handle_message_cbor():
+    cbor2 = pytest.importorskip("cbor2")
+    body = cbor2.dumps({"data": {"temperature": 22.5}, 1: "one"})
+    db_mock = MagicMock(spec=DB)
+    db_mock.verify_device_id.return_value = True
+    handler = Message_Handler()
+    handler.db = db_mock
+
+    handler.handle_message(
+        body, corr_id="abc", headers={"device_id": 123}, content_type="application/cbor"
+    )
+
+    db_mock.save_message.assert_called_once_with(
+        {"data": {"temperature": 22.5}, "1": "one"}, 123
+    )
+
+
+def test_handle_message_gzip_bomb():
+    body = gzip.compress(b"0" * (settings.MAX_DECOMPRESSED_BYTES + 1))
+    db_mock = MagicMock(spec=DB)
+    handler = Message_Handler()
+    handler.db = db_mock
+    handler.logger = MagicMock(spec=Logger)
+
+    handler.handle_message(
+        body, corr_id="abc", headers={"device_id": 123}, content_encoding="gzip"
+    )
+
+    db_mock.save_message.assert_not_called()
+    handler.logger.error.assert_called_once()
+
+
 def test_handle_message_with_non_existing_device_id():
     body = json.dumps(
         {"device_id": 123, "data": {"temperature": 22.5, "humidity": 45}}
@@ -57,6 +144,131 @@ def test_handle_message_with_invalid_body():
     handler.logger.error.assert_called_once()
 
 
+def envelope(*items: tuple[dict, dict]) -> bytes:
+    records = [
+        json.dumps(properties).encode() + b"\n" + json.dumps(body).encode()
+        for body, properties in items
+    ]
+    return b"".join(struct.pack(">I", len(r)) + r for r in records)
+
+
+def test_handle_envelope():
+    body = envelope(
+        ({"device_id": 1, "data": 1}, {"correlation_id": "a"}),
+        ({"data": 2}, {"correlation_id": "b", "headers": {"device_id": 2}}),
+        ({"device_id": 3, "data": 3}, {"correlation_id": "c"}),
+    )
+    db_mock = MagicMock(spec=DB)
+    db_mock.verify_device_id.side_effect = lambda device_id: device_id != 3
+    handler = Message_Handler()
+    handler.db = db_mock
+
+    handler.handle_envelope(body, corr_id="")
+
+    db_mock.save_messages.assert_called_once_with([({"data": 1}, 1), ({"data": 2}, 2)])
+    db_mock.save_message.assert_not_called()
+
+
+def test_handle_envelope_skips_invalid_message():
+    records = [b'{"correlation_id": "a"}\nnot json', b'{}\n{"device_id": 1}']
+    body = b"".join(struct.pack(">I", len(r)) + r for r in records)
+    db_mock = MagicMock(spec=DB)
+    db_mock.verify_device_id.return_value = True
+    handler = Message_Handler()
+    handler.db = db_mock
+    handler.logger = MagicMock(spec=Logger)
+
+    handler.handle_envelope(body, corr_id="")
+
+    db_mock.save_messages.assert_called_once_with([({}, 1)])
+    handler.logger.error.assert_called_once()
+
+
+def test_handle_message_skips_duplicate_message_id():
+    body = json.dumps({"device_id": 123, "data": 1}).encode("utf-8")
+    db_mock = MagicMock(spec=DB)
+    db_mock.verify_device_id.return_value = True
+    handler = Message_Handler()
+    handler.db = db_mock
+
+    handler.handle_message(body, corr_id="abc", message_id="reading-1")
+    handler.handle_message(body, corr_id="abc", message_id="reading-1")
+    handler.handle_message(body, corr_id="abc", message_id="reading-2")
+
+    assert db_mock.save_message.call_count == 2
+
+
+def test_handle_message_failed_save_is_not_deduplicated():
+    body = json.dumps({"device_id": 123, "data": 1}).encode("utf-8")
+    db_mock = MagicMock(spec=DB)
+    db_mock.verify_device_id.return_value = True
+    db_mock.save_message.side_effect = [Exception("DB down"), None]
+    handler = Message_Handler()
+    handler.db = db_mock
+
+    handler.handle_message(body, corr_id="abc", message_id="reading-1")
+    handler.handle_message(body, corr_id="abc", message_id="reading-1")
+
+    assert db_mock.save_message.call_count == 2
+
+
+def test_handle_envelope_skips_duplicate_message_id():
+    body = envelope(
+        ({"device_id": 1, "data": 1}, {"message_id": "m-1"}),
+        ({"device_id": 1, "data": 1}, {"message_id": "m-1"}),
+        ({"device_id": 2, "data": 1}, {"message_id": "m-1"}),
+    )
+    db_mock = MagicMock(spec=DB)
+    db_mock.verify_device_id.return_value = True
+    handler = Message_Handler()
+    handler.db = db_mock
+
+    handler.handle_envelope(body, corr_id="")
+    handler.handle_envelope(body, corr_id="")
+
+    db_mock.save_messages.assert_any_call([({"data": 1}, 1), ({"data": 1}, 2)])
+    db_mock.save_messages.assert_called_with([])
+
+
+def test_handle_message_into_batch():
+    body = json.dumps({"device_id": 123, "data": 1}).encode("utf-8")
+    db_mock = MagicMock(spec=DB)
+    db_mock.verify_device_id.return_value = True
+    handler = Message_Handler()
+    handler.db = db_mock
+    batch = MessageBatch()
+
+    handler.handle_message(body, corr_id="abc", message_id="reading-1", batch=batch)
+    handler.handle_message(body, corr_id="abc", message_id="reading-1", batch=batch)
+    handler.handle_envelope(
+        envelope(({"device_id": 2, "data": 2}, {"message_id": "m-1"})), corr_id="", batch=batch
+    )
+
+    db_mock.save_message.assert_not_called()
+    db_mock.save_messages.assert_not_called()
+    assert batch.messages == [({"data": 1}, 123), ({"data": 2}, 2)]
+
+    handler.save_batch(batch)
+
+    db_mock.save_messages.assert_called_once_with([({"data": 1}, 123), ({"data": 2}, 2)])
+    assert handler.dedupe.seen(123, "reading-1")
+    assert handler.dedupe.seen(2, "m-1")
+
+
+def test_save_batch_failed_is_not_deduplicated():
+    db_mock = MagicMock(spec=DB)
+    db_mock.save_messages.side_effect = Exception("DB down")
+    handler = Message_Handler()
+    handler.db = db_mock
+    batch = MessageBatch()
+    batch.add({"data": 1}, 123, "reading-1")
+
+    with pytest.raises(Exception):
+        handler.save_batch(batch)
+
+    assert not handler.dedupe.seen(123, "reading-1")
+
+
 def test_close():
     db_mock = MagicMock(spec=DB)
     handler = Message_Handler()
@@ -101,6 +313,18 @@ def test_handle_rpc_request_remove_device_from_cache():
     assert result == "ok"
 
 
+def test_handle_device_event_remove_device_from_cache():
+    event = json.dumps({"method": "remove", "device_id": 123}).encode("utf-8")
+    db_mock = MagicMock(spec=DB)
+    handler = Message_Handler()
+    handler.db = db_mock
+    handler.logger = MagicMock(spec=Logger)
+
+    handler.handle_device_event("abc", event)
+
+    db_mock.remove_device_from_cache.assert_called_once_with(123)
+
+
 def test_handle_rpc_request_invalid_request():
     request = b"invalid request"
     db_mock = MagicMock(spec=DB)
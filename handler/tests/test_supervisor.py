@@ -0,0 +1,104 @@
+import os
+import signal
+import time
+from unittest.mock import patch
+
+import pytest
+
+from src.config import Settings, settings
+from src.supervisor import Supervisor, worker_shards
+
+
+def crashing_worker(index: int, workers: int) -> None:
+    os._exit(1)
+
+
+def draining_worker(index: int, workers: int) -> None:
+    signal.signal(signal.SIGTERM, signal.default_int_handler)  # As run_worker does
+    try:
+        time.sleep(60)
+    except KeyboardInterrupt:
+        os._exit(0)
+
+
+def stuck_worker(index: int, workers: int) -> None:
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    time.sleep(60)
+
+
+def wait_exited(supervisor: Supervisor) -> None:
+    for process in supervisor._processes.values():
+        process.join(10)
+
+
+def test_worker_shards():
+    with patch.object(settings, "MESSAGES_SHARDS", 8), patch.object(
+        settings, "HANDLER_SHARDS", []
+    ):
+        assert worker_shards(0, 3) == [0, 3, 6]
+        assert worker_shards(2, 3) == [2, 5]
+    with patch.object(settings, "MESSAGES_SHARDS", 8), patch.object(
+        settings, "HANDLER_SHARDS", [1, 5]
+    ):
+        assert worker_shards(1, 3) == [1, 5], "Fewer shards than workers: all of them"
+
+
+def test_replica_shards():
+    with patch.object(settings, "MESSAGES_SHARDS", 8), patch.object(
+        settings, "HANDLER_SHARDS", []
+    ), patch.object(settings, "HANDLER_REPLICA", 1), patch.object(
+        settings, "HANDLER_REPLICAS", 3
+    ):
+        assert settings.REPLICA_SHARDS == [1, 4, 7]
+        assert worker_shards(1, 2) == [4]
+
+    with pytest.raises(ValueError):
+        Settings(HANDLER_REPLICA=2, HANDLER_REPLICAS=2)
+
+
+def test_supervisor_restarts_crashed_worker():
+    supervisor = Supervisor(workers=2, target=crashing_worker)
+    for index in range(2):
+        supervisor._start(index)
+    wait_exited(supervisor)
+    first = {index: process.pid for index, process in supervisor._processes.items()}
+
+    supervisor.check()
+
+    assert all(process.pid != first[index] for index, process in supervisor._processes.items())
+    wait_exited(supervisor)
+
+
+def test_supervisor_backs_off_crash_loop():
+    supervisor = Supervisor(workers=1, target=crashing_worker)
+    supervisor._start(0)
+    wait_exited(supervisor)
+    supervisor.check()  # First crash: restarted at once
+    wait_exited(supervisor)
+
+    supervisor.check()  # Second one in a row: waits
+
+    assert supervisor._processes[0] is None
+    assert supervisor._crashes[0] == 2
+
+
+def test_supervisor_drains_workers():
+    supervisor = Supervisor(workers=2, target=draining_worker)
+    for index in range(2):
+        supervisor._start(index)
+    time.sleep(2)  # Let the workers start and install their handlers
+
+    supervisor.drain()
+
+    assert [process.exitcode for process in supervisor._processes.values()] == [0, 0]
+
+
+def test_supervisor_kills_stuck_workers():
+    supervisor = Supervisor(workers=1, target=stuck_worker)
+    supervisor._start(0)
+    time.sleep(2)
+
+    with patch.object(settings, "WORKERS_DRAIN_TIMEOUT", 0.5):
+        supervisor.drain()
+
+    assert supervisor._processes[0].exitcode == -signal.SIGKILL
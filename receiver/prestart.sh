@@ -7,6 +7,7 @@ echo $ENVIRONMENT
 echo $LOG_LEVEL
 echo $RABBITMQ_DNS
 echo $RECEIVER_ID
+echo $RECEIVER_WORKERS
 
 # Let the DB start
 
@@ -16,5 +17,6 @@ python src/pre_start.py
 if [ "$ENVIRONMENT" = "dev" ]; then
     fastapi dev src/main.py --host 0.0.0.0 --port 8000
 else
-    fastapi run src/main.py --port 8000
+    # Each worker opens its own broker connection in the app lifespan
+    fastapi run src/main.py --port 8000 --workers ${RECEIVER_WORKERS:-1}
 fi
\ No newline at end of file
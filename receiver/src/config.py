@@ -1,9 +1,19 @@
 import secrets
 from typing import Literal
 
-from pydantic import computed_field
+from pydantic import BaseModel, computed_field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+DeliveryMode = Literal["transient", "confirmed", "spooled"]
+
+
+class DownsampleRule(BaseModel):
+    """How the readings of a device are downsampled, see src.downsampling."""
+
+    mode: Literal["last", "mean", "deadband"]
+    window: float = 1.0  # seconds, the deadband heartbeat (0 disables it)
+    threshold: float = 0.0  # deadband, numeric changes up to it are not published
+
 
 class Settings(BaseSettings):
     model_config = SettingsConfigDict(
@@ -32,12 +42,67 @@ class Settings(BaseSettings):
     HANDLER_EXCHANGE: str
     MESSAGES_QUEUE: str
     MESSAGES_DECLARE_EXCHANGE: bool = True
+    MESSAGES_CHANNEL_POOL_SIZE: int = 4
+    MESSAGES_PUBLISHER_CONFIRMS: bool = True
+    MESSAGES_CONFIRM_WINDOW: int = (
+        1000  # Max messages waiting for the broker confirmation
+    )
+    MESSAGES_CONFIRM_TIMEOUT: float = 5.0  # seconds
+    MESSAGES_RETRY_AFTER: int = 5  # seconds, sent to the devices on 503
+
+    # Publishes each device to one of MESSAGES_SHARDS queues, picked by consistent
+    # hashing of the device_id. 0 publishes everything to MESSAGES_QUEUE.
+    MESSAGES_SHARDS: int = 0
+
+    # Coalesces the messages into envelopes of up to MAX_ITEMS, a message waits at
+    # most LINGER seconds before its envelope is published.
+    MESSAGES_COALESCE: bool = False
+    MESSAGES_COALESCE_MAX_ITEMS: int = 100
+    MESSAGES_COALESCE_LINGER: float = 0.005  # seconds
+
+    # Delivery guarantee of the device messages, by device type or by device id (which
+    # wins). "transient": not persisted nor confirmed by the broker, never spooled (fire
+    # and forget). "confirmed": persistent and confirmed, spooled while the broker is
+    # down. "spooled": on the local spool before the device is answered, then forwarded.
+    DELIVERY_MODE: DeliveryMode = "confirmed"
+    DELIVERY_MODE_TYPES: dict[str, DeliveryMode] = {}
+    DELIVERY_MODE_DEVICES: dict[int, DeliveryMode] = {}
+
+    # Local spool, used while the broker is unreachable
+    SPOOL_ENABLED: bool = True
+    SPOOL_DIR: str = "spool"
+    SPOOL_SEGMENT_SIZE: int = 16 * 1024 * 1024  # bytes
+    SPOOL_MAX_BYTES: int = 1024 * 1024 * 1024  # bytes
+    SPOOL_FSYNC_INTERVAL: float = 0.01  # seconds
+    SPOOL_FSYNC_BATCH: int = 256
+    SPOOL_DRAIN_CHUNK: int = 256
+
+    # Priority lane: the alarms go to their own queue, ahead of any telemetry backlog,
+    # and are never coalesced. A message is an alarm when its device type is one of
+    # ALARM_DEVICE_TYPES, its ALARM_HEADER header or its ALARM_FIELD payload field
+    # has one of ALARM_VALUES (or the field is true). An empty rule is skipped.
+    PRIORITY_LANE: bool = False
+    ALARM_DEVICE_TYPES: list[str] = []
+    ALARM_HEADER: str = "X-Priority"
+    ALARM_FIELD: str = "priority"
+    ALARM_VALUES: list[str] = ["alarm", "critical"]
 
     @computed_field  # type: ignore
     @property
     def MESSAGES_ROUTING_KEY(self) -> str:
         return f"{self.HANDLER_EXCHANGE}.{self.RECEIVER_ID}"
 
+    @computed_field  # type: ignore
+    @property
+    def ALARMS_QUEUE(self) -> str:
+        return f"{self.MESSAGES_QUEUE}.alarms"
+
+    @computed_field  # type: ignore
+    @property
+    def ALARMS_ROUTING_KEY(self) -> str:
+        # Three words, so the handlers "<exchange>.*" telemetry binding skips it
+        return f"{self.HANDLER_EXCHANGE}.alarms.{self.RECEIVER_ID}"
+
     LOGGING_EXCHANGE: str
     LOG_QUEUE: str
 
@@ -48,5 +113,66 @@ class Settings(BaseSettings):
 
     ALGORITHM: str = "HS256"
 
+    # Per device token bucket rate limit, RATE_LIMIT_RATE <= 0 disables it. The
+    # overrides map a device type to its own (rate, burst), e.g. {"camera": [1, 5]}
+    RATE_LIMIT_RATE: float = 50  # messages per second
+    RATE_LIMIT_BURST: float = 500  # messages
+    RATE_LIMIT_MAX_DEVICES: int = 100000
+    RATE_LIMIT_OVERRIDES: dict[str, tuple[float, float]] = {}
+
+    # Validated tokens cache, invalidated by the user API device events
+    DEVICE_EVENTS_EXCHANGE: str = "device_events"
+    TOKEN_CACHE_SIZE: int = 10000
+    TOKEN_CACHE_TTL: float = 300  # seconds
+    TOKEN_CACHE_NEGATIVE_TTL: float = 10  # seconds
+
+    BATCH_MAX_ITEMS: int = 500
+
+    # Retries of a message with the same Idempotency-Key, within DEDUPE_WINDOW
+    # seconds of its first acceptance, are acked without being published again.
+    # 0 disables the dedupe.
+    DEDUPE_WINDOW: float = 300
+    DEDUPE_MAX_KEYS: int = 200_000
+    IDEMPOTENCY_KEY_MAX_LENGTH: int = 128
+
+    # The user API, reachable from the receivers, to load the device type schemas.
+    # Without it the schemas are only received through the device events.
+    USERAPI_INTERNAL_URL: str | None = None
+    SCHEMAS_SYNC_TIMEOUT: float = 10  # seconds
+
+    # Frames of one WebSocket connection being published at once. Above it the
+    # connection stops reading frames until the oldest one is acked.
+    WEBSOCKET_MAX_IN_FLIGHT: int = 64
+
+    # MQTT/UDP ingest gateway (python -m src.gateway), for the devices without HTTPS.
+    # A port set to 0 disables its listener.
+    GATEWAY_HOST: str = "0.0.0.0"
+    GATEWAY_MQTT_PORT: int = 1883
+    GATEWAY_UDP_PORT: int = 1884
+    GATEWAY_MAX_CONNECTIONS: int = 200_000
+    GATEWAY_MAX_IN_FLIGHT: int = 16  # Per MQTT connection, it stops reading above it
+    GATEWAY_UDP_MAX_IN_FLIGHT: int = 10_000  # Datagrams above it are dropped
+    # bytes, capped by the net.core.rmem_max sysctl. Bursts above it are dropped by the kernel
+    GATEWAY_UDP_RECEIVE_BUFFER: int = 8 * 1024 * 1024
+    GATEWAY_CONNECT_TIMEOUT: float = 10  # seconds to send the MQTT CONNECT
+    GATEWAY_SWEEP_INTERVAL: float = 5  # seconds between the keep alive checks
+
+    # Downsampling of the over-chatty devices before publishing, by device type or by
+    # device id (which wins), e.g. {"thermometer": {"mode": "mean", "window": 1}}.
+    # Alarms, batches and raw passthrough payloads are never downsampled.
+    DOWNSAMPLE_TYPES: dict[str, DownsampleRule] = {}
+    DOWNSAMPLE_DEVICES: dict[int, DownsampleRule] = {}
+    DOWNSAMPLE_MAX_DEVICES: int = 100000  # deadband last values kept
+
+    # Forwards the device payloads untouched, with the device_id as an AMQP header
+    # instead of a body field. Handlers must read the header before enabling it.
+    RAW_PASSTHROUGH: bool = False
+
+    # gzip/zstd request bodies (Content-Encoding), never decompressed above
+    # MAX_DECOMPRESSED_BYTES. In raw passthrough mode they can be published still
+    # compressed, the handler decompresses them from the content_encoding property.
+    MAX_DECOMPRESSED_BYTES: int = 1024 * 1024  # bytes
+    MESSAGES_KEEP_COMPRESSED: bool = False
+
 
 settings = Settings()
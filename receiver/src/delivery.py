@@ -0,0 +1,28 @@
+from src.config import DeliveryMode, settings
+
+
+class DeliveryPolicy:
+    """
+    The delivery mode of each device: its own, else the one of its device type, else
+    the default. The table is read from the settings once, per worker.
+    """
+
+    def __init__(
+        self,
+        default: DeliveryMode = settings.DELIVERY_MODE,
+        types: dict[str, DeliveryMode] = settings.DELIVERY_MODE_TYPES,
+        devices: dict[int, DeliveryMode] = settings.DELIVERY_MODE_DEVICES,
+    ) -> None:
+        self._default = default
+        self._types = types
+        self._devices = devices
+
+    def mode(self, device_id: int, device_type: str | None = None) -> DeliveryMode:
+        if device_id in self._devices:
+            return self._devices[device_id]
+        if device_type is not None and device_type in self._types:
+            return self._types[device_type]
+        return self._default
+
+
+delivery_policy = DeliveryPolicy()
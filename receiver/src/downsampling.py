@@ -0,0 +1,201 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from time import monotonic
+from typing import Any
+
+from src.config import DownsampleRule, settings
+
+logger = logging.getLogger("Downsampler")
+
+# (device_id, device_type, reading, correlation_id)
+Emit = Callable[[int, str | None, dict[Any, Any], str], Awaitable[None]]
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, int | float) and not isinstance(value, bool)
+
+
+class _Window:
+    """The readings of one device in the current window, reduced as they arrive."""
+
+    __slots__ = (
+        "rule",
+        "device_type",
+        "reading",
+        "correlation_id",
+        "sums",
+        "counts",
+        "handle",
+    )
+
+    def __init__(self, rule: DownsampleRule, device_type: str | None) -> None:
+        self.rule = rule
+        self.device_type = device_type
+        self.reading: dict[Any, Any] = {}
+        self.correlation_id = ""
+        self.sums: dict[Any, float] = {}
+        self.counts: dict[Any, int] = {}
+        self.handle: asyncio.TimerHandle | None = None
+
+    def add(self, reading: dict[Any, Any], correlation_id: str) -> None:
+        self.reading = reading
+        self.correlation_id = correlation_id
+        if self.rule.mode == "mean":
+            for field, value in reading.items():
+                if _is_number(value):
+                    self.sums[field] = self.sums.get(field, 0.0) + value
+                    self.counts[field] = self.counts.get(field, 0) + 1
+
+    def result(self) -> dict[Any, Any]:
+        """The last reading, with the numeric fields averaged in the mean mode."""
+        if self.rule.mode != "mean":
+            return self.reading
+        reading = dict(self.reading)
+        for field, total in self.sums.items():
+            reading[field] = total / self.counts[field]
+        return reading
+
+
+class Downsampler:
+    """
+    Per device downsampling of the readings, before they are published:
+
+    - last: only the last reading of each window is published, at the window end.
+    - mean: the numeric fields are averaged over the window, the other fields keep
+      their last value, published at the window end.
+    - deadband: a reading is published right away when a field changed, a numeric one
+      by more than `threshold`, from the last published reading, or `window` seconds
+      after it. The others are dropped.
+
+    The windows start with the first reading of the device and are flushed by timers
+    on the event loop of the worker, so the state needs no locks. The deadband keeps
+    the last reading of the `max_devices` most recently seen devices.
+    """
+
+    def __init__(
+        self,
+        emit: Emit,
+        types: dict[str, DownsampleRule] = settings.DOWNSAMPLE_TYPES,
+        devices: dict[int, DownsampleRule] = settings.DOWNSAMPLE_DEVICES,
+        max_devices: int = settings.DOWNSAMPLE_MAX_DEVICES,
+    ) -> None:
+        self._emit = emit
+        self._types = types
+        self._devices = devices
+        self._max_devices = max_devices
+        self._windows: dict[int, _Window] = {}
+        self._published: OrderedDict[int, tuple[float, dict[Any, Any]]] = OrderedDict()
+        self._tasks: set[asyncio.Task[None]] = set()
+
+    def __bool__(self) -> bool:
+        return bool(self._types or self._devices)
+
+    def rule(self, device_id: int, device_type: str | None) -> DownsampleRule | None:
+        if device_id in self._devices:
+            return self._devices[device_id]
+        if device_type is not None:
+            return self._types.get(device_type)
+        return None
+
+    def offer(
+        self,
+        device_id: int,
+        device_type: str | None,
+        reading: dict[Any, Any],
+        correlation_id: str = "",
+    ) -> bool:
+        """
+        Whether the reading is to be published now. When not, it is dropped or held in
+        the device window, to be emitted when the window ends.
+        """
+        rule = self.rule(device_id, device_type)
+        if rule is None:
+            return True
+        if rule.mode == "deadband":
+            return self._deadband(device_id, rule, reading)
+
+        window = self._windows.get(device_id)
+        if window is None:
+            window = _Window(rule, device_type)
+            window.handle = asyncio.get_running_loop().call_later(
+                rule.window, self._close, device_id
+            )
+            self._windows[device_id] = window
+        window.add(reading, correlation_id)
+        return False
+
+    def _deadband(
+        self, device_id: int, rule: DownsampleRule, reading: dict[Any, Any]
+    ) -> bool:
+        now = monotonic()
+        last = self._published.get(device_id)
+        if last is not None:
+            published_at, published = last
+            heartbeat = rule.window > 0 and now - published_at >= rule.window
+            if not heartbeat and not _changed(published, reading, rule.threshold):
+                return False
+            self._published.move_to_end(device_id)
+        self._published[device_id] = (now, dict(reading))
+        if len(self._published) > self._max_devices:
+            self._published.popitem(last=False)
+        return True
+
+    def _close(self, device_id: int) -> None:
+        window = self._windows.pop(device_id, None)
+        if window is None:
+            return
+        task = asyncio.get_running_loop().create_task(
+            self._publish(
+                device_id, window.device_type, window.result(), window.correlation_id
+            )
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _publish(
+        self,
+        device_id: int,
+        device_type: str | None,
+        reading: dict[Any, Any],
+        correlation_id: str,
+    ) -> None:
+        try:
+            await self._emit(device_id, device_type, reading, correlation_id)
+        except Exception as e:
+            # The device was already answered, the reading of this window is lost
+            logger.error(
+                "Downsampled reading of device %s not published: %s", device_id, e
+            )
+
+    async def flush(self) -> None:
+        """Emits the open windows now, on shutdown."""
+        for device_id, window in list(self._windows.items()):
+            if window.handle is not None:
+                window.handle.cancel()
+            self._close(device_id)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def clear(self) -> None:
+        for window in self._windows.values():
+            if window.handle is not None:
+                window.handle.cancel()
+        self._windows.clear()
+        self._published.clear()
+
+
+def _changed(
+    published: dict[Any, Any], reading: dict[Any, Any], threshold: float
+) -> bool:
+    if published.keys() != reading.keys():
+        return True
+    for field, value in reading.items():
+        previous = published[field]
+        if _is_number(value) and _is_number(previous):
+            if abs(value - previous) > threshold:
+                return True
+        elif value != previous:
+            return True
+    return False
@@ -5,6 +5,17 @@ from fastapi import HTTPException, Request
 from fastapi.exception_handlers import http_exception_handler
 from fastapi.responses import Response
 
+from src.config import settings
+
+
+class BrokerUnavailableError(Exception):
+    """The message could not be handed to the broker, the device should retry later."""
+
+    def __init__(self, reason: str, retry_after: int = settings.MESSAGES_RETRY_AFTER):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
 
 async def unhandled_exception_handler(request: Request, exc: Exception) -> Response:
     logger = logging.getLogger(f"{request.method} {request.url.path} EXCEPTION")
@@ -18,3 +29,18 @@ async def unhandled_exception_handler(request: Request, exc: Exception) -> Respo
             headers={"X-Request-ID": req_id},
         ),
     )
+
+
+async def broker_unavailable_handler(
+    request: Request, exc: BrokerUnavailableError
+) -> Response:
+    logger = logging.getLogger(f"{request.method} {request.url.path} EXCEPTION")
+    logger.warning("Broker unavailable: %s", exc.reason)
+    return await http_exception_handler(
+        request,
+        HTTPException(
+            503,
+            "Service temporarily unavailable, please retry later",
+            headers={"Retry-After": str(exc.retry_after)},
+        ),
+    )
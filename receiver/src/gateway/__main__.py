@@ -0,0 +1,68 @@
+import asyncio
+import logging
+import resource
+import signal
+
+from src.config import settings
+from src.gateway.server import Gateway
+from src.logger.setup import setup_logging_config
+from src.message_handler import MessageHandler
+from src.queues.channels import MessageChannel
+from src.queues.events import DeviceEventsConsumer
+from src.route.schemas import schema_registry
+from src.route.token_cache import token_cache
+
+try:
+    import uvloop  # type: ignore
+except ImportError:  # Installed with uvicorn[standard], the asyncio loop works too
+    uvloop = None
+
+
+def raise_open_files_limit() -> None:
+    # Every MQTT connection holds a file descriptor
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+async def main() -> None:
+    setup_logging_config()
+    logger = logging.getLogger("gateway")
+    logger.info("StartUP")
+    raise_open_files_limit()
+
+    message_channel = MessageChannel()
+    device_events = DeviceEventsConsumer(message_channel)
+    device_events.add_listener(token_cache.on_device_event)
+    device_events.add_listener(schema_registry.on_device_event)
+    message_channel.add_on_open_callback(device_events.subscribe)
+    message_channel.add_on_open_callback(schema_registry.refresh)
+    await message_channel.start()
+
+    handler = MessageHandler(message_channel)
+    gateway = Gateway(handler)
+    await gateway.start(
+        settings.GATEWAY_HOST,
+        settings.GATEWAY_MQTT_PORT or None,
+        settings.GATEWAY_UDP_PORT or None,
+    )
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+    await gateway.stop()
+    await handler.close()
+    await message_channel.stop()
+    message_channel.remove_on_open_callback(device_events.subscribe)
+    message_channel.remove_on_open_callback(schema_registry.refresh)
+    logger.info("ShutDown")
+
+
+if __name__ == "__main__":
+    if uvloop is not None:
+        uvloop.run(main())
+    else:
+        asyncio.run(main())
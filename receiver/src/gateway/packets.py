@@ -0,0 +1,183 @@
+import struct
+from dataclasses import dataclass
+
+# MQTT 3.1.1 control packet types, the high nibble of the first byte
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+PUBACK = 4
+SUBSCRIBE = 8
+SUBACK = 9
+UNSUBSCRIBE = 10
+UNSUBACK = 11
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+
+# CONNACK return codes
+ACCEPTED = 0
+UNACCEPTABLE_PROTOCOL = 1
+SERVER_UNAVAILABLE = 3
+NOT_AUTHORIZED = 5
+
+PROTOCOL_NAME = b"MQTT"
+PROTOCOL_LEVEL = 4  # 3.1.1
+
+PINGRESP_PACKET = bytes((PINGRESP << 4, 0))
+
+_UINT16 = struct.Struct(">H")
+
+
+class MQTTProtocolError(Exception):
+    pass
+
+
+@dataclass(slots=True)
+class Connect:
+    protocol: bytes
+    level: int
+    keep_alive: int
+    client_id: bytes
+    username: bytes | None = None
+    password: bytes | None = None
+
+
+@dataclass(slots=True)
+class Publish:
+    qos: int
+    topic: bytes
+    packet_id: int | None
+    payload: bytes
+
+
+def split_packet(
+    buffer: bytes | bytearray, max_size: int
+) -> tuple[int, int, int] | None:
+    """
+    Reads the fixed header at the start of the buffer. Returns (first byte, header
+    length, remaining length), or None while the header is incomplete.
+    """
+    multiplier = 1
+    length = 0
+    for i in range(1, min(5, len(buffer))):
+        byte = buffer[i]
+        length += (byte & 0x7F) * multiplier
+        if not byte & 0x80:
+            if length > max_size:
+                raise MQTTProtocolError(f"Packet of {length} bytes exceeds {max_size}")
+            return buffer[0], i + 1, length
+        multiplier *= 128
+    if len(buffer) >= 5:
+        raise MQTTProtocolError("Malformed remaining length")
+    return None
+
+
+def _read_string(data: bytes, offset: int) -> tuple[bytes, int]:
+    if offset + 2 > len(data):
+        raise MQTTProtocolError("Truncated packet")
+    (length,) = _UINT16.unpack_from(data, offset)
+    end = offset + 2 + length
+    if end > len(data):
+        raise MQTTProtocolError("Truncated packet")
+    return data[offset + 2 : end], end
+
+
+def parse_connect(data: bytes) -> Connect:
+    protocol, offset = _read_string(data, 0)
+    if offset + 4 > len(data):
+        raise MQTTProtocolError("Truncated packet")
+    level, flags = data[offset], data[offset + 1]
+    (keep_alive,) = _UINT16.unpack_from(data, offset + 2)
+    client_id, offset = _read_string(data, offset + 4)
+    connect = Connect(protocol, level, keep_alive, client_id)
+    if flags & 0x04:  # Will topic and message, not supported but skipped
+        _, offset = _read_string(data, offset)
+        _, offset = _read_string(data, offset)
+    if flags & 0x80:
+        connect.username, offset = _read_string(data, offset)
+    if flags & 0x40:
+        connect.password, offset = _read_string(data, offset)
+    return connect
+
+
+def parse_publish(flags: int, data: bytes) -> Publish:
+    qos = (flags >> 1) & 0x03
+    topic, offset = _read_string(data, 0)
+    packet_id = None
+    if qos:
+        if offset + 2 > len(data):
+            raise MQTTProtocolError("Truncated packet")
+        (packet_id,) = _UINT16.unpack_from(data, offset)
+        offset += 2
+    return Publish(qos, topic, packet_id, data[offset:])
+
+
+def parse_subscribe(data: bytes) -> tuple[int, int]:
+    """Returns (packet id, number of topic filters)."""
+    (packet_id,) = _UINT16.unpack_from(data, 0)
+    offset, count = 2, 0
+    while offset < len(data):
+        _, offset = _read_string(data, offset)
+        offset += 1  # Requested QoS
+        count += 1
+    return packet_id, count
+
+
+def _encode_length(length: int) -> bytes:
+    encoded = bytearray()
+    while True:
+        length, byte = divmod(length, 128)
+        encoded.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(encoded)
+
+
+def encode_packet(first_byte: int, body: bytes = b"") -> bytes:
+    return bytes((first_byte,)) + _encode_length(len(body)) + body
+
+
+def connack(return_code: int) -> bytes:
+    return encode_packet(CONNACK << 4, bytes((0, return_code)))
+
+
+def puback(packet_id: int) -> bytes:
+    return encode_packet(PUBACK << 4, _UINT16.pack(packet_id))
+
+
+def suback(packet_id: int, count: int) -> bytes:
+    # 0x80 for every filter, the gateway only ingests
+    return encode_packet(SUBACK << 4, _UINT16.pack(packet_id) + b"\x80" * count)
+
+
+def unsuback(packet_id: int) -> bytes:
+    return encode_packet(UNSUBACK << 4, _UINT16.pack(packet_id))
+
+
+def _string(value: bytes) -> bytes:
+    return _UINT16.pack(len(value)) + value
+
+
+def encode_connect(
+    client_id: bytes, password: bytes | None = None, keep_alive: int = 60
+) -> bytes:
+    """Client side CONNECT, for the device simulator and the tests."""
+    flags = 0x02  # Clean session
+    payload = _string(client_id)
+    if password is not None:
+        # The token goes in the password, MQTT 3.1.1 requires the username with it
+        flags |= 0xC0
+        payload += _string(b"device") + _string(password)
+    variable = (
+        _string(PROTOCOL_NAME)
+        + bytes((PROTOCOL_LEVEL, flags))
+        + _UINT16.pack(keep_alive)
+    )
+    return encode_packet(CONNECT << 4, variable + payload)
+
+
+def encode_publish(
+    topic: bytes, payload: bytes, qos: int = 0, packet_id: int = 0
+) -> bytes:
+    """Client side PUBLISH, for the device simulator and the tests."""
+    variable = _string(topic) + (_UINT16.pack(packet_id) if qos else b"")
+    return encode_packet(PUBLISH << 4 | qos << 1, variable + payload)
@@ -0,0 +1,337 @@
+import asyncio
+import logging
+import socket
+import time
+import uuid
+from typing import Any
+
+from asgi_correlation_id import correlation_id
+
+import src.gateway.packets as mqtt
+from src.config import settings
+from src.ingest import IngestResult, authenticate, ingest
+from src.message_handler import MessageHandler
+from src.models import TokenPayload
+from src.route.formats import CBOR_CONTENT_TYPE, MSGPACK_CONTENT_TYPE
+from src.route.token_cache import token_cache
+
+# The last level of the MQTT topic selects the payload format, JSON otherwise
+TOPIC_FORMATS = {b"msgpack": MSGPACK_CONTENT_TYPE, b"cbor": CBOR_CONTENT_TYPE}
+
+# Room for the MQTT variable header (topic and packet id) around the payload
+_MAX_PACKET_OVERHEAD = 64 * 1024
+
+
+class MQTTProtocol(asyncio.Protocol):
+    """
+    One MQTT 3.1.1 device connection, the subset needed to ingest: CONNECT with the
+    device token as the password, PUBLISH at QoS 0 and 1, PINGREQ and DISCONNECT.
+    SUBSCRIBE is refused and QoS 2 closes the connection.
+
+    The QoS 1 PUBACK is only sent once the message is handed to the broker, in the
+    order of the PUBLISH packets. A message the listener would reject (422, 429) is
+    dropped and acked, as MQTT 3.1.1 has no negative acknowledgement, while an
+    unavailable broker closes the connection so the device sends it again.
+    """
+
+    def __init__(self, gateway: "Gateway") -> None:
+        self._gateway = gateway
+        self._transport: asyncio.Transport | None = None
+        self._buffer = bytearray()
+        self._correlation_id = uuid.uuid4().hex
+        self._connecting = False
+        self._paused = False
+        self._in_flight = 0
+        self._last_ack: asyncio.Task[None] | None = None
+
+        self.device: TokenPayload | None = None
+        self.keep_alive = 0
+        self.connected_at = self.last_seen = time.monotonic()
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        assert isinstance(transport, asyncio.Transport)
+        self._transport = transport
+        if len(self._gateway.connections) >= settings.GATEWAY_MAX_CONNECTIONS:
+            self._gateway.logger.warning("Too many connections, refusing a new one")
+            transport.close()
+            return
+        self._gateway.connections.add(self)
+
+    def connection_lost(self, exc: Exception | None) -> None:
+        self._gateway.connections.discard(self)
+
+    def close(self) -> None:
+        if self._transport is not None:
+            self._transport.close()
+
+    def data_received(self, data: bytes) -> None:
+        self.last_seen = time.monotonic()
+        self._buffer += data
+        if not self._connecting:
+            self._process()
+
+    def _process(self) -> None:
+        max_size = settings.MAX_DECOMPRESSED_BYTES + _MAX_PACKET_OVERHEAD
+        try:
+            while not self._connecting and (
+                header := mqtt.split_packet(self._buffer, max_size)
+            ):
+                first_byte, start, length = header
+                if len(self._buffer) < start + length:
+                    return
+                data = bytes(self._buffer[start : start + length])
+                del self._buffer[: start + length]
+                self._dispatch(first_byte >> 4, first_byte & 0x0F, data)
+        except mqtt.MQTTProtocolError as e:
+            self._gateway.logger.warning("MQTT protocol error: %s", e)
+            self.close()
+
+    def _dispatch(self, packet_type: int, flags: int, data: bytes) -> None:
+        if self._transport is None or self._transport.is_closing():
+            return
+        if packet_type == mqtt.CONNECT:
+            if self.device is not None:
+                raise mqtt.MQTTProtocolError("Second CONNECT")
+            self._connect(mqtt.parse_connect(data))
+            return
+        if self.device is None:
+            raise mqtt.MQTTProtocolError("First packet must be CONNECT")
+
+        if packet_type == mqtt.PUBLISH:
+            self._publish(mqtt.parse_publish(flags, data))
+        elif packet_type == mqtt.PINGREQ:
+            self._transport.write(mqtt.PINGRESP_PACKET)
+        elif packet_type == mqtt.SUBSCRIBE:
+            self._transport.write(mqtt.suback(*mqtt.parse_subscribe(data)))
+        elif packet_type == mqtt.UNSUBSCRIBE:
+            self._transport.write(mqtt.unsuback(int.from_bytes(data[:2], "big")))
+        elif packet_type == mqtt.DISCONNECT:
+            self.close()
+
+    def _connect(self, packet: mqtt.Connect) -> None:
+        assert self._transport is not None
+        if packet.protocol != mqtt.PROTOCOL_NAME or packet.level != mqtt.PROTOCOL_LEVEL:
+            self._transport.write(mqtt.connack(mqtt.UNACCEPTABLE_PROTOCOL))
+            self.close()
+            return
+        token = packet.password or packet.username
+        self.keep_alive = packet.keep_alive
+        # The packets after CONNECT wait in the buffer until the token is validated
+        self._connecting = True
+        self._transport.pause_reading()
+        self._gateway.spawn(
+            self._authenticate(token.decode("utf-8", "replace") if token else None)
+        )
+
+    async def _authenticate(self, token: str | None) -> None:
+        assert self._transport is not None
+        device = await authenticate(token) if token else None
+        if device is None:
+            self._gateway.logger.error("MQTT connection with invalid credentials")
+            self._transport.write(mqtt.connack(mqtt.NOT_AUTHORIZED))
+            self.close()
+            return
+        self.device = device
+        self._transport.write(mqtt.connack(mqtt.ACCEPTED))
+        self._connecting = False
+        self._transport.resume_reading()
+        self._process()
+
+    def _publish(self, packet: mqtt.Publish) -> None:
+        assert self._transport is not None and self.device is not None
+        if packet.qos > 1:
+            raise mqtt.MQTTProtocolError("QoS 2 is not supported")
+        if self.device.sub is not None and token_cache.is_revoked(self.device.sub):
+            self._gateway.logger.warning(
+                "Device %s removed, closing its connection", self.device.sub
+            )
+            self.close()
+            return
+
+        media_type = TOPIC_FORMATS.get(packet.topic.rpartition(b"/")[2])
+        self._in_flight += 1
+        if self._in_flight >= settings.GATEWAY_MAX_IN_FLIGHT and not self._paused:
+            self._paused = True
+            self._transport.pause_reading()
+        task = self._gateway.spawn(self._ingest(packet, media_type, self._last_ack))
+        if packet.qos:
+            self._last_ack = task
+
+    async def _ingest(
+        self,
+        packet: mqtt.Publish,
+        media_type: str | None,
+        previous: asyncio.Task[None] | None,
+    ) -> None:
+        assert self._transport is not None and self.device is not None
+        correlation_id.set(self._correlation_id)
+        try:
+            result = await ingest(
+                self._gateway.handler, self.device, packet.payload, media_type
+            )
+            if result.status == 503:
+                self._gateway.logger.warning(
+                    "Broker unavailable, closing the connection"
+                )
+                self.close()
+                return
+            if result.status != 202:
+                self._gateway.log_rejected(self.device, result)
+            if packet.packet_id is not None:
+                if previous is not None:
+                    await asyncio.wait([previous])
+                if not self._transport.is_closing():
+                    self._transport.write(mqtt.puback(packet.packet_id))
+        finally:
+            self._in_flight -= 1
+            if self._paused and self._in_flight < settings.GATEWAY_MAX_IN_FLIGHT:
+                self._paused = False
+                if not self._connecting and not self._transport.is_closing():
+                    self._transport.resume_reading()
+
+
+class UDPProtocol(asyncio.DatagramProtocol):
+    """
+    One message per datagram: the device token, optionally followed by a space and
+    the content type, then a newline and the message. Nothing is sent back, datagrams
+    that can not be published are dropped.
+    """
+
+    def __init__(self, gateway: "Gateway") -> None:
+        self._gateway = gateway
+        self._in_flight = 0
+        self.dropped = 0
+
+    def datagram_received(self, data: bytes, addr: tuple[str | Any, int]) -> None:
+        header, separator, payload = data.partition(b"\n")
+        if not separator:
+            self.dropped += 1
+            return
+        if self._in_flight >= settings.GATEWAY_UDP_MAX_IN_FLIGHT:
+            self.dropped += 1
+            return
+        token, _, media_type = header.decode("utf-8", "replace").strip().partition(" ")
+        self._in_flight += 1
+        self._gateway.spawn(self._ingest(token, media_type or None, payload))
+
+    async def _ingest(self, token: str, media_type: str | None, payload: bytes) -> None:
+        correlation_id.set(uuid.uuid4().hex)
+        try:
+            device = await authenticate(token)
+            if device is None:
+                self.dropped += 1
+                self._gateway.logger.error("UDP datagram with invalid credentials")
+                return
+            result = await ingest(self._gateway.handler, device, payload, media_type)
+            if result.status != 202:
+                self.dropped += 1
+                self._gateway.log_rejected(device, result)
+        finally:
+            self._in_flight -= 1
+
+
+class Gateway:
+    """
+    MQTT and UDP ingest front end for the devices that can not use HTTPS. The messages
+    go through the same validation and MessageHandler publish as the HTTP listener.
+    The connections are plain asyncio protocols, with a single task sweeping the idle
+    ones, to keep each of them cheap.
+    """
+
+    def __init__(self, handler: MessageHandler) -> None:
+        self.handler = handler
+        self.connections: set[MQTTProtocol] = set()
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self._tasks: set[asyncio.Task[Any]] = set()
+        self._mqtt_server: asyncio.Server | None = None
+        self._udp_transport: asyncio.DatagramTransport | None = None
+        self._udp_protocol: UDPProtocol | None = None
+        self._sweeper: asyncio.Task[None] | None = None
+
+    @property
+    def mqtt_port(self) -> int | None:
+        if self._mqtt_server is None:
+            return None
+        return int(self._mqtt_server.sockets[0].getsockname()[1])
+
+    @property
+    def udp_port(self) -> int | None:
+        if self._udp_transport is None:
+            return None
+        return int(self._udp_transport.get_extra_info("sockname")[1])
+
+    def spawn(self, coroutine: Any) -> asyncio.Task[Any]:
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def log_rejected(self, device: TokenPayload, result: IngestResult) -> None:
+        self.logger.warning(
+            "Message of device %s dropped, %s: %s",
+            device.sub,
+            result.status,
+            result.detail,
+        )
+
+    async def start(
+        self,
+        host: str = settings.GATEWAY_HOST,
+        mqtt_port: int | None = settings.GATEWAY_MQTT_PORT,
+        udp_port: int | None = settings.GATEWAY_UDP_PORT,
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        if mqtt_port is not None:
+            self._mqtt_server = await loop.create_server(
+                lambda: MQTTProtocol(self), host, mqtt_port, backlog=4096
+            )
+            self.logger.info("MQTT listening on %s:%s", host, self.mqtt_port)
+        if udp_port is not None:
+            (
+                self._udp_transport,
+                self._udp_protocol,
+            ) = await loop.create_datagram_endpoint(
+                lambda: UDPProtocol(self), local_addr=(host, udp_port)
+            )
+            sock = self._udp_transport.get_extra_info("socket")
+            sock.setsockopt(
+                socket.SOL_SOCKET, socket.SO_RCVBUF, settings.GATEWAY_UDP_RECEIVE_BUFFER
+            )
+            self.logger.info("UDP listening on %s:%s", host, self.udp_port)
+        self._sweeper = loop.create_task(self._sweep())
+
+    async def stop(self) -> None:
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+        if self._mqtt_server is not None:
+            self._mqtt_server.close()
+        for connection in list(self.connections):
+            connection.close()
+        if self._udp_transport is not None:
+            self._udp_transport.close()
+        if self._tasks:
+            await asyncio.wait(
+                list(self._tasks), timeout=settings.MESSAGES_CONFIRM_TIMEOUT
+            )
+        if self._mqtt_server is not None:
+            await self._mqtt_server.wait_closed()
+        self.logger.info("Gateway stopped")
+
+    async def _sweep(self) -> None:
+        """Closes the connections that did not CONNECT in time or outlived their keep alive."""
+        while True:
+            await asyncio.sleep(settings.GATEWAY_SWEEP_INTERVAL)
+            now = time.monotonic()
+            for connection in list(self.connections):
+                if connection.device is None:
+                    expired = (
+                        now - connection.connected_at > settings.GATEWAY_CONNECT_TIMEOUT
+                    )
+                else:
+                    # The device must send something within 1.5 times its keep alive
+                    expired = bool(connection.keep_alive) and (
+                        now - connection.last_seen > connection.keep_alive * 1.5
+                    )
+                if expired:
+                    connection.close()
@@ -0,0 +1,112 @@
+"""
+Simulates devices sending messages to the MQTT/UDP gateway, to try it locally:
+
+    python -m src.gateway.simulate --devices 1000 --messages 10 --protocol mqtt
+
+The device tokens are signed with the local SECRET_KEY, for the device ids from
+--first-device on. Unknown device ids pass the gateway and are only discarded by
+the handler, so any range of ids can load the gateway.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import src.gateway.packets as mqtt
+from src.config import settings
+from src.route.dependencies import create_device_access_token
+
+
+async def mqtt_device(
+    host: str, port: int, device_id: int, messages: int, interval: float, qos: int
+) -> int:
+    reader, writer = await asyncio.open_connection(host, port)
+    token = create_device_access_token(device_id).encode()
+    writer.write(mqtt.encode_connect(f"device-{device_id}".encode(), token))
+    connack = await reader.readexactly(4)
+    if connack[3] != mqtt.ACCEPTED:
+        writer.close()
+        return 0
+
+    for n in range(messages):
+        payload = json.dumps({"device": device_id, "n": n, "ts": time.time()}).encode()
+        writer.write(
+            mqtt.encode_publish(b"devices/readings", payload, qos, n % 65535 + 1)
+        )
+        if qos:
+            await reader.readexactly(4)  # PUBACK
+        else:
+            await writer.drain()
+        if interval:
+            await asyncio.sleep(interval)
+
+    writer.write(mqtt.encode_packet(mqtt.DISCONNECT << 4))
+    await writer.drain()
+    writer.close()
+    return messages
+
+
+async def udp_device(
+    host: str, port: int, device_id: int, messages: int, interval: float
+) -> int:
+    loop = asyncio.get_running_loop()
+    transport, _ = await loop.create_datagram_endpoint(
+        asyncio.DatagramProtocol, remote_addr=(host, port)
+    )
+    token = create_device_access_token(device_id).encode()
+    for n in range(messages):
+        payload = json.dumps({"device": device_id, "n": n, "ts": time.time()}).encode()
+        transport.sendto(token + b"\n" + payload)
+        await asyncio.sleep(interval)
+    transport.close()
+    return messages
+
+
+async def simulate(args: argparse.Namespace) -> None:
+    started = time.monotonic()
+    devices = range(args.first_device, args.first_device + args.devices)
+    if args.protocol == "mqtt":
+        port = args.port or settings.GATEWAY_MQTT_PORT
+        jobs = [
+            mqtt_device(args.host, port, d, args.messages, args.interval, args.qos)
+            for d in devices
+        ]
+    else:
+        port = args.port or settings.GATEWAY_UDP_PORT
+        jobs = [
+            udp_device(args.host, port, d, args.messages, args.interval)
+            for d in devices
+        ]
+
+    results = await asyncio.gather(*jobs, return_exceptions=True)
+    elapsed = time.monotonic() - started
+    sent = sum(r for r in results if isinstance(r, int))
+    failed = sum(1 for r in results if isinstance(r, BaseException))
+    print(
+        f"{len(results)} devices, {failed} failed, {sent} messages in {elapsed:.2f}s ({sent / elapsed:.0f}/s)"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--protocol", choices=("mqtt", "udp"), default="mqtt")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--first-device", type=int, default=1)
+    parser.add_argument("--messages", type=int, default=10, help="messages per device")
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=0.0,
+        help="seconds between the messages of a device",
+    )
+    parser.add_argument("--qos", type=int, choices=(0, 1), default=1)
+    asyncio.run(simulate(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
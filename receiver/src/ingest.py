@@ -0,0 +1,79 @@
+import logging
+from dataclasses import dataclass
+
+from fastapi import HTTPException
+
+import src.route.dependencies as deps
+from src.config import settings
+from src.errors import BrokerUnavailableError
+from src.message_handler import MessageHandler
+from src.models import TokenPayload
+from src.route.priority import is_alarm
+from src.route.rate_limit import rate_limiter
+from src.route.schemas import schema_registry
+from src.route.token_cache import token_cache
+
+logger = logging.getLogger("ingest")
+
+
+@dataclass(slots=True)
+class IngestResult:
+    """The outcome of one device message, as the HTTP status the listener would answer."""
+
+    status: int
+    detail: str | None = None
+    retry_after: float | None = None
+
+
+async def authenticate(token: str) -> TokenPayload | None:
+    """Validates a device token like the listener does, None when it is rejected."""
+    try:
+        device = await deps.validate_device(token)
+    except HTTPException:
+        return None
+    return device if device.sub is not None else None
+
+
+async def ingest(
+    handler: MessageHandler,
+    device: TokenPayload,
+    body: bytes,
+    media_type: str | None = None,
+) -> IngestResult:
+    """
+    Rate limits, parses and publishes one message of an authenticated device, for the
+    listeners that are not plain HTTP requests (WebSocket frames, MQTT, UDP).
+    """
+    assert device.sub is not None
+    if len(body) > settings.MAX_DECOMPRESSED_BYTES:
+        return IngestResult(
+            413, f"Message exceeds {settings.MAX_DECOMPRESSED_BYTES} bytes"
+        )
+    # Per message, a session outlives the type changes of its device
+    device_type = token_cache.device_type(device.sub, device.type)
+    retry_after = rate_limiter.acquire(device.sub, device_type)
+    if retry_after:
+        return IngestResult(429, "Too many messages, retry later", retry_after)
+    try:
+        payload = deps.parse_payload(body, body, None, media_type)
+        error = schema_registry.validate(device.sub, payload)
+        if error is not None:
+            return IngestResult(
+                422, f"Body does not match the device type schema: {error}"
+            )
+        await handler.process_message(
+            device.sub,
+            payload,
+            alarm=is_alarm(device_type, None, payload),
+            device_type=device_type,
+        )
+    except HTTPException as e:
+        return IngestResult(e.status_code, e.detail)
+    except BrokerUnavailableError as e:
+        return IngestResult(
+            503, "Service temporarily unavailable, please retry later", e.retry_after
+        )
+    except Exception as e:
+        logger.critical("Unhandled exception: %s", e)
+        return IngestResult(500, "Internal server error")
+    return IngestResult(202)
@@ -5,14 +5,23 @@ from contextlib import asynccontextmanager
 from asgi_correlation_id import CorrelationIdMiddleware
 from asgi_correlation_id.middleware import is_valid_uuid4
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 
 import src.doc as doc
 from src.config import settings
-from src.errors import unhandled_exception_handler
+from src.errors import (
+    BrokerUnavailableError,
+    broker_unavailable_handler,
+    unhandled_exception_handler,
+)
 from src.logger.setup import setup_logging_config
+from src.message_handler import MessageHandler
+from src.queues.channels import MessageChannel
+from src.queues.events import DeviceEventsConsumer
 from src.route.router import router
-
-# from src.message_handler import MessageHandler
+from src.route.schemas import schema_registry
+from src.route.token_cache import token_cache
+from src.route.websocket import ws_router
 
 
 @asynccontextmanager
@@ -20,8 +29,24 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
     setup_logging_config()
     logger = logging.getLogger("lifespan")
     logger.info("StartUP")
-    # message_handler = MessageHandler()
-    yield  # {"message_handler": message_handler}
+    # Every worker opens its own connection here, after the server forks it
+    message_channel = MessageChannel()
+    app.state.message_channel = message_channel
+    app.state.message_handler = MessageHandler(message_channel)
+    device_events = DeviceEventsConsumer(message_channel)
+    device_events.add_listener(token_cache.on_device_event)
+    device_events.add_listener(schema_registry.on_device_event)
+    message_channel.add_on_open_callback(device_events.subscribe)
+    # After subscribing, so no schema nor type change is missed between the load and the events
+    message_channel.add_on_open_callback(schema_registry.refresh)
+    message_channel.add_on_open_callback(token_cache.refresh)
+    await message_channel.start()
+    yield
+    await app.state.message_handler.close()
+    await message_channel.stop()
+    message_channel.remove_on_open_callback(device_events.subscribe)
+    message_channel.remove_on_open_callback(schema_registry.refresh)
+    message_channel.remove_on_open_callback(token_cache.refresh)
     logger.info("ShutDown")
 
 
@@ -38,10 +63,14 @@ app = FastAPI(
     root_path=settings.RECEIVER_API_V1_STR,
     root_path_in_servers=True,
     lifespan=lifespan,
-    exception_handlers={Exception: unhandled_exception_handler},
+    exception_handlers={
+        Exception: unhandled_exception_handler,
+        BrokerUnavailableError: broker_unavailable_handler,
+    },
 )
 
 app.include_router(router)
+app.include_router(ws_router)
 app.add_middleware(
     CorrelationIdMiddleware,
     header_name="X-Request-ID",
@@ -52,6 +81,20 @@ app.add_middleware(
 )
 
 
+# Probes -------------------------------------------------------------------
+@app.get("/ready", include_in_schema=False)
+async def ready(request: Request) -> JSONResponse:
+    """
+    Readiness probe: 200 once the broker channel of this worker is open, 503 while it
+    is (re)connecting. The receiver has no database, only the broker is checked.
+    """
+    broker = request.app.state.message_channel.status()
+    return JSONResponse(
+        {"ready": broker, "broker": broker},
+        status_code=200 if broker else 503,
+    )
+
+
 # Test route ---------------------------------------------------------------
 @app.get("/test", include_in_schema=False)
 async def root(request: Request) -> dict[str, str]:
@@ -1,17 +1,26 @@
 import logging
+from collections.abc import Callable
 from typing import Annotated, Any
 
 from asgi_correlation_id import correlation_id
 from fastapi import Depends
+from fastapi.requests import HTTPConnection
+from pika.exceptions import AMQPError  # type: ignore
 
-from src.queues.channels import MessageChannel, get_message_channel
+from src.config import DeliveryMode
+from src.delivery import delivery_policy
+from src.downsampling import Downsampler
+from src.errors import BrokerUnavailableError
+from src.models import BatchItemResult, RawMessage
+from src.queues.channels import MessageChannel
 
 logger = logging.getLogger("MessageHandler")
 
 
 class MessageHandler:
-    def __init__(self) -> None:
-        self._channel: MessageChannel = get_message_channel()
+    def __init__(self, channel: MessageChannel) -> None:
+        self._channel: MessageChannel = channel
+        self._downsampler = Downsampler(self._emit)
 
         # self.connect()
         # if self._connection.status() and self._declare_exchange:
@@ -22,24 +31,181 @@ class MessageHandler:
             "device_id": device_id,
         }
 
-    def process_message(self, device_id: int, body: dict[Any, Any]) -> None:
+    async def process_message(
+        self,
+        device_id: int,
+        body: dict[Any, Any] | RawMessage,
+        message_id: str | None = None,
+        alarm: bool = False,
+        device_type: str | None = None,
+    ) -> None:
+        """
+        Publishes a device message. A parsed body gets the device_id merged in, a raw
+        message is forwarded untouched with the device_id in the message headers.
+        The `message_id` goes as the AMQP message_id, for the handler to skip redeliveries.
+        An `alarm` takes the priority lane. The other parsed bodies go through the
+        downsampling rule of the device (or its `device_type`), if it has one.
+        The delivery mode of the device picks the publish path, alarms are never transient.
+        """
         logger.info("Processing message for device %d", device_id)
+        if (
+            self._downsampler
+            and not alarm
+            and not isinstance(body, RawMessage)
+            and not self._downsampler.offer(
+                device_id, device_type, body, correlation_id.get() or ""
+            )
+        ):
+            logger.debug("Message of device %d downsampled", device_id)
+            return
         try:
             headers = self._create_headers(device_id)
+            routing_key = self._channel.routing_key(device_id, alarm)
+            delivery = self._delivery(device_id, device_type, alarm)
+            if isinstance(body, RawMessage):
+                await self._channel.publish(
+                    body.body,
+                    correlation_id=correlation_id.get() or "",
+                    content_type=body.content_type,
+                    headers=headers,
+                    routing_key=routing_key,
+                    content_encoding=body.content_encoding,
+                    message_id=message_id,
+                    delivery=delivery,
+                )
+                return
             body.update(headers)
-            self._channel.publish(
+            await self._channel.publish(
                 body,
                 correlation_id=correlation_id.get() or "",
                 content_type="application/json",
+                routing_key=routing_key,
+                message_id=message_id,
+                delivery=delivery,
             )
-        except AttributeError as e:
+        except BrokerUnavailableError as e:
+            logger.error("Message not published: %s", e)
+            raise
+        except (AMQPError, AttributeError) as e:
             logger.error("Error publishing message: %s", e)
-        except Exception as e:
-            logger.error("Error processing message: %s", e)
+            raise BrokerUnavailableError(str(e))
+
+    def _delivery(
+        self, device_id: int, device_type: str | None, alarm: bool = False
+    ) -> DeliveryMode:
+        delivery = delivery_policy.mode(device_id, device_type)
+        return "confirmed" if alarm and delivery == "transient" else delivery
+
+    async def _emit(
+        self,
+        device_id: int,
+        device_type: str | None,
+        body: dict[Any, Any],
+        correlation: str,
+    ) -> None:
+        """Publishes the reading a downsampling window ended with."""
+        body.update(self._create_headers(device_id))
+        await self._channel.publish(
+            body,
+            correlation_id=correlation,
+            content_type="application/json",
+            routing_key=self._channel.routing_key(device_id),
+            delivery=self._delivery(device_id, device_type),
+        )
+
+    async def close(self) -> None:
+        """Publishes the readings held in the downsampling windows."""
+        await self._downsampler.flush()
+
+    async def process_batch(
+        self,
+        device_id: int,
+        items: list[Any],
+        validate: Callable[[dict[Any, Any]], str | None] | None = None,
+        classify: Callable[[dict[Any, Any]], bool] | None = None,
+        device_type: str | None = None,
+    ) -> list[BatchItemResult]:
+        """
+        Publishes the items that are JSON objects, and pass `validate` when given (it
+        returns why an item is rejected), reporting the result of each item. The items
+        `classify` finds to be alarms are published first, to the priority lane.
+        """
+        logger.info(
+            "Processing batch of %d messages for device %d", len(items), device_id
+        )
+        results: list[BatchItemResult] = []
+        # Accepted items and their results, telemetry (False) and alarms (True)
+        lanes: dict[bool, list[tuple[dict[Any, Any], BatchItemResult]]] = {
+            False: [],
+            True: [],
+        }
+        headers = self._create_headers(device_id)
+        for index, item in enumerate(items):
+            error = (
+                validate(item)
+                if validate is not None and isinstance(item, dict)
+                else None
+            )
+            if error is not None:
+                results.append(
+                    BatchItemResult(index=index, status="rejected", detail=error)
+                )
+            elif isinstance(item, dict):
+                alarm = classify is not None and classify(item)
+                item.update(headers)
+                result = BatchItemResult(index=index, status="accepted")
+                lanes[alarm].append((item, result))
+                results.append(result)
+            else:
+                results.append(
+                    BatchItemResult(
+                        index=index,
+                        status="rejected",
+                        detail="Item must be a JSON object",
+                    )
+                )
+
+        handed = False
+        for alarm in (True, False):
+            lane = lanes[alarm]
+            if alarm and not lane:
+                continue
+            published = 0
+            try:
+                published = await self._channel.publish_batch(
+                    [item for item, _ in lane],
+                    correlation_id=correlation_id.get() or "",
+                    content_type="application/json",
+                    routing_key=self._channel.routing_key(device_id, alarm),
+                    delivery=self._delivery(device_id, device_type, alarm),
+                )
+            # Raised only while nothing was handed to the broker, else the device would
+            # send the handed items again
+            except BrokerUnavailableError as e:
+                logger.error("Batch not published: %s", e)
+                if not handed:
+                    raise
+            except (AMQPError, AttributeError) as e:
+                logger.error("Error publishing batch: %s", e)
+                if not handed:
+                    raise BrokerUnavailableError(str(e))
+            except Exception as e:
+                logger.error("Error processing batch: %s", e)
+                if not handed:
+                    raise
+            handed = handed or published > 0
+
+            # Whatever was not handed to the broker is reported back, so the device
+            # can retry only those items.
+            for _, result in lane[published:]:
+                result.status = "rejected"
+                result.detail = "Could not be published, retry later"
+        return results
 
 
-def get_handler() -> MessageHandler:
-    return MessageHandler()
+def get_handler(connection: HTTPConnection) -> MessageHandler:
+    # Built once per worker process, with its channel, in the app lifespan
+    return connection.app.state.message_handler
 
 
 message_handler = Annotated[MessageHandler, Depends(get_handler)]
@@ -1,6 +1,18 @@
+from dataclasses import dataclass
+from typing import Literal
+
 from pydantic import BaseModel
 
 
+@dataclass(slots=True)
+class RawMessage:
+    """A device message forwarded untouched, compressed with `content_encoding` if set."""
+
+    body: bytes
+    content_encoding: str | None = None
+    content_type: str = "application/json"
+
+
 class Token(BaseModel):
     access_token: str
     token_type: str = "bearer"
@@ -8,6 +20,7 @@ class Token(BaseModel):
 
 class TokenPayload(BaseModel):
     sub: int | None = None
+    type: str | None = None  # The device type, see TokenCache.device_type
 
 
 class DefaultResponseMessage(BaseModel):
@@ -16,3 +29,16 @@ class DefaultResponseMessage(BaseModel):
 
 class MessageTest(BaseModel):
     message: str
+
+
+class BatchItemResult(BaseModel):
+    index: int
+    status: Literal["accepted", "rejected"]
+    detail: str | None = None
+
+
+class BatchResponseMessage(BaseModel):
+    message: str
+    accepted: int
+    rejected: int
+    results: list[BatchItemResult]
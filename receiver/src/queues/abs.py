@@ -1,46 +1,11 @@
-from abc import ABC, ABCMeta, abstractmethod
-from threading import Lock
+from abc import ABC, abstractmethod
 
 from pika.channel import Channel  # type: ignore
 
 
-class SingletonMetaConnection(ABCMeta):
-    _instances = {}  # type: ignore
-    _lock: Lock = Lock()
-
-    def __call__(cls, *args, **kwargs):  # type: ignore
-        with cls._lock:
-            if cls not in cls._instances:
-                instance = super().__call__(*args, **kwargs)
-                cls._instances[cls] = instance
-        return cls._instances[cls]
-
-
-class SingletonMetaChannel(ABCMeta):
-    _instances = {}  # type: ignore
-    _lock: Lock = Lock()
-
-    def __call__(cls, *args, **kwargs):  # type: ignore
-        with cls._lock:
-            if cls not in cls._instances:
-                instance = super().__call__(*args, **kwargs)
-                cls._instances[cls] = instance
-        return cls._instances[cls]
-
-
-class SingletonMetaChannelB(ABCMeta):
-    _instances = {}  # type: ignore
-    _lock: Lock = Lock()
-
-    def __call__(cls, *args, **kwargs):  # type: ignore
-        with cls._lock:
-            if cls not in cls._instances:
-                instance = super().__call__(*args, **kwargs)
-                cls._instances[cls] = instance
-        return cls._instances[cls]
-
-
-class ABSQueueConnectionManager(ABC, metaclass=SingletonMetaConnection):
+# The connections and channels are owned by the process that uses them, created in
+# the app lifespan after the workers fork, never shared through class level state.
+class ABSQueueConnectionManager(ABC):
     @abstractmethod
     def open_channel(self, tag: str) -> Channel: ...
 
@@ -54,7 +19,7 @@ class ABSQueueConnectionManager(ABC, metaclass=SingletonMetaConnection):
     def publish(self, call) -> None: ...  # type: ignore
 
 
-class ABSQueueChannel(ABC, Channel, metaclass=SingletonMetaChannel):  # type: ignore
+class ABSQueueChannel(ABC, Channel):  # type: ignore
     @abstractmethod
     def connect(self) -> None: ...
 
@@ -69,3 +34,22 @@ class ABSQueueChannel(ABC, Channel, metaclass=SingletonMetaChannel):  # type: ig
 
     @abstractmethod
     def status(self) -> bool: ...
+
+
+class ABSAsyncQueueChannel(ABC):
+    """The ABSQueueChannel of the channels running on the server event loop."""
+
+    @abstractmethod
+    async def connect(self) -> None: ...
+
+    @abstractmethod
+    async def setup(self) -> None: ...
+
+    @abstractmethod
+    async def publish(self, message, *args, **kwargs) -> None: ...  # type: ignore
+
+    @abstractmethod
+    async def stop(self) -> None: ...
+
+    @abstractmethod
+    def status(self) -> bool: ...
@@ -1,14 +1,33 @@
+import asyncio
 import json
 import logging
-from time import sleep
+from collections.abc import Awaitable, Callable
+from functools import cached_property
+from pathlib import Path
 from typing import Any
 
 import pika  # type: ignore
+from pika.adapters.asyncio_connection import AsyncioConnection  # type: ignore
 from pika.channel import Channel  # type: ignore
+from pika.exceptions import AMQPConnectionError  # type: ignore
+from pika.frame import Method  # type: ignore
+from pika.spec import Basic  # type: ignore
 
-from src.config import settings
-from src.queues.abs import ABSQueueChannel  # ABSQueueConnectionManager
+from src.config import DeliveryMode, settings
+from src.errors import BrokerUnavailableError
+from src.queues.abs import (  # ABSQueueConnectionManager
+    ABSAsyncQueueChannel,
+    ABSQueueChannel,
+)
+from src.queues.envelope import ENVELOPE_CONTENT_TYPE, encode_envelope
 from src.queues.manager import PublishingManager, get_queue_access
+from src.queues.sharding import (
+    SHARD_QUEUE_ARGUMENTS,
+    jump_hash,
+    shard_queue,
+    shard_routing_key,
+)
+from src.queues.spool import Spool, decode_record, encode_record
 
 
 class LogChannel(ABSQueueChannel):
@@ -20,10 +39,9 @@ class LogChannel(ABSQueueChannel):
         self._routing_key: str = settings.LOG_ROUTING_KEY
 
     def connect(self) -> None:
+        # The blocking connection and channel return once the broker opened them
         self._connection = get_queue_access()
-        sleep(1)
         self._channel = self._connection.open_channel(tag=self.__class__.__name__)
-        sleep(1)
 
     def status(self) -> bool:
         try:
@@ -77,95 +95,758 @@ def get_log_channel() -> LogChannel:
     return LogChannel()
 
 
-class MessageChannel(ABSQueueChannel):
-    def __init__(self) -> None:
-        self._connection: PublishingManager
-        self._channel: Channel
+class MessageChannel(ABSAsyncQueueChannel):
+    """
+    asyncio publisher for the device messages. It runs on the server event loop,
+    owns its own AMQP connection and a small pool of channels, and hands the
+    messages to the connection transport without blocking the request.
+    """
+
+    def __init__(self, pool_size: int = settings.MESSAGES_CHANNEL_POOL_SIZE) -> None:
+        self._connection: AsyncioConnection | None = None
+        self._channels: list[Channel] = []
+        self._pool_size = pool_size
+        self._next_channel = 0
+
         self._exchange = settings.HANDLER_EXCHANGE
         self._queue = settings.MESSAGES_QUEUE
         self._routing_key = settings.MESSAGES_ROUTING_KEY
+        self._shards = settings.MESSAGES_SHARDS
+        self._priority_lane = settings.PRIORITY_LANE
+        self._alarms_routing_key = settings.ALARMS_ROUTING_KEY
         self._declare_exchange = settings.MESSAGES_DECLARE_EXCHANGE
 
+        # Publisher confirms: every channel tracks its own delivery tags and the
+        # futures of the messages the broker has not confirmed yet.
+        self._confirms = settings.MESSAGES_PUBLISHER_CONFIRMS
+        self._confirm_window = settings.MESSAGES_CONFIRM_WINDOW
+        self._confirm_timeout = settings.MESSAGES_CONFIRM_TIMEOUT
+        self._delivery_tags: dict[int, int] = {}
+        self._unconfirmed: dict[int, dict[int, asyncio.Future[bool]]] = {}
+
+        # Coalescing: the messages wait in a buffer, for up to the linger time, and are
+        # published together in one envelope message.
+        self._coalesce = settings.MESSAGES_COALESCE
+        self._coalesce_max_items = settings.MESSAGES_COALESCE_MAX_ITEMS
+        self._coalesce_linger = settings.MESSAGES_COALESCE_LINGER
+        self._coalesced: dict[str, list[tuple[bytes, asyncio.Future[bool]]]] = {}
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._spool_tasks: set[asyncio.Task[None]] = set()
+
+        # Messages are spooled to disk while the channel is not open, and drained
+        # back in order once it recovers.
+        self._spool: Spool | None = Spool() if settings.SPOOL_ENABLED else None
+        self._drain_task: asyncio.Task[None] | None = None
+        # Messages spooled because the broker was down are in the spool, the new ones
+        # go behind them. The "spooled" delivery mode ones do not hold the others.
+        self._backlog = False
+
+        self._closing = False
+        self._reconnect_delay = 0
+        self._reconnect_task: asyncio.Task[None] | None = None
+        self._on_open_callbacks: list[Callable[[], Awaitable[None]]] = []
+
         self.logger = logging.getLogger(self.__class__.__name__)
 
-        self.connect()
-        if self._connection.status() and self._declare_exchange:
-            self.setup()
+    # --------------------------------- #
+    async def start(self) -> None:
+        self._closing = False
+        if self._spool is not None:
+            self._spool.open()
+            self._backlog = not self._spool.is_empty()
+        try:
+            await self._open()
+        except Exception as e:
+            self.logger.error(f"Error connecting to Queue: {e}")
+            self._schedule_reconnect()
 
-    def connect(self) -> None:
+    async def _open(self) -> None:
+        await self.connect()
+        if self._declare_exchange:
+            await self.setup()
+        self._reconnect_delay = 0
+        self.logger.info("Message channel ready")
+        self._schedule_drain()
+        for callback in list(self._on_open_callbacks):
+            try:
+                await callback()
+            except Exception as e:
+                self.logger.error(f"Error on connection open callback: {e}")
+
+    def add_on_open_callback(self, callback: Callable[[], Awaitable[None]]) -> None:
+        """Registers a coroutine to run every time the connection is (re)opened."""
+        self._on_open_callbacks.append(callback)
+
+    def remove_on_open_callback(self, callback: Callable[[], Awaitable[None]]) -> None:
+        if callback in self._on_open_callbacks:
+            self._on_open_callbacks.remove(callback)
+
+    async def connect(self) -> None:
         self.logger.info("Connecting to Queue")
-        self._connection = get_queue_access()
-        sleep(1)
+        loop = asyncio.get_running_loop()
+        opened: asyncio.Future[AsyncioConnection] = loop.create_future()
 
-        self.logger.info("Opening Channel")
-        self._channel = self._connection.open_channel(tag=self.__class__.__name__)
-        sleep(1)
+        def on_open(connection: AsyncioConnection) -> None:
+            if not opened.done():
+                opened.set_result(connection)
 
-    def status(self) -> bool:
+        def on_open_error(_unused_conn: AsyncioConnection, err: BaseException) -> None:
+            if not opened.done():
+                opened.set_exception(AMQPConnectionError(err))
+
+        self._connection = AsyncioConnection(
+            pika.ConnectionParameters(
+                host=settings.RABBITMQ_DNS,
+                port=settings.RABBITMQ_PORT,
+                credentials=pika.PlainCredentials(
+                    settings.RABBITMQ_USER, settings.RABBITMQ_PASSWORD
+                ),
+                heartbeat=0,
+            ),
+            on_open_callback=on_open,
+            on_open_error_callback=on_open_error,
+            on_close_callback=self._on_connection_closed,
+            custom_ioloop=loop,
+        )
+        await opened
+
+        self.logger.info(f"Opening {self._pool_size} Channels")
+        self._channels = [await self._open_channel() for _ in range(self._pool_size)]
+
+    async def _open_channel(self) -> Channel:
+        assert self._connection is not None
+        opened: asyncio.Future[Channel] = asyncio.get_running_loop().create_future()
+        self._connection.channel(on_open_callback=opened.set_result)
+        channel = await opened
+        channel.add_on_close_callback(self._on_channel_closed)
+
+        if self._confirms:
+            selected: asyncio.Future[Method] = (
+                asyncio.get_running_loop().create_future()
+            )
+            channel.confirm_delivery(
+                ack_nack_callback=self._on_delivery_confirmation,
+                callback=selected.set_result,
+            )
+            await selected
+            self._delivery_tags[channel.channel_number] = 0
+            self._unconfirmed[channel.channel_number] = {}
+        return channel
+
+    async def open_channel(self) -> Channel:
+        """Opens a plain channel, out of the publishing pool, on the connection."""
+        if self._connection is None or not self._connection.is_open:
+            raise BrokerUnavailableError("Message channel is not open")
+        opened: asyncio.Future[Channel] = asyncio.get_running_loop().create_future()
+        self._connection.channel(on_open_callback=opened.set_result)
+        return await opened
+
+    def _on_channel_closed(self, channel: Channel, reason: BaseException) -> None:
+        if channel in self._channels:
+            self._channels.remove(channel)
+        # Nothing pending on this channel will ever be confirmed.
+        for future in self._unconfirmed.pop(channel.channel_number, {}).values():
+            if not future.done():
+                future.set_result(False)
+        self._delivery_tags.pop(channel.channel_number, None)
+        if self._closing or self._connection is None or not self._connection.is_open:
+            return
+        self.logger.warning(f"Channel {channel} was closed, replacing it: {reason}")
+        asyncio.get_running_loop().create_task(self._replace_channel())
+
+    async def _replace_channel(self) -> None:
         try:
-            if self._channel.is_open:
-                return True
-        except AttributeError as e:
-            self.logger.error(f"Error checking status: {e}")
-        return False
+            self._channels.append(await self._open_channel())
+        except Exception as e:
+            self.logger.error(f"Error replacing channel: {e}")
 
-    def stop(self) -> None:
-        self._channel.close()
+    def _on_connection_closed(
+        self, _unused_conn: AsyncioConnection, reason: BaseException
+    ) -> None:
+        self._channels = []
+        if self._closing:
+            self.logger.info("Connection closed")
+        else:
+            self.logger.warning(f"Connection closed, reconnect necessary: {reason}")
+            self._schedule_reconnect()
+
+    def _schedule_reconnect(self) -> None:
+        if self._closing:
+            return
+        if self._reconnect_task is None or self._reconnect_task.done():
+            self._reconnect_task = asyncio.get_running_loop().create_task(
+                self._reconnect()
+            )
+
+    async def _reconnect(self) -> None:
+        while not self._closing and not self.status():
+            self._reconnect_delay = min(self._reconnect_delay + 1, 30)
+            self.logger.info(f"Reconnecting after {self._reconnect_delay} seconds")
+            await asyncio.sleep(self._reconnect_delay)
+            try:
+                await self._open()
+            except Exception as e:
+                self.logger.error(f"Error reconnecting to Queue: {e}")
+
+    # --------------------------------- #
+    def status(self) -> bool:
+        return (
+            self._connection is not None
+            and self._connection.is_open
+            and any(channel.is_open for channel in self._channels)
+        )
+
+    @property
+    def in_flight(self) -> int:
+        """Messages published and not confirmed by the broker yet."""
+        return sum(len(pending) for pending in self._unconfirmed.values())
+
+    def _on_delivery_confirmation(self, frame: Method) -> None:
+        pending = self._unconfirmed.get(frame.channel_number, {})
+        delivery_tag = frame.method.delivery_tag
+        acked = isinstance(frame.method, Basic.Ack)
+        if frame.method.multiple:
+            tags = [tag for tag in pending if tag <= delivery_tag]
+        else:
+            tags = [delivery_tag]
+
+        for tag in tags:
+            future = pending.pop(tag, None)
+            if future is not None and not future.done():
+                future.set_result(acked)
+        if not acked:
+            self.logger.warning(f"Broker nacked {len(tags)} message(s)")
+
+    async def stop(self) -> None:
+        self._flush()
+        self._closing = True
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+        if self._drain_task is not None:
+            self._drain_task.cancel()
+        # The messages already accepted are confirmed, or spooled, before closing
+        pending: list[asyncio.Future[Any]] = [
+            future
+            for futures in self._unconfirmed.values()
+            for future in futures.values()
+        ]
+        pending.extend(self._spool_tasks)
+        if pending:
+            self.logger.info(
+                f"Waiting for {len(pending)} confirmations and spool writes"
+            )
+            _, not_done = await asyncio.wait(pending, timeout=self._confirm_timeout)
+            if not_done:
+                self.logger.warning(f"{len(not_done)} not done in time, closing anyway")
+        if self._spool is not None:
+            await self._spool.close()
+        if self._connection is not None and not (
+            self._connection.is_closing or self._connection.is_closed
+        ):
+            self.logger.info("Closing connection")
+            self._connection.close()
+
+    async def setup(self) -> None:
+        channel = self._channels[0]
+        loop = asyncio.get_running_loop()
 
-    def setup(self) -> None:
         self.logger.info(f"Connecting to {self._exchange} exchange")
-        self._channel.exchange_declare(
+        declared: asyncio.Future[Method] = loop.create_future()
+        channel.exchange_declare(
             exchange=self._exchange,
             exchange_type="topic",
             durable=True,
+            callback=declared.set_result,
         )
+        await declared
 
-        self.logger.info(f"Connecting to {self._queue} queue")
-        self._channel.queue_declare(
-            queue=self._queue,
-            durable=True,
-            exclusive=False,
-            auto_delete=False,
-        )
+        if self._shards:
+            queues = [
+                (shard_queue(shard), shard_routing_key(shard), SHARD_QUEUE_ARGUMENTS)
+                for shard in range(self._shards)
+            ]
+        else:
+            queues = [(self._queue, self._routing_key, None)]
+        if self._priority_lane:
+            queues.append((settings.ALARMS_QUEUE, self._alarms_routing_key, None))
 
-        self.logger.info(
-            f"Binding {self._queue} to {self._exchange} with {self._routing_key}"
-        )
-        self._channel.queue_bind(
-            exchange=self._exchange,
-            queue=self._queue,
-            routing_key=self._routing_key,
-        )
+        for queue, routing_key, arguments in queues:
+            self.logger.info(f"Connecting to {queue} queue")
+            declared = loop.create_future()
+            channel.queue_declare(
+                queue=queue,
+                durable=True,
+                exclusive=False,
+                auto_delete=False,
+                arguments=arguments,
+                callback=declared.set_result,
+            )
+            await declared
+
+            self.logger.info(f"Binding {queue} to {self._exchange} with {routing_key}")
+            declared = loop.create_future()
+            channel.queue_bind(
+                exchange=self._exchange,
+                queue=queue,
+                routing_key=routing_key,
+                callback=declared.set_result,
+            )
+            await declared
 
-    def publish(
+    # --------------------------------- #
+    def routing_key(self, device_id: int, alarm: bool = False) -> str:
+        """
+        The routing key of the device messages, its shard one when sharding. The alarms
+        take the priority lane, when enabled.
+        """
+        if alarm and self._priority_lane:
+            return self._alarms_routing_key
+        if not self._shards:
+            return self._routing_key
+        return shard_routing_key(jump_hash(device_id, self._shards))
+
+    @cached_property
+    def _shard_of(self) -> dict[str, int]:
+        return {shard_routing_key(shard): shard for shard in range(self._shards)}
+
+    def _get_channel(self, routing_key: str | None = None) -> Channel:
+        """
+        Round robin over the open channels of the pool. The broker keeps the publishing
+        order only within a channel, so a shard always takes the same one: the
+        messages of each device reach its shard queue in order.
+        """
+        open_channels = [channel for channel in self._channels if channel.is_open]
+        if (
+            self._connection is None
+            or not self._connection.is_open
+            or not open_channels
+        ):
+            raise BrokerUnavailableError("Message channel is not open")
+        shard = self._shard_of.get(routing_key) if routing_key is not None else None
+        if shard is not None:
+            return open_channels[shard % len(open_channels)]
+        self._next_channel = (self._next_channel + 1) % len(open_channels)
+        return open_channels[self._next_channel]
+
+    def _reserve(self, count: int) -> None:
+        """Refuses new work while too many messages wait for the broker confirmation."""
+        if self._confirms and self.in_flight + count > self._confirm_window:
+            self.logger.warning(
+                f"Confirm window full: {self.in_flight} messages waiting for the broker"
+            )
+            raise BrokerUnavailableError("Too many messages waiting for the broker")
+
+    def _properties(
         self,
-        message: dict[Any, Any],
         correlation_id: str,
         content_type: str,
-    ) -> None:
-        properties = pika.BasicProperties(
+        headers: dict[str, Any] | None = None,
+        content_encoding: str | None = None,
+        message_id: str | None = None,
+        delivery_mode: int = 2,
+    ) -> pika.BasicProperties:
+        return pika.BasicProperties(
             app_id=settings.RECEIVER_ID,
             content_type=content_type,
-            delivery_mode=2,
+            content_encoding=content_encoding,
+            delivery_mode=delivery_mode,
             correlation_id=correlation_id,
+            message_id=message_id,
+            headers=headers,
         )
 
-        body = json.dumps(message)
-        self.logger.info(
-            f"Publishing message to exchange {self._exchange} with routing key {self._routing_key}"
+    def _send(
+        self,
+        channel: Channel,
+        body: bytes,
+        properties: pika.BasicProperties,
+        routing_key: str | None = None,
+    ) -> asyncio.Future[bool] | None:
+        channel.basic_publish(
+            exchange=self._exchange,
+            routing_key=routing_key or self._routing_key,
+            body=body,
+            properties=properties,
+            mandatory=True,
         )
+        if not self._confirms:
+            return None
 
-        self._connection.publish(
-            self._channel.basic_publish(
-                exchange=self._exchange,
-                routing_key=self._routing_key,
-                body=body.encode(),
-                properties=properties,
-                mandatory=True,
+        delivery_tag = self._delivery_tags[channel.channel_number] + 1
+        self._delivery_tags[channel.channel_number] = delivery_tag
+        future: asyncio.Future[bool] = asyncio.get_running_loop().create_future()
+        self._unconfirmed[channel.channel_number][delivery_tag] = future
+        return future
+
+    async def _wait_confirms(self, futures: list[asyncio.Future[bool]]) -> list[bool]:
+        """
+        Waits for the broker confirmations up to the confirm timeout. The futures are
+        not cancelled on timeout, they stay in the window until the broker answers.
+        """
+        if futures:
+            await asyncio.wait(futures, timeout=self._confirm_timeout)
+        return [future.done() and future.result() for future in futures]
+
+    async def publish(
+        self,
+        message: dict[Any, Any] | bytes,
+        correlation_id: str,
+        content_type: str,
+        headers: dict[str, Any] | None = None,
+        routing_key: str | None = None,
+        content_encoding: str | None = None,
+        message_id: str | None = None,
+        delivery: DeliveryMode = "confirmed",
+    ) -> None:
+        """
+        Publishes the message, a dict is serialised to JSON and bytes are sent as they
+        are, compressed with `content_encoding` if set. The `message_id` (the device
+        idempotency key) lets the handler skip the redeliveries. The `delivery` mode
+        picks the publish path, see settings.DELIVERY_MODE.
+        """
+        body = _encode(message)
+        routing_key = routing_key or self._routing_key
+        if delivery == "transient":
+            properties = self._properties(
+                correlation_id,
+                content_type,
+                headers,
+                content_encoding,
+                message_id,
+                delivery_mode=1,
             )
-        )
+            self._publish_transient([body], properties, routing_key)
+            return
+        backlog = self._should_spool()
+        if backlog or (delivery == "spooled" and self._spool is not None):
+            await self._spool_messages(
+                [body],
+                correlation_id,
+                content_type,
+                headers,
+                routing_key,
+                content_encoding,
+                message_id,
+                backlog,
+            )
+            return
+
+        if self._coalesce and routing_key != self._alarms_routing_key:
+            future: asyncio.Future[bool] | None = self._enqueue(
+                body,
+                correlation_id,
+                content_type,
+                headers,
+                routing_key,
+                content_encoding,
+                message_id,
+            )
+        else:
+            channel = self._get_channel(routing_key)
+            self._reserve(1)
+
+            self.logger.info(
+                f"Publishing message to exchange {self._exchange} with routing key {routing_key}"
+            )
+            future = self._send(
+                channel,
+                body,
+                self._properties(
+                    correlation_id, content_type, headers, content_encoding, message_id
+                ),
+                routing_key,
+            )
+
+        if future is not None:
+            [confirmed] = await self._wait_confirms([future])
+            if not confirmed:
+                raise BrokerUnavailableError("Message not confirmed by the broker")
         self.logger.info("Message processed")
 
+    async def publish_batch(
+        self,
+        messages: list[dict[Any, Any] | bytes],
+        correlation_id: str,
+        content_type: str,
+        headers: dict[str, Any] | None = None,
+        routing_key: str | None = None,
+        delivery: DeliveryMode = "confirmed",
+    ) -> int:
+        """
+        Publishes all the messages in one go on the same channel, sharing the same properties.
+        Returns how many messages were handed to the broker (and confirmed, in confirm mode), in order.
+        """
+        routing_key = routing_key or self._routing_key
+        if delivery == "transient":
+            return self._publish_transient(
+                [_encode(message) for message in messages],
+                self._properties(
+                    correlation_id, content_type, headers, delivery_mode=1
+                ),
+                routing_key,
+            )
+        backlog = self._should_spool()
+        if backlog or (delivery == "spooled" and self._spool is not None):
+            await self._spool_messages(
+                [_encode(message) for message in messages],
+                correlation_id,
+                content_type,
+                headers,
+                routing_key,
+                backlog=backlog,
+            )
+            return len(messages)
+
+        if self._coalesce and routing_key != self._alarms_routing_key:
+            futures = [
+                self._enqueue(
+                    _encode(message), correlation_id, content_type, headers, routing_key
+                )
+                for message in messages
+            ]
+            return _confirmed_prefix(await self._wait_confirms(futures))
+
+        channel = self._get_channel(routing_key)
+        self._reserve(len(messages))
+        properties = self._properties(correlation_id, content_type, headers)
+
+        self.logger.info(
+            f"Publishing batch of {len(messages)} messages to exchange {self._exchange} with routing key {routing_key}"
+        )
+        published = 0
+        pending_futures: list[asyncio.Future[bool]] = []
+        try:
+            for message in messages:
+                future = self._send(channel, _encode(message), properties, routing_key)
+                if future is not None:
+                    pending_futures.append(future)
+                published += 1
+        except Exception as e:
+            self.logger.error(f"Batch interrupted after {published} messages: {e}")
+
+        if not self._confirms:
+            return published
+
+        return _confirmed_prefix(await self._wait_confirms(pending_futures))
+
+    def _publish_transient(
+        self, bodies: list[bytes], properties: pika.BasicProperties, routing_key: str
+    ) -> int:
+        """
+        Fire and forget: the messages are not persisted by the broker, not coalesced, nor
+        spooled, and their confirmations are not waited for. Raises while the channel
+        is not open, returns how many were handed to the broker.
+        """
+        channel = self._get_channel(routing_key)
+        self._reserve(len(bodies))
+        published = 0
+        try:
+            for body in bodies:
+                self._send(channel, body, properties, routing_key)
+                published += 1
+        except Exception as e:
+            self.logger.error(f"Transient messages interrupted after {published}: {e}")
+        return published
+
+    # --------------------------------- #
+    def _enqueue(
+        self,
+        body: bytes,
+        correlation_id: str,
+        content_type: str,
+        headers: dict[str, Any] | None,
+        routing_key: str,
+        content_encoding: str | None = None,
+        message_id: str | None = None,
+    ) -> asyncio.Future[bool]:
+        """
+        Adds the message to the envelope being gathered for its routing key. The returned
+        future resolves when the envelope is confirmed by the broker (or handed to it,
+        without confirms).
+        """
+        properties: dict[str, Any] = {
+            "correlation_id": correlation_id,
+            "content_type": content_type,
+        }
+        if headers:
+            properties["headers"] = headers
+        if content_encoding:
+            properties["content_encoding"] = content_encoding
+        if message_id:
+            properties["message_id"] = message_id
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future[bool] = loop.create_future()
+        items = self._coalesced.setdefault(routing_key, [])
+        items.append((encode_record(body, properties), future))
+
+        if len(items) >= self._coalesce_max_items:
+            self._publish_envelope(routing_key, self._coalesced.pop(routing_key))
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self._coalesce_linger, self._flush)
+        return future
+
+    def _flush(self) -> None:
+        """Publishes all the gathered messages, one envelope per routing key."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        coalesced, self._coalesced = self._coalesced, {}
+        for routing_key, items in coalesced.items():
+            self._publish_envelope(routing_key, items)
+
+    def _publish_envelope(
+        self, routing_key: str, items: list[tuple[bytes, asyncio.Future[bool]]]
+    ) -> None:
+        envelope = encode_envelope(record for record, _ in items)
+        futures = [future for _, future in items]
+
+        if self._should_spool():
+            task = asyncio.get_running_loop().create_task(
+                self._spool_envelope(envelope, futures, routing_key)
+            )
+            self._spool_tasks.add(task)
+            task.add_done_callback(self._spool_tasks.discard)
+            return
+
+        try:
+            channel = self._get_channel(routing_key)
+            self._reserve(1)
+            self.logger.info(
+                f"Publishing envelope of {len(items)} messages to exchange {self._exchange} with routing key {routing_key}"
+            )
+            confirm = self._send(
+                channel,
+                envelope,
+                self._properties("", ENVELOPE_CONTENT_TYPE),
+                routing_key,
+            )
+        except Exception as e:
+            self.logger.error(f"Envelope of {len(items)} messages not published: {e}")
+            _resolve(futures, False)
+            return
+
+        if confirm is None:
+            _resolve(futures, True)
+        else:
+            confirm.add_done_callback(lambda done: _resolve(futures, done.result()))
+
+    async def _spool_envelope(
+        self, envelope: bytes, futures: list[asyncio.Future[bool]], routing_key: str
+    ) -> None:
+        try:
+            await self._spool_messages(
+                [envelope], "", ENVELOPE_CONTENT_TYPE, routing_key=routing_key
+            )
+        except Exception as e:
+            self.logger.error(f"Envelope not spooled: {e}")
+            _resolve(futures, False)
+        else:
+            _resolve(futures, True)
+
+    # --------------------------------- #
+    def _should_spool(self) -> bool:
+        # While the spool holds a backlog, the new messages go behind it to keep the order.
+        return self._spool is not None and (not self.status() or self._backlog)
+
+    async def _spool_messages(
+        self,
+        bodies: list[bytes],
+        correlation_id: str,
+        content_type: str,
+        headers: dict[str, Any] | None = None,
+        routing_key: str | None = None,
+        content_encoding: str | None = None,
+        message_id: str | None = None,
+        backlog: bool = True,
+    ) -> None:
+        assert self._spool is not None
+        header: dict[str, Any] = {
+            "correlation_id": correlation_id,
+            "content_type": content_type,
+        }
+        if headers:
+            header["headers"] = headers
+        if content_encoding:
+            header["content_encoding"] = content_encoding
+        if message_id:
+            header["message_id"] = message_id
+        if routing_key:
+            header["routing_key"] = routing_key
+        if backlog:
+            self._backlog = True
+            self.logger.warning(
+                f"Message channel not available, spooling {len(bodies)} message(s)"
+            )
+        await self._spool.append(*(encode_record(body, header) for body in bodies))
+        self._schedule_drain()
+
+    def _schedule_drain(self) -> None:
+        if self._spool is None or self._spool.is_empty() or not self.status():
+            return
+        if self._drain_task is None or self._drain_task.done():
+            self._drain_task = asyncio.get_running_loop().create_task(
+                self._drain_spool()
+            )
+
+    async def _drain_spool(self) -> None:
+        """Republishes the spooled messages in order, while the channel stays open."""
+        assert self._spool is not None
+        self.logger.info(f"Draining spool ({self._spool.size} bytes)")
+        try:
+            while not self._closing and not self._spool.is_empty():
+                await self._spool.seal()
+                for segment in self._spool.segments():
+                    await self._drain_segment(segment)
+            if self._spool.is_empty():
+                self._backlog = False
+        except Exception as e:
+            self.logger.error(f"Spool drain interrupted: {e}")
+            # Holds the task for a while, so a failing drain is not rescheduled in a loop.
+            await asyncio.sleep(settings.MESSAGES_RETRY_AFTER)
+            return
+        self.logger.info("Spool drained")
+
+    async def _drain_segment(self, segment: Path) -> None:
+        assert self._spool is not None
+        chunk: list[tuple[int, bytes]] = []
+        for end, record in self._spool.replay(segment):
+            chunk.append((end, record))
+            if len(chunk) >= settings.SPOOL_DRAIN_CHUNK:
+                await self._republish(segment, chunk)
+                chunk = []
+        if chunk:
+            await self._republish(segment, chunk)
+        self._spool.remove(segment)
+
+    async def _republish(self, segment: Path, chunk: list[tuple[int, bytes]]) -> None:
+        assert self._spool is not None
+        channel = self._get_channel()
+        futures = []
+        for _, record in chunk:
+            body, header = decode_record(record)
+            routing_key = header.pop("routing_key", None)
+            future = self._send(channel, body, self._properties(**header), routing_key)
+            if future is not None:
+                futures.append(future)
+        if not all(await self._wait_confirms(futures)):
+            raise BrokerUnavailableError("Spooled messages not confirmed by the broker")
+        self._spool.drained(segment, chunk[-1][0])
+
+
+def _encode(message: dict[Any, Any] | bytes) -> bytes:
+    return message if isinstance(message, bytes) else json.dumps(message).encode()
+
+
+def _resolve(futures: list[asyncio.Future[bool]], result: bool) -> None:
+    for future in futures:
+        if not future.done():
+            future.set_result(result)
+
 
-def get_message_channel() -> MessageChannel:
-    return MessageChannel()
+def _confirmed_prefix(results: list[bool]) -> int:
+    confirmed = 0
+    for ok in results:
+        if not ok:
+            break
+        confirmed += 1
+    return confirmed
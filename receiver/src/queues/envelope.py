@@ -0,0 +1,15 @@
+import struct
+from collections.abc import Iterable
+
+# Content type of the messages that carry several device messages, see `encode_envelope`.
+ENVELOPE_CONTENT_TYPE = "application/vnd.iot-server.envelope"
+
+_LENGTH = struct.Struct(">I")
+
+
+def encode_envelope(records: Iterable[bytes]) -> bytes:
+    """
+    Packs the records, as encoded by `encode_record` (a JSON properties line followed
+    by the body), into one message body of length-prefixed records.
+    """
+    return b"".join(_LENGTH.pack(len(record)) + record for record in records)
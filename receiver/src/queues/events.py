@@ -0,0 +1,84 @@
+import asyncio
+import json
+import logging
+from collections.abc import Callable
+from typing import Any
+
+from pika import BasicProperties  # type: ignore
+from pika.channel import Channel  # type: ignore
+from pika.frame import Method  # type: ignore
+from pika.spec import Basic  # type: ignore
+
+from src.config import settings
+from src.queues.channels import MessageChannel
+
+
+class DeviceEventsConsumer:
+    """
+    Consumes the device events published by the user API on the device events
+    fanout exchange, and hands them to the registered listeners (e.g. the token cache).
+    It subscribes on the message channel connection, every time it is (re)opened.
+    """
+
+    def __init__(self, message_channel: MessageChannel) -> None:
+        self._message_channel = message_channel
+        self._exchange = settings.DEVICE_EVENTS_EXCHANGE
+        self._listeners: list[Callable[[dict[str, Any]], None]] = []
+
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    def add_listener(self, listener: Callable[[dict[str, Any]], None]) -> None:
+        self._listeners.append(listener)
+
+    async def subscribe(self) -> None:
+        channel = await self._message_channel.open_channel()
+        loop = asyncio.get_running_loop()
+
+        self.logger.info(f"Connecting to {self._exchange} exchange")
+        declared: asyncio.Future[Method] = loop.create_future()
+        channel.exchange_declare(
+            exchange=self._exchange,
+            exchange_type="fanout",
+            durable=True,
+            callback=declared.set_result,
+        )
+        await declared
+
+        # Every receiver gets its own copy of the events
+        declared = loop.create_future()
+        channel.queue_declare(
+            queue="", exclusive=True, auto_delete=True, callback=declared.set_result
+        )
+        queue = (await declared).method.queue
+
+        declared = loop.create_future()
+        channel.queue_bind(
+            exchange=self._exchange, queue=queue, callback=declared.set_result
+        )
+        await declared
+
+        channel.basic_consume(
+            queue=queue, on_message_callback=self.on_event, auto_ack=True
+        )
+        self.logger.info(f"Consuming device events from {queue}")
+
+    def on_event(
+        self,
+        _unused_channel: Channel,
+        _unused_method: Basic.Deliver,
+        _unused_properties: BasicProperties,
+        body: bytes,
+    ) -> None:
+        try:
+            event = dict(json.loads(body))
+            self.logger.info(
+                "Device event %s %s", event["method"], event.get("device_id", "")
+            )
+        except Exception as e:
+            self.logger.error("Invalid device event: %s", e)
+            return
+        for listener in self._listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                self.logger.error("Error handling device event: %s", e)
@@ -0,0 +1,28 @@
+from src.config import settings
+
+
+def jump_hash(key: int, buckets: int) -> int:
+    """
+    Jump consistent hash (Lamping & Veach): maps the key to one of the buckets, and
+    moves only 1/n of the keys when the buckets grow from n-1 to n.
+    """
+    key &= 0xFFFFFFFFFFFFFFFF
+    bucket, jump = -1, 0
+    while jump < buckets:
+        bucket = jump
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        jump = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+def shard_queue(shard: int) -> str:
+    return f"{settings.MESSAGES_QUEUE}.{shard}"
+
+
+def shard_routing_key(shard: int) -> str:
+    return f"{settings.HANDLER_EXCHANGE}.{shard}.{settings.RECEIVER_ID}"
+
+
+# The shard queues are consumed by one handler at a time, so the order of each
+# device's messages is kept. Handlers and receivers must declare them alike.
+SHARD_QUEUE_ARGUMENTS = {"x-single-active-consumer": True}
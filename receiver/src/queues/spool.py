@@ -0,0 +1,272 @@
+import asyncio
+import fcntl
+import json
+import logging
+import mmap
+import os
+import struct
+from collections.abc import Iterator
+from pathlib import Path
+from typing import IO, Any
+
+from src.config import settings
+from src.errors import BrokerUnavailableError
+
+_LENGTH = struct.Struct(">I")
+
+
+class Spool:
+    """
+    Append-only on-disk spool for the messages that can not be published.
+
+    The messages are written to segment files as length-prefixed records. Appends
+    are grouped and fsynced together every `fsync_interval` seconds, or as soon as
+    `fsync_batch` records are pending, and `append` only returns once its record
+    is on disk. Sealed segments are replayed in order with mmap and removed once
+    drained. The drain progress of a segment is kept next to it, so a restart does
+    not publish again the records already drained.
+
+    Every worker process spools to its own `worker-N` slot of the directory, held
+    with a lock file, so a restarted worker picks up the segments of a dead one. The
+    segments of the slots no worker holds, e.g. left by a run with more workers, are
+    moved to the slot of the worker that opens next.
+    """
+
+    SUFFIX = ".seg"
+    OFFSET_SUFFIX = ".off"
+
+    def __init__(
+        self,
+        directory: str = settings.SPOOL_DIR,
+        segment_size: int = settings.SPOOL_SEGMENT_SIZE,
+        max_bytes: int = settings.SPOOL_MAX_BYTES,
+        fsync_interval: float = settings.SPOOL_FSYNC_INTERVAL,
+        fsync_batch: int = settings.SPOOL_FSYNC_BATCH,
+    ) -> None:
+        self._root = Path(directory)
+        self._directory = self._root
+        self._lock_file: IO[str] | None = None
+        self._segment_size = segment_size
+        self._max_bytes = max_bytes
+        self._fsync_interval = fsync_interval
+        self._fsync_batch = fsync_batch
+
+        self._sealed: list[Path] = []
+        self._offsets: dict[Path, int] = {}  # Drain progress of the sealed segments
+        self._active: Path | None = None
+        self._file: IO[bytes] | None = None
+        self._active_size = 0
+        self._size = 0
+        self._next_segment = 1
+
+        self._pending = 0
+        self._sync_waiter: asyncio.Future[None] | None = None
+        self._sync_now: asyncio.Event
+        self._sync_lock: asyncio.Lock
+        self._sync_task: asyncio.Task[None] | None = None
+
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    # --------------------------------- #
+    def open(self) -> None:
+        """Claims a spool slot and recovers the segments left there by a previous run."""
+        self._directory = self._claim_slot()
+        self._sealed = sorted(self._directory.glob(f"*{self.SUFFIX}"))
+        self._size = sum(segment.stat().st_size for segment in self._sealed)
+        self._next_segment = int(self._sealed[-1].stem) + 1 if self._sealed else 1
+        self._adopt_orphans()
+        if self._sealed:
+            self.logger.warning(
+                f"Recovered {len(self._sealed)} spool segments ({self._size} bytes)"
+            )
+        self._sync_now = asyncio.Event()
+        self._sync_lock = asyncio.Lock()
+        self._sync_task = asyncio.get_running_loop().create_task(self._sync_loop())
+
+    def _claim_slot(self) -> Path:
+        slot = 0
+        while True:
+            directory = self._root / f"worker-{slot}"
+            directory.mkdir(parents=True, exist_ok=True)
+            lock_file = open(directory / ".lock", "w")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                slot += 1
+                continue
+            self._lock_file = lock_file
+            self.logger.info(f"Spooling to {directory}")
+            return directory
+
+    def _adopt_orphans(self) -> None:
+        for directory in sorted(self._root.glob("worker-*")):
+            if directory == self._directory or not directory.is_dir():
+                continue
+            with open(directory / ".lock", "w") as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # Held by a running worker
+                for segment in sorted(directory.glob(f"*{self.SUFFIX}")):
+                    target = self._directory / f"{self._next_segment:016d}{self.SUFFIX}"
+                    self._next_segment += 1
+                    # The segment first: a crash in between only replays it from the start
+                    os.replace(segment, target)
+                    offset = self._offset_path(segment)
+                    if offset.exists():
+                        os.replace(offset, self._offset_path(target))
+                    self._sealed.append(target)
+                    self._size += target.stat().st_size
+                    self.logger.warning(f"Adopted spool segment {segment}")
+
+    async def close(self) -> None:
+        if self._sync_task is None:
+            return
+        self._sync_task.cancel()
+        self._sync_task = None
+        await self.seal()
+        if self._lock_file is not None:
+            self._lock_file.close()  # Releases the slot
+            self._lock_file = None
+
+    def is_empty(self) -> bool:
+        return not self._sealed and self._active_size == 0
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    # --------------------------------- #
+    async def append(self, *records: bytes) -> None:
+        """Appends the records, in order, and waits until they are fsynced with their group."""
+        frames = b"".join(_LENGTH.pack(len(record)) + record for record in records)
+        if self._size + len(frames) > self._max_bytes:
+            raise BrokerUnavailableError("Spool is full")
+
+        if self._file is not None and self._active_size >= self._segment_size:
+            await self.seal(full_only=True)
+        if self._file is None:
+            self._open_segment()
+        assert self._file is not None
+
+        self._file.write(frames)
+        self._active_size += len(frames)
+        self._size += len(frames)
+
+        if self._sync_waiter is None:
+            self._sync_waiter = asyncio.get_running_loop().create_future()
+        waiter = self._sync_waiter
+        self._pending += len(records)
+        if self._pending >= self._fsync_batch:
+            self._sync_now.set()
+        await asyncio.shield(waiter)
+
+    def _open_segment(self) -> None:
+        self._active = self._directory / f"{self._next_segment:016d}{self.SUFFIX}"
+        self._next_segment += 1
+        self._offset_path(self._active).unlink(missing_ok=True)  # Left by a crash
+        self._file = open(self._active, "ab")
+        self._active_size = 0
+
+    async def _sync_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._sync_now.wait(), self._fsync_interval)
+            except TimeoutError:
+                pass
+            self._sync_now.clear()
+            if self._sync_waiter is not None:
+                try:
+                    await self.sync()
+                except Exception:
+                    pass  # Already logged, the waiting appends got the error
+
+    async def sync(self) -> None:
+        async with self._sync_lock:
+            await self._sync()
+
+    async def _sync(self) -> None:
+        waiter, self._sync_waiter = self._sync_waiter, None
+        self._pending = 0
+        try:
+            if self._file is not None:
+                self._file.flush()
+                await asyncio.to_thread(os.fsync, self._file.fileno())
+        except Exception as e:
+            self.logger.error(f"Error syncing spool: {e}")
+            if waiter is not None and not waiter.done():
+                waiter.set_exception(BrokerUnavailableError("Spool write failed"))
+            raise
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    async def seal(self, full_only: bool = False) -> None:
+        """Closes the active segment, so it can be drained."""
+        async with self._sync_lock:
+            if self._file is None or (
+                full_only and self._active_size < self._segment_size
+            ):
+                return
+            await self._sync()
+            assert self._active is not None
+            self._file.close()
+            self._file = None
+            if self._active_size:
+                self._sealed.append(self._active)
+            else:
+                self._active.unlink(missing_ok=True)
+            self._active = None
+            self._active_size = 0
+
+    # --------------------------------- #
+    def segments(self) -> list[Path]:
+        return list(self._sealed)
+
+    def replay(self, segment: Path) -> Iterator[tuple[int, bytes]]:
+        """Yields (end offset, record) for each record after the drained offset."""
+        offset = self._offsets.get(segment)
+        if offset is None:
+            offset_path = self._offset_path(segment)
+            offset = int(offset_path.read_text()) if offset_path.exists() else 0
+        with open(segment, "rb") as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                while offset + _LENGTH.size <= len(mapped):
+                    (length,) = _LENGTH.unpack_from(mapped, offset)
+                    end = offset + _LENGTH.size + length
+                    if end > len(mapped):
+                        self.logger.error(
+                            f"Truncated record in {segment.name}, skipping the rest"
+                        )
+                        break
+                    yield end, mapped[offset + _LENGTH.size : end]
+                    offset = end
+
+    def drained(self, segment: Path, offset: int) -> None:
+        self._offsets[segment] = offset
+        # Not fsynced: lost in a crash, the last records drained are published again
+        offset_path = self._offset_path(segment)
+        temporary = offset_path.with_suffix(".tmp")
+        temporary.write_text(str(offset))
+        os.replace(temporary, offset_path)
+
+    def remove(self, segment: Path) -> None:
+        self._size -= segment.stat().st_size
+        segment.unlink()
+        self._offset_path(segment).unlink(missing_ok=True)
+        self._sealed.remove(segment)
+        self._offsets.pop(segment, None)
+
+    def _offset_path(self, segment: Path) -> Path:
+        return segment.with_suffix(self.OFFSET_SUFFIX)
+
+
+def encode_record(body: bytes, properties: dict[str, Any]) -> bytes:
+    return json.dumps(properties).encode() + b"\n" + body
+
+
+def decode_record(record: bytes) -> tuple[bytes, dict[str, Any]]:
+    header, _, body = record.partition(b"\n")
+    return body, json.loads(header)
@@ -0,0 +1,70 @@
+from collections import OrderedDict
+from time import monotonic
+
+from src.config import settings
+
+
+class DedupeWindow:
+    """
+    The message ids (idempotency keys) accepted from each device in the last `window`
+    seconds, to drop the retries of a message already published.
+
+    The ids are kept in the order they were accepted, so the expired ones are always
+    at the front. It holds at most `max_keys` ids, above it the oldest are dropped
+    first, shortening the window instead of growing without bound.
+
+    The ids of the messages being published are pending, see begin and end, so a
+    retry sent meanwhile is not published twice.
+    """
+
+    def __init__(
+        self,
+        window: float = settings.DEDUPE_WINDOW,
+        max_keys: int = settings.DEDUPE_MAX_KEYS,
+    ) -> None:
+        self._window = window
+        self._max_keys = max_keys
+        self._keys: OrderedDict[tuple[int, str], float] = (
+            OrderedDict()
+        )  # key -> expires
+        self._pending: set[tuple[int, str]] = set()
+
+    def seen(self, device_id: int, message_id: str) -> bool:
+        if self._window <= 0:
+            return False
+        expires = self._keys.get((device_id, message_id))
+        return expires is not None and expires >= monotonic()
+
+    def add(self, device_id: int, message_id: str) -> None:
+        if self._window <= 0:
+            return
+        now = monotonic()
+        self._keys[(device_id, message_id)] = now + self._window
+        self._keys.move_to_end((device_id, message_id))
+        while self._keys and (
+            len(self._keys) > self._max_keys or next(iter(self._keys.values())) < now
+        ):
+            self._keys.popitem(last=False)
+
+    def pending(self, device_id: int, message_id: str) -> bool:
+        return (device_id, message_id) in self._pending
+
+    def begin(self, device_id: int, message_id: str) -> None:
+        if self._window > 0:
+            self._pending.add((device_id, message_id))
+
+    def end(self, device_id: int, message_id: str, accepted: bool) -> None:
+        """Accepted, the id is seen from now on; else its retry will be published."""
+        self._pending.discard((device_id, message_id))
+        if accepted:
+            self.add(device_id, message_id)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def clear(self) -> None:
+        self._keys.clear()
+        self._pending.clear()
+
+
+dedupe_window = DedupeWindow()
@@ -1,4 +1,6 @@
+import json
 import logging
+import math
 from typing import Annotated, Any
 
 import jwt
@@ -7,7 +9,23 @@ from jwt.exceptions import InvalidTokenError
 from pydantic import ValidationError
 
 from src.config import settings
-from src.models import DefaultResponseMessage, TokenPayload
+from src.models import DefaultResponseMessage, RawMessage, TokenPayload
+from src.route.encoding import (
+    DecompressedTooLargeError,
+    UnsupportedEncodingError,
+    decompress,
+    supported_encodings,
+)
+from src.route.formats import (
+    BINARY_CONTENT_TYPES,
+    UnsupportedFormatError,
+    decode,
+    is_map,
+)
+from src.route.priority import is_alarm
+from src.route.rate_limit import rate_limiter
+from src.route.schemas import schema_registry
+from src.route.token_cache import token_cache
 
 
 class OAuth2BearerToken:
@@ -44,10 +62,20 @@ def create_device_access_token(device_id: int | Any) -> str:
     return encoded_jwt
 
 
-async def validate_token(token: TokenDep) -> int | None:
+async def validate_device(token: TokenDep) -> TokenPayload:
     logger = logging.getLogger("validate_token")
-    logger.info("Validating token")
 
+    cached, token_data = token_cache.get(token)
+    if cached:
+        if token_data is None:
+            logger.error("Invalid token (cached): %s", token)
+            raise HTTPException(
+                status_code=403,
+                detail="Could not validate credentials",
+            )
+        return token_data
+
+    logger.info("Validating token")
     try:
         payload = jwt.decode(
             token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
@@ -59,15 +87,260 @@ async def validate_token(token: TokenDep) -> int | None:
         ValidationError,
     ):  # TO CHECK: What if the user uses not a device token?
         logger.error("Invalid token: %s", token)
+        token_cache.set(token, None)
+        raise HTTPException(
+            status_code=403,
+            detail="Could not validate credentials",
+        )
+    if token_data.sub is not None and token_cache.is_revoked(token_data.sub):
+        logger.error("Token of a removed device: %s", token_data.sub)
+        token_cache.set(token, None)
         raise HTTPException(
             status_code=403,
             detail="Could not validate credentials",
         )
     logger.info("Token validated")
-    return token_data.sub  # The device_id
+    if token_data.sub is not None:
+        token_data.type = token_cache.device_type(token_data.sub, token_data.type)
+        token_cache.set(token, token_data)
+    return token_data
+
+
+CurrentDevice = Annotated[TokenPayload, Depends(validate_device)]
+
+
+async def validate_token(device: CurrentDevice) -> int | None:
+    return device.sub  # The device_id
 
 
 CurrentDev = Annotated[int, Depends(validate_token)]
 
+
+def _check_rate(device: TokenPayload, cost: int) -> None:
+    if device.sub is None:
+        return
+    retry_after = rate_limiter.acquire(device.sub, device.type, cost)
+    if retry_after:
+        logging.getLogger("rate_limit").warning(
+            "Device %s rate limited, retry after %.2fs", device.sub, retry_after
+        )
+        raise HTTPException(
+            status_code=429,
+            detail="Too many messages, retry later",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+
+
+async def rate_limit(device: CurrentDevice) -> None:
+    _check_rate(device, 1)
+
+
+async def read_body(request: Request) -> tuple[bytes, bytes, str | None]:
+    """
+    Reads the request body, decompressing it by its Content-Encoding.
+    Returns (original body, decoded body, encoding).
+    """
+    body = await request.body()
+    encoding = request.headers.get("Content-Encoding", "identity").strip().lower()
+    if encoding in ("", "identity"):
+        return body, body, None
+
+    try:
+        decoded = decompress(body, encoding, settings.MAX_DECOMPRESSED_BYTES)
+    except UnsupportedEncodingError:
+        raise HTTPException(
+            status_code=415,
+            detail=f"Content-Encoding must be one of {sorted(supported_encodings())}",
+        )
+    except DecompressedTooLargeError:
+        logging.getLogger("read_body").warning("Decompressed body too large")
+        raise HTTPException(
+            status_code=413,
+            detail=f"Decompressed body exceeds {settings.MAX_DECOMPRESSED_BYTES} bytes",
+        )
+    except Exception:
+        raise HTTPException(status_code=400, detail=f"Invalid {encoding} body")
+    return body, decoded, encoding
+
+
+async def read_payload(request: Request) -> dict[Any, Any] | RawMessage:
+    body, decoded, encoding = await read_body(request)
+    return parse_payload(body, decoded, encoding, request.headers.get("Content-Type"))
+
+
+def parse_payload(
+    body: bytes, decoded: bytes, encoding: str | None, media_type: str | None
+) -> dict[Any, Any] | RawMessage:
+    """
+    Parses the body of a single message, which must be a JSON object. In raw passthrough
+    mode only the enclosing braces are checked and the original bytes are returned,
+    the full parsing is left to the handler.
+    """
+    media_type = (media_type or "").split(";")[0].strip().lower()
+    content_type = BINARY_CONTENT_TYPES.get(media_type)
+    if content_type is not None:
+        return _read_binary_payload(body, decoded, encoding, content_type)
+    if settings.RAW_PASSTHROUGH:
+        stripped = decoded.strip()
+        if stripped[:1] == b"{" and stripped[-1:] == b"}":
+            if encoding is not None and settings.MESSAGES_KEEP_COMPRESSED:
+                return RawMessage(body, content_encoding=encoding)
+            return RawMessage(decoded)
+    else:
+        try:
+            payload = json.loads(decoded)
+        except ValueError:
+            payload = None
+        if isinstance(payload, dict):
+            return payload
+    raise HTTPException(status_code=422, detail="Body must be a JSON object")
+
+
+def _read_binary_payload(
+    body: bytes, decoded: bytes, encoding: str | None, content_type: str
+) -> RawMessage:
+    """
+    MessagePack and CBOR payloads are always forwarded in their compact binary form,
+    with the content type set for the handler to decode. Only the first byte is
+    checked in raw passthrough mode, otherwise the payload is fully decoded.
+    """
+    if settings.RAW_PASSTHROUGH:
+        valid = is_map(decoded, content_type)
+    else:
+        try:
+            valid = isinstance(decode(decoded, content_type), dict)
+        except UnsupportedFormatError:
+            raise HTTPException(
+                status_code=415, detail=f"Unsupported Content-Type: {content_type}"
+            )
+        except Exception:
+            valid = False
+    if not valid:
+        raise HTTPException(status_code=422, detail="Body must be a map")
+    if encoding is not None and settings.MESSAGES_KEEP_COMPRESSED:
+        return RawMessage(body, content_encoding=encoding, content_type=content_type)
+    return RawMessage(decoded, content_type=content_type)
+
+
+Payload = Annotated[dict[Any, Any] | RawMessage, Depends(read_payload)]
+
+
+async def idempotency_key(request: Request) -> str | None:
+    """The optional message id set by the device, the same on each retry of a message."""
+    key = request.headers.get("Idempotency-Key") or request.headers.get("X-Message-ID")
+    if key is None:
+        return None
+    key = key.strip()
+    if not key or len(key) > settings.IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Idempotency-Key must have 1 to {settings.IDEMPOTENCY_KEY_MAX_LENGTH} characters",
+        )
+    return key
+
+
+IdempotencyKey = Annotated[str | None, Depends(idempotency_key)]
+
+
+async def priority(request: Request, device: CurrentDevice, payload: Payload) -> bool:
+    """Whether the message is an alarm, to be published to the priority lane."""
+    header = (
+        request.headers.get(settings.ALARM_HEADER) if settings.ALARM_HEADER else None
+    )
+    return is_alarm(device.type, header, payload)
+
+
+Alarm = Annotated[bool, Depends(priority)]
+
+
+async def validate_schema(device: CurrentDevice, payload: Payload) -> None:
+    """Checks the payload against the JSON Schema of the device type, if it has one."""
+    if device.sub is None:
+        return
+    error = schema_registry.validate(device.sub, payload)
+    if error is not None:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Body does not match the device type schema: {error}",
+        )
+
+
+NDJSON_CONTENT_TYPES = (
+    "application/x-ndjson",
+    "application/ndjson",
+    "application/jsonl",
+)
+
+
+async def read_batch(request: Request) -> list[Any]:
+    """
+    Reads the request body as a batch of readings, either a JSON array or NDJSON
+    (one JSON document per line). Malformed NDJSON lines are kept as raw bytes, so
+    they are rejected individually instead of failing the whole batch.
+    """
+    logger = logging.getLogger("read_batch")
+    _, body, _ = await read_body(request)
+    content_type = request.headers.get("Content-Type", "").split(";")[0].strip().lower()
+
+    items: list[Any] = []
+    if content_type in NDJSON_CONTENT_TYPES:
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                items.append(line)
+    else:
+        try:
+            items = json.loads(body)
+        except ValueError:
+            logger.error("Invalid batch body")
+            raise HTTPException(
+                status_code=422, detail="Body must be a JSON array or NDJSON"
+            )
+        if not isinstance(items, list):
+            raise HTTPException(
+                status_code=422, detail="Body must be a JSON array or NDJSON"
+            )
+
+    if not items:
+        raise HTTPException(status_code=422, detail="Empty batch")
+    if len(items) > settings.BATCH_MAX_ITEMS:
+        logger.warning("Batch too large: %d items", len(items))
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch exceeds {settings.BATCH_MAX_ITEMS} items",
+        )
+    return items
+
+
+BatchPayload = Annotated[list[Any], Depends(read_batch)]
+
+
+async def rate_limit_batch(device: CurrentDevice, items: BatchPayload) -> None:
+    _check_rate(device, len(items))
+
+
 responses_403 = {"description": "Forbidden", "model": DefaultResponseMessage}
+responses_409 = {
+    "description": "Conflict, the message is being accepted, retry after the Retry-After header seconds",
+    "model": DefaultResponseMessage,
+}
 responses_422 = {"description": "Not Found", "model": DefaultResponseMessage}
+responses_413 = {
+    "description": "Batch or Decompressed Body Too Large",
+    "model": DefaultResponseMessage,
+}
+responses_415 = {
+    "description": "Unsupported Content-Encoding or Content-Type",
+    "model": DefaultResponseMessage,
+}
+responses_429 = {
+    "description": "Too Many Requests, retry after the Retry-After header seconds",
+    "model": DefaultResponseMessage,
+}
+responses_503 = {
+    "description": "Broker Unavailable, retry after the Retry-After header seconds",
+    "model": DefaultResponseMessage,
+}
@@ -0,0 +1,39 @@
+from typing import Any
+
+import cbor2  # type: ignore
+import msgpack  # type: ignore
+
+MSGPACK_CONTENT_TYPE = "application/msgpack"
+CBOR_CONTENT_TYPE = "application/cbor"
+
+# Accepted Content-Type -> the content type published to the handler
+BINARY_CONTENT_TYPES = {
+    "application/msgpack": MSGPACK_CONTENT_TYPE,
+    "application/x-msgpack": MSGPACK_CONTENT_TYPE,
+    "application/vnd.msgpack": MSGPACK_CONTENT_TYPE,
+    "application/cbor": CBOR_CONTENT_TYPE,
+}
+
+
+class UnsupportedFormatError(Exception):
+    pass
+
+
+def is_map(body: bytes, content_type: str) -> bool:
+    """Checks, from the first byte only, that the payload is a map (the JSON object peer)."""
+    if not body:
+        return False
+    first = body[0]
+    if content_type == MSGPACK_CONTENT_TYPE:
+        return 0x80 <= first <= 0x8F or first in (0xDE, 0xDF)  # fixmap, map 16, map 32
+    if content_type == CBOR_CONTENT_TYPE:
+        return first >> 5 == 5  # major type 5, map
+    return False
+
+
+def decode(body: bytes, content_type: str) -> Any:
+    if content_type == MSGPACK_CONTENT_TYPE:
+        return msgpack.unpackb(body, raw=False, strict_map_key=False)
+    if content_type == CBOR_CONTENT_TYPE:
+        return cbor2.loads(body)
+    raise UnsupportedFormatError(content_type)
@@ -0,0 +1,23 @@
+from typing import Any
+
+from src.config import settings
+
+
+def is_alarm(device_type: str | None, priority: str | None, payload: Any) -> bool:
+    """
+    Whether the message takes the alarms priority lane: by its device type, its
+    priority header or its payload priority field. A raw (not parsed) payload is
+    only classified by the first two.
+    """
+    if not settings.PRIORITY_LANE:
+        return False
+    if device_type is not None and device_type in settings.ALARM_DEVICE_TYPES:
+        return True
+
+    values = {value.lower() for value in settings.ALARM_VALUES}
+    if priority is not None and priority.strip().lower() in values:
+        return True
+    if settings.ALARM_FIELD and isinstance(payload, dict):
+        field = payload.get(settings.ALARM_FIELD)
+        return field is True or (isinstance(field, str) and field.lower() in values)
+    return False
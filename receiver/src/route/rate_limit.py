@@ -0,0 +1,73 @@
+import logging
+from collections import OrderedDict
+from time import monotonic
+
+from src.config import settings
+
+logger = logging.getLogger("RateLimiter")
+
+
+class RateLimiter:
+    """
+    Per device token buckets, refilled at `rate` tokens per second up to `burst`.
+    Device types can have their own (rate, burst) in `overrides`.
+
+    It runs on the event loop of its worker, so the buckets need no locks. The table
+    keeps the `max_devices` most recently seen devices, the idle ones are evicted
+    first, and a bucket idle long enough is full, the same as a new one.
+    """
+
+    def __init__(
+        self,
+        rate: float = settings.RATE_LIMIT_RATE,
+        burst: float = settings.RATE_LIMIT_BURST,
+        max_devices: int = settings.RATE_LIMIT_MAX_DEVICES,
+        overrides: dict[str, tuple[float, float]] = settings.RATE_LIMIT_OVERRIDES,
+    ) -> None:
+        self._rate = rate
+        self._burst = burst
+        self._max_devices = max_devices
+        self._overrides = overrides
+        self._buckets: OrderedDict[int, list[float]] = (
+            OrderedDict()
+        )  # [tokens, last refill]
+
+    def _limits(self, device_type: str | None) -> tuple[float, float]:
+        if device_type is not None and device_type in self._overrides:
+            return self._overrides[device_type]
+        return self._rate, self._burst
+
+    def acquire(
+        self, device_id: int, device_type: str | None = None, cost: int = 1
+    ) -> float:
+        """
+        Takes `cost` tokens from the device bucket. Returns 0 when allowed, else the
+        seconds to wait. A cost above the burst is allowed on a full bucket, leaving it
+        in debt, so a big batch is paid for by the requests that follow it.
+        """
+        rate, burst = self._limits(device_type)
+        if rate <= 0:
+            return 0.0
+        now = monotonic()
+        bucket = self._buckets.get(device_id)
+        if bucket is None:
+            bucket = [burst, now]
+            self._buckets[device_id] = bucket
+            if len(self._buckets) > self._max_devices:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(device_id)
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+
+        needed = min(cost, burst)
+        if bucket[0] >= needed:
+            bucket[0] -= cost
+            return 0.0
+        return (needed - bucket[0]) / rate
+
+    def clear(self) -> None:
+        self._buckets.clear()
+
+
+rate_limiter = RateLimiter()
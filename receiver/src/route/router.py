@@ -1,10 +1,10 @@
 import logging
-from typing import Any
 
 from fastapi import (
     APIRouter,
-    Body,
+    Depends,
     HTTPException,
+    Response,
     # Request,
     # BackgroundTasks,
 )
@@ -12,7 +12,10 @@ from fastapi import (
 import src.route.dependencies as deps
 from src.config import settings
 from src.message_handler import message_handler
-from src.models import DefaultResponseMessage
+from src.models import BatchResponseMessage, DefaultResponseMessage
+from src.route.dedupe import dedupe_window
+from src.route.priority import is_alarm
+from src.route.schemas import schema_registry
 
 router = APIRouter()
 
@@ -21,28 +24,131 @@ router = APIRouter()
     "/",
     tags=["Listener"],
     response_model=DefaultResponseMessage,
-    responses={403: deps.responses_403, 422: deps.responses_422},
+    responses={
+        403: deps.responses_403,
+        409: deps.responses_409,
+        413: deps.responses_413,
+        415: deps.responses_415,
+        422: deps.responses_422,
+        429: deps.responses_429,
+        503: deps.responses_503,
+    },
+    dependencies=[Depends(deps.rate_limit), Depends(deps.validate_schema)],
     status_code=202,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {"schema": {"type": "object"}},
+                "application/msgpack": {"schema": {"type": "object"}},
+                "application/cbor": {"schema": {"type": "object"}},
+            },
+        }
+    },
 )
 async def listener(
     device: deps.CurrentDev,
+    token: deps.CurrentDevice,
     # request: Request,
+    response: Response,
     handler: message_handler,
     # background_tasks: BackgroundTasks,
-    payload: Any = Body(...),  # TODO: Try some type of JSON
+    payload: deps.Payload,
+    message_id: deps.IdempotencyKey,
+    alarm: deps.Alarm,
 ) -> DefaultResponseMessage | HTTPException:
     """
-    Endpoint that receives devices messages. Send messages to this endpoint with a **bearer** token. The messages body **must** be a JSON object.
+    Endpoint that receives devices messages. Send messages to this endpoint with a **bearer** token. The messages body **must** be a JSON object, or a map encoded as MessagePack (`application/msgpack`) or CBOR (`application/cbor`).
+    When the broker can not take the message, the response is **503** and the device should retry after the **Retry-After** header seconds.
+    Each device has a rate limit, above it the response is **429**, also with a **Retry-After** header.
+    The body can be compressed with **gzip** (or **zstd**), set in the **Content-Encoding** header.
+    When the user attached a JSON Schema to the device type, the body must match it, else the response is **422**.
+    An **Idempotency-Key** header, the same on every retry of a message, makes the retries of an accepted message be acked without storing it again, with the **Idempotent-Replayed** header. A retry sent while the message is still being accepted gets **409**, to retry after the **Retry-After** header seconds.
+    Alarms, flagged with the **X-Priority: alarm** header or a **"priority": "alarm"** field, skip the queued telemetry when the priority lane is enabled.
     """
     logger = logging.getLogger(f"POST {settings.RECEIVER_API_V1_STR}")
     logger.info("Message Received in listener")
+    if message_id is not None:
+        if dedupe_window.seen(device, message_id):
+            logger.info("Duplicate of message %s, already accepted", message_id)
+            response.headers["Idempotent-Replayed"] = "true"
+            return DefaultResponseMessage(message="Accepted")
+        if dedupe_window.pending(device, message_id):
+            logger.info("Duplicate of message %s, being published", message_id)
+            raise HTTPException(
+                status_code=409,
+                detail="Message being accepted, retry later",
+                headers={"Retry-After": "1"},
+            )
+        dedupe_window.begin(device, message_id)
     # request.state.message_handler.process_message(device, payload)
-    handler.process_message(device, payload)
+    accepted = False
+    try:
+        await handler.process_message(
+            device, payload, message_id, alarm=alarm, device_type=token.type
+        )
+        accepted = True
+    finally:
+        # Seen only once the broker took it, a failed publish raises: its retry is published
+        if message_id is not None:
+            dedupe_window.end(device, message_id, accepted)
     # background_tasks.add_task(handler.process_message, device, payload)
     # background_tasks.add_task(request.state.message_handler.process_message, device, payload)
     return DefaultResponseMessage(message="Accepted")
 
 
+@router.post(
+    "/batch",
+    tags=["Listener"],
+    response_model=BatchResponseMessage,
+    responses={
+        403: deps.responses_403,
+        413: deps.responses_413,
+        415: deps.responses_415,
+        422: deps.responses_422,
+        429: deps.responses_429,
+        503: deps.responses_503,
+    },
+    dependencies=[Depends(deps.rate_limit_batch)],
+    status_code=202,
+)
+async def batch_listener(
+    device: deps.CurrentDev,
+    token: deps.CurrentDevice,
+    handler: message_handler,
+    items: deps.BatchPayload,
+) -> BatchResponseMessage | HTTPException:
+    """
+    Endpoint that receives a batch of messages from a single device, as a JSON array or
+    as NDJSON (`Content-Type: application/x-ndjson`). Every item **must** be a JSON object.
+    The response reports the acceptance of each item by its index, so only the rejected ones need to be sent again.
+    Every item counts against the device rate limit. The alarm items go to the priority lane, when enabled.
+    The **Idempotency-Key** header is not supported here: the items sent again are stored again.
+    """
+    logger = logging.getLogger(f"POST {settings.RECEIVER_API_V1_STR}/batch")
+    logger.info("Batch of %d messages received in listener", len(items))
+    results = await handler.process_batch(
+        device,
+        items,
+        validate=lambda item: schema_registry.validate(device, item),
+        classify=lambda item: is_alarm(token.type, None, item),
+        device_type=token.type,
+    )
+    accepted = sum(1 for r in results if r.status == "accepted")
+    if accepted == len(results):
+        message = "Accepted"
+    elif accepted:
+        message = "Partially accepted"
+    else:
+        message = "Rejected"
+    return BatchResponseMessage(
+        message=message,
+        accepted=accepted,
+        rejected=len(results) - accepted,
+        results=results,
+    )
+
+
 @router.post("/test-token", tags=["Listener"], response_model=DefaultResponseMessage)
 def test_token(device: deps.CurrentDev) -> DefaultResponseMessage | HTTPException:
     """
@@ -0,0 +1,174 @@
+import asyncio
+import json
+import logging
+from collections.abc import Callable
+from datetime import UTC, datetime, timedelta
+from typing import Any
+
+import fastjsonschema  # type: ignore
+import httpx
+import jwt
+
+from src.config import settings
+from src.models import RawMessage
+from src.route.encoding import decompress
+from src.route.formats import decode
+
+logger = logging.getLogger("SchemaRegistry")
+
+# Scope of the service token the receivers present to the user API
+DEVICE_SCHEMAS_SCOPE = "device-schemas"
+
+Validator = Callable[[Any], Any]
+SchemaKey = tuple[int, str]  # (owner_id, device type)
+
+
+class SchemaRegistry:
+    """
+    The JSON Schemas the users attach to their device types, each compiled once into
+    a validator shared by the devices of that type. The devices are mapped to their
+    (owner, type) only while it has a schema, so the lookup on every message is a
+    dict get. It is kept up to date by the device events of the user API, and loaded
+    from it every time the message channel (re)connects, not to miss the events sent
+    while it was down.
+    """
+
+    def __init__(self) -> None:
+        self._validators: dict[SchemaKey, Validator] = {}
+        self._devices: dict[int, SchemaKey] = {}
+        self._sync_task: asyncio.Task[None] | None = None
+
+    def validator(self, device_id: int) -> Validator | None:
+        key = self._devices.get(device_id)
+        return self._validators.get(key) if key is not None else None
+
+    def validate(
+        self, device_id: int, payload: dict[Any, Any] | RawMessage
+    ) -> str | None:
+        """Returns why the payload does not match the schema of the device type, None if it does."""
+        validator = self.validator(device_id)
+        if validator is None:
+            return None
+        if isinstance(payload, RawMessage):
+            try:
+                payload = _decode_raw(payload)
+            except Exception:
+                return "Body could not be decoded"
+        try:
+            validator(payload)
+        except fastjsonschema.JsonSchemaValueException as e:
+            return str(e.message)
+        return None
+
+    # --------------------------------- #
+    def set_schema(
+        self,
+        owner_id: int,
+        device_type: str,
+        schema: dict[str, Any] | None,
+        device_ids: list[int],
+    ) -> None:
+        key = (owner_id, device_type)
+        for device_id in [d for d, k in self._devices.items() if k == key]:
+            del self._devices[device_id]
+        self._validators.pop(key, None)
+        if schema is None:
+            return
+        try:
+            self._validators[key] = fastjsonschema.compile(schema)
+        except Exception as e:
+            logger.error(
+                "Invalid schema for device type %s of user %s: %s",
+                device_type,
+                owner_id,
+                e,
+            )
+            return
+        for device_id in device_ids:
+            self._devices[int(device_id)] = key
+
+    def set_device(
+        self, device_id: int, owner_id: int | None, device_type: str | None
+    ) -> None:
+        self._devices.pop(device_id, None)
+        if owner_id is not None and device_type is not None:
+            key = (owner_id, device_type)
+            if key in self._validators:
+                self._devices[device_id] = key
+
+    def load(self, schemas: list[dict[str, Any]]) -> None:
+        self.clear()
+        for item in schemas:
+            self.set_schema(
+                int(item["owner_id"]), item["type"], item["schema"], item["device_ids"]
+            )
+        logger.info("%d device type schemas loaded", len(self._validators))
+
+    def clear(self) -> None:
+        self._validators.clear()
+        self._devices.clear()
+
+    def on_device_event(self, event: dict[str, Any]) -> None:
+        if event["method"] == "schema":
+            self.set_schema(
+                int(event["owner_id"]),
+                event["type"],
+                event.get("schema"),
+                event.get("device_ids", []),
+            )
+        elif event["method"] == "update" and "owner_id" in event:
+            self.set_device(
+                int(event["device_id"]), event["owner_id"], event.get("type")
+            )
+        elif event["method"] == "remove":
+            self._devices.pop(int(event["device_id"]), None)
+
+    # --------------------------------- #
+    async def refresh(self) -> None:
+        """Loads the schemas in the background, so it never holds the channel (re)opening."""
+        if not settings.USERAPI_INTERNAL_URL:
+            return
+        if self._sync_task is None or self._sync_task.done():
+            self._sync_task = asyncio.get_running_loop().create_task(self.sync())
+
+    async def sync(self) -> None:
+        try:
+            snapshot = await fetch_snapshot("/devices/types/schemas")
+        except Exception as e:
+            logger.error("Device type schemas not loaded: %s", e)
+            return
+        self.load(snapshot["schemas"])
+
+
+async def fetch_snapshot(path: str) -> Any:
+    """GETs one of the snapshots the user API serves to the receivers."""
+    token = jwt.encode(
+        {
+            "sub": settings.RECEIVER_ID,
+            "scope": DEVICE_SCHEMAS_SCOPE,
+            "exp": datetime.now(UTC) + timedelta(minutes=1),
+        },
+        settings.SECRET_KEY,
+        algorithm=settings.ALGORITHM,
+    )
+    async with httpx.AsyncClient(timeout=settings.SCHEMAS_SYNC_TIMEOUT) as client:
+        response = await client.get(
+            f"{settings.USERAPI_INTERNAL_URL}{path}",
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        response.raise_for_status()
+    return response.json()
+
+
+def _decode_raw(message: RawMessage) -> Any:
+    body = message.body
+    if message.content_encoding:
+        body = decompress(
+            body, message.content_encoding, settings.MAX_DECOMPRESSED_BYTES
+        )
+    if message.content_type == "application/json":
+        return json.loads(body)
+    return decode(body, message.content_type)
+
+
+schema_registry = SchemaRegistry()
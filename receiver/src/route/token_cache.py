@@ -0,0 +1,146 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from time import monotonic
+from typing import Any
+
+from src.config import settings
+from src.models import TokenPayload
+from src.route.schemas import fetch_snapshot
+
+logger = logging.getLogger("TokenCache")
+
+
+class TokenCache:
+    """
+    Bounded LRU cache of the device tokens already verified, keyed on the raw token.
+    Valid tokens are kept for `ttl` seconds and invalid ones for `negative_ttl`.
+    The devices of the user API, with their types, are loaded every time the message
+    channel (re)connects and kept up to date by the device events: once loaded, the
+    tokens of any other device, even if cryptographically valid, stop being accepted.
+    Until then, the devices removed are revoked until the first load. The types take
+    precedence over the type claimed by the tokens, which is only right until the
+    device type changes.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = settings.TOKEN_CACHE_SIZE,
+        ttl: float = settings.TOKEN_CACHE_TTL,
+        negative_ttl: float = settings.TOKEN_CACHE_NEGATIVE_TTL,
+    ) -> None:
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._negative_ttl = negative_ttl
+        self._entries: OrderedDict[str, tuple[TokenPayload | None, float]] = (
+            OrderedDict()
+        )
+        self._revoked: set[int] = set()
+        self._types: dict[int, str | None] = {}  # All the devices, once loaded
+        self._loaded = False
+        self._events: list[dict[str, Any]] | None = None  # Received while syncing
+        self._sync_task: asyncio.Task[None] | None = None
+
+    def get(self, token: str) -> tuple[bool, TokenPayload | None]:
+        """Returns (hit, payload), the payload is None for a cached invalid token."""
+        entry = self._entries.get(token)
+        if entry is None:
+            return False, None
+        payload, expires = entry
+        if expires < monotonic():
+            del self._entries[token]
+            return False, None
+        self._entries.move_to_end(token)
+        return True, payload
+
+    def set(self, token: str, payload: TokenPayload | None) -> None:
+        ttl = self._ttl if payload is not None else self._negative_ttl
+        self._entries[token] = (payload, monotonic() + ttl)
+        self._entries.move_to_end(token)
+        while len(self._entries) > self._maxsize:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # --------------------------------- #
+    def is_revoked(self, device_id: int) -> bool:
+        """Whether the device is missing from the user API, or was removed."""
+        if self._loaded:
+            return device_id not in self._types
+        return device_id in self._revoked
+
+    def revoke(self, device_id: int) -> None:
+        self._revoked.add(device_id)
+        self._types.pop(device_id, None)
+        self.invalidate_device(device_id)
+
+    def invalidate_device(self, device_id: int) -> None:
+        for token in [
+            t
+            for t, (p, _) in self._entries.items()
+            if p is not None and p.sub == device_id
+        ]:
+            del self._entries[token]
+
+    def device_type(self, device_id: int, default: str | None = None) -> str | None:
+        """The type of the device in the user API, if known, else the default."""
+        return self._types.get(device_id, default)
+
+    def set_device_type(self, device_id: int, device_type: str | None) -> None:
+        self._types[device_id] = device_type
+        self.invalidate_device(device_id)
+
+    def load_device_types(self, types: dict[int, str | None]) -> None:
+        self._types = types
+        self._loaded = True
+        self._revoked.clear()  # Missing from the devices loaded
+        self.clear()  # The tokens were verified with the types replaced
+        logger.info("Types of %d devices loaded", len(types))
+
+    async def refresh(self) -> None:
+        """Loads the device types in the background, like SchemaRegistry.refresh."""
+        if not settings.USERAPI_INTERNAL_URL:
+            return
+        if self._sync_task is None or self._sync_task.done():
+            self._sync_task = asyncio.get_running_loop().create_task(self.sync())
+
+    async def sync(self) -> None:
+        self._events = []
+        try:
+            snapshot = await fetch_snapshot("/devices/types/devices")
+        except Exception as e:
+            logger.error("Device types not loaded: %s", e)
+            return
+        finally:
+            events, self._events = self._events, None
+        self.load_device_types(
+            {
+                int(device_id): device_type
+                for device_id, device_type in snapshot["devices"].items()
+            }
+        )
+        for event in events:  # The snapshot may have been taken before them
+            self.on_device_event(event)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def on_device_event(self, event: dict[str, Any]) -> None:
+        if "device_id" not in event:
+            return  # Not about a single device, e.g. a device type schema
+        if self._events is not None:
+            self._events.append(event)
+        device_id = int(event["device_id"])
+        if event["method"] == "remove":
+            logger.info("Revoking device %s", device_id)
+            self.revoke(device_id)
+        elif event["method"] == "add":
+            self._revoked.discard(device_id)
+            if self._loaded:
+                self._types.setdefault(device_id, None)  # Its type comes as an update
+        elif event["method"] == "update" and "type" in event:
+            self.set_device_type(device_id, event["type"])
+
+
+token_cache = TokenCache()
@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import math
+import uuid
+from typing import Any
+
+from asgi_correlation_id import correlation_id
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, status
+
+from src.config import settings
+from src.ingest import authenticate, ingest
+from src.message_handler import MessageHandler, message_handler
+from src.models import TokenPayload
+from src.route.token_cache import token_cache
+
+ws_router = APIRouter()
+
+Ack = dict[str, Any]
+
+
+def _ack(
+    seq: int,
+    status_code: int,
+    detail: str | None = None,
+    retry_after: float | None = None,
+) -> Ack:
+    ack: Ack = {"seq": seq, "status": status_code}
+    if detail is not None:
+        ack["detail"] = detail
+    if retry_after is not None:
+        ack["retry_after"] = math.ceil(retry_after)
+    return ack
+
+
+def _bearer_token(websocket: WebSocket) -> str | None:
+    authorization = websocket.headers.get("Authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() == "bearer" and token:
+        return token
+    # Browsers can not set headers on the WebSocket handshake
+    return websocket.query_params.get("token")
+
+
+@ws_router.websocket("/ws")
+async def websocket_listener(
+    websocket: WebSocket,
+    handler: message_handler,
+) -> None:
+    """
+    Persistent channel for devices that send messages at a high frequency. The device
+    authenticates once on connect, with a **bearer** token or the `token` query parameter,
+    then sends one message per frame. Text frames are JSON objects, binary frames use
+    the `content_type` query parameter (`application/msgpack` or `application/cbor`).
+    Every frame is acked in order with `{"seq": n, "status": 202}`, numbered from 1, or
+    with the HTTP status of the listener error, `detail` and, for 429 and 503, `retry_after`.
+    """
+    logger = logging.getLogger(f"WS {settings.RECEIVER_API_V1_STR}/ws")
+    token = _bearer_token(websocket)
+    device = await authenticate(token) if token is not None else None
+    if device is None or device.sub is None:
+        logger.error("WebSocket connection with invalid credentials")
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    # One correlation id for the connection, the middleware only sets them for HTTP
+    correlation_id.set(uuid.uuid4().hex)
+    logger.info("Device %s connected", device.sub)
+
+    # The queue bounds the frames in flight, reading stops while it is full
+    pending: asyncio.Queue[asyncio.Task[Ack] | None] = asyncio.Queue(
+        maxsize=settings.WEBSOCKET_MAX_IN_FLIGHT
+    )
+    acker = asyncio.create_task(_send_acks(websocket, pending))
+    binary_type = websocket.query_params.get("content_type")
+    seq = 0
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            seq += 1
+            if token_cache.is_revoked(device.sub):
+                logger.warning("Device %s removed, closing its connection", device.sub)
+                await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+                break
+            if message.get("bytes") is not None:
+                frame, media_type = message["bytes"], binary_type
+            else:
+                frame, media_type = (message.get("text") or "").encode(), None
+            await pending.put(
+                asyncio.create_task(
+                    _process_frame(handler, device, seq, frame, media_type)
+                )
+            )
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await pending.put(None)
+        await asyncio.gather(acker, return_exceptions=True)
+        logger.info("Device %s disconnected after %d frames", device.sub, seq)
+
+
+async def _process_frame(
+    handler: MessageHandler,
+    device: TokenPayload,
+    seq: int,
+    frame: bytes,
+    media_type: str | None,
+) -> Ack:
+    result = await ingest(handler, device, frame, media_type)
+    return _ack(seq, result.status, result.detail, result.retry_after)
+
+
+async def _send_acks(
+    websocket: WebSocket, pending: asyncio.Queue[asyncio.Task[Ack] | None]
+) -> None:
+    """Sends the acks in the frames order, as their publishes complete."""
+    while (task := await pending.get()) is not None:
+        try:
+            await websocket.send_json(await task)
+        except Exception:
+            task.cancel()
+            # Keeps draining, so the reader is never blocked on a full queue
+            while (task := await pending.get()) is not None:
+                task.cancel()
+            return
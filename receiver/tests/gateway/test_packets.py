@@ -0,0 +1,38 @@
+import pytest
+
+import src.gateway.packets as mqtt
+
+
+def test_split_packet_incomplete():
+    assert mqtt.split_packet(b"\x30", 1024) is None
+    assert mqtt.split_packet(b"\x30\x80", 1024) is None
+
+
+def test_split_packet_multi_byte_length():
+    packet = mqtt.encode_packet(0x30, b"0" * 300)
+    assert mqtt.split_packet(packet, 1024) == (0x30, 3, 300)
+
+
+def test_split_packet_too_large():
+    with pytest.raises(mqtt.MQTTProtocolError):
+        mqtt.split_packet(mqtt.encode_packet(0x30, b"0" * 300), 100)
+
+
+def test_connect_round_trip():
+    packet = mqtt.encode_connect(b"device-1", b"token", keep_alive=30)
+    first_byte, start, length = mqtt.split_packet(packet, 1024)
+    connect = mqtt.parse_connect(packet[start : start + length])
+    assert first_byte >> 4 == mqtt.CONNECT
+    assert connect == mqtt.Connect(b"MQTT", 4, 30, b"device-1", b"device", b"token")
+
+
+def test_publish_round_trip():
+    packet = mqtt.encode_publish(b"devices/readings", b'{"a": 1}', qos=1, packet_id=7)
+    first_byte, start, length = mqtt.split_packet(packet, 1024)
+    publish = mqtt.parse_publish(first_byte & 0x0F, packet[start : start + length])
+    assert publish == mqtt.Publish(1, b"devices/readings", 7, b'{"a": 1}')
+
+
+def test_truncated_connect():
+    with pytest.raises(mqtt.MQTTProtocolError):
+        mqtt.parse_connect(b"\x00\x04MQ")
@@ -0,0 +1,114 @@
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+import pytest_asyncio
+
+import src.gateway.packets as mqtt
+from src.errors import BrokerUnavailableError
+from src.gateway.server import Gateway
+from src.message_handler import MessageHandler
+from src.models import RawMessage
+from src.route.dependencies import create_device_access_token
+
+
+@pytest_asyncio.fixture()
+async def gateway():
+    gateway = Gateway(AsyncMock(spec=MessageHandler))
+    await gateway.start("127.0.0.1", 0, 0)
+    yield gateway
+    await gateway.stop()
+
+
+async def connect(gateway: Gateway, device_id: int = 41) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    reader, writer = await asyncio.open_connection("127.0.0.1", gateway.mqtt_port)
+    token = create_device_access_token(device_id).encode()
+    writer.write(mqtt.encode_connect(b"device", token))
+    assert await reader.readexactly(4) == mqtt.connack(mqtt.ACCEPTED)
+    return reader, writer
+
+
+class TestMQTT:
+    @pytest.mark.asyncio
+    async def test_publish_qos1_is_acked_in_order(self, gateway: Gateway):
+        reader, writer = await connect(gateway)
+        for packet_id in (1, 2, 3):
+            writer.write(mqtt.encode_publish(b"readings", b'{"n": %d}' % packet_id, 1, packet_id))
+
+        acks = [await reader.readexactly(4) for _ in range(3)]
+        writer.close()
+
+        assert acks == [mqtt.puback(packet_id) for packet_id in (1, 2, 3)]
+        assert [c.args for c in gateway.handler.process_message.call_args_list] == [
+            (41, {"n": n}) for n in (1, 2, 3)
+        ]
+
+    @pytest.mark.asyncio
+    async def test_publish_pipelined_with_connect(self, gateway: Gateway):
+        reader, writer = await asyncio.open_connection("127.0.0.1", gateway.mqtt_port)
+        token = create_device_access_token(41).encode()
+        writer.write(mqtt.encode_connect(b"device", token) + mqtt.encode_publish(b"readings", b'{"a": 1}', 1, 9))
+
+        assert await reader.readexactly(4) == mqtt.connack(mqtt.ACCEPTED)
+        assert await reader.readexactly(4) == mqtt.puback(9)
+        writer.close()
+
+    @pytest.mark.asyncio
+    async def test_binary_topic(self, gateway: Gateway):
+        body = b"\x81\xa1a\x01"  # MessagePack {"a": 1}
+        reader, writer = await connect(gateway)
+        writer.write(mqtt.encode_publish(b"readings/msgpack", body, 1, 1))
+        assert await reader.readexactly(4) == mqtt.puback(1)
+        writer.close()
+        gateway.handler.process_message.assert_called_once_with(
+            41, RawMessage(body, content_type="application/msgpack"), alarm=False, device_type=None
+        )
+
+    @pytest.mark.asyncio
+    async def test_ping(self, gateway: Gateway):
+        reader, writer = await connect(gateway)
+        writer.write(mqtt.encode_packet(mqtt.PINGREQ << 4))
+        assert await reader.readexactly(2) == mqtt.PINGRESP_PACKET
+        writer.close()
+
+    @pytest.mark.asyncio
+    async def test_invalid_token(self, gateway: Gateway):
+        reader, writer = await asyncio.open_connection("127.0.0.1", gateway.mqtt_port)
+        writer.write(mqtt.encode_connect(b"device", b"invalid"))
+        assert await reader.readexactly(4) == mqtt.connack(mqtt.NOT_AUTHORIZED)
+        assert await reader.read() == b""
+        assert not gateway.connections
+
+    @pytest.mark.asyncio
+    async def test_publish_before_connect_closes(self, gateway: Gateway):
+        reader, writer = await asyncio.open_connection("127.0.0.1", gateway.mqtt_port)
+        writer.write(mqtt.encode_publish(b"readings", b'{"a": 1}'))
+        assert await reader.read() == b""
+        gateway.handler.process_message.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_broker_unavailable_closes_without_ack(self, gateway: Gateway):
+        gateway.handler.process_message.side_effect = BrokerUnavailableError("down")
+        reader, writer = await connect(gateway)
+        writer.write(mqtt.encode_publish(b"readings", b'{"a": 1}', 1, 1))
+        assert await reader.read() == b""
+
+
+class TestUDP:
+    @pytest.mark.asyncio
+    async def test_datagram_is_published(self, gateway: Gateway):
+        loop = asyncio.get_running_loop()
+        transport, _ = await loop.create_datagram_endpoint(
+            asyncio.DatagramProtocol, remote_addr=("127.0.0.1", gateway.udp_port)
+        )
+        token = create_device_access_token(42).encode()
+        transport.sendto(token + b"\n" + b'{"a": 1}')
+        transport.sendto(b"invalid\n" + b'{"a": 2}')
+        transport.close()
+        for _ in range(100):
+            if gateway.handler.process_message.called:
+                break
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+
+        gateway.handler.process_message.assert_called_once_with(42, {"a": 1}, alarm=False, device_type=None)
@@ -1,30 +1,532 @@
-# This tests need to run with a RabbitMQ server running
+import asyncio
+import struct
 from unittest.mock import MagicMock
 
 import pytest
+import pytest_asyncio
+from pika.spec import Basic
 
+from src.errors import BrokerUnavailableError
 from src.queues.channels import MessageChannel
+from src.queues.envelope import ENVELOPE_CONTENT_TYPE
+from src.queues.sharding import shard_routing_key
+from src.queues.spool import Spool, decode_record
 
 
 class TestMessagePublisher:
     @pytest.fixture(autouse=True)
     def channelfix(self) -> MessageChannel:
         self.channel = MessageChannel()
+        self.channel._connection = MagicMock(is_open=True)
+        self.channel._channels = [
+            MagicMock(is_open=True, channel_number=1),
+            MagicMock(is_open=True, channel_number=2),
+        ]
+        self.channel._confirms = False
+        self.channel._spool = None
+        self.channel._delivery_tags = {1: 0, 2: 0}
+        self.channel._unconfirmed = {1: {}, 2: {}}
 
-    def test_configure_channel(self) -> None:
+    def test_status(self) -> None:
         assert self.channel.status(), "Channel should be open"
 
-    # @pytest.mark.asyncio
-    def test_publish(self):
-        message_channel = MessageChannel()
-        message_channel._connection.publish = MagicMock()
-        message_channel.publish("Hello!", correlation_id="f9g80asd7fg", content_type="text/plain")
-        message_channel._connection.publish.assert_called_once_with(
-            message_channel._channel.basic_publish(
-                exchange=message_channel._exchange,
-                routing_key=message_channel._routing_key,
-                body="Hello!",
-                properties=MagicMock(),
-                mandatory=True,
+        self.channel._connection.is_open = False
+        assert not self.channel.status(), "Channel should be closed"
+
+    def test_status_without_connection(self) -> None:
+        self.channel._connection = None
+        assert not self.channel.status(), "Channel should be closed"
+
+    @pytest.mark.asyncio
+    async def test_publish(self):
+        await self.channel.publish("Hello!", correlation_id="f9g80asd7fg", content_type="text/plain")
+
+        published = [c for c in self.channel._channels if c.basic_publish.called]
+        assert len(published) == 1
+        kwargs = published[0].basic_publish.call_args.kwargs
+        assert kwargs["exchange"] == self.channel._exchange
+        assert kwargs["routing_key"] == self.channel._routing_key
+        assert kwargs["body"] == b'"Hello!"'
+        assert kwargs["properties"].correlation_id == "f9g80asd7fg"
+
+    @pytest.mark.asyncio
+    async def test_publish_raw_with_headers(self):
+        await self.channel.publish(
+            b'{"a": 1}', correlation_id="", content_type="application/json", headers={"device_id": 1}
+        )
+
+        channel = next(c for c in self.channel._channels if c.basic_publish.called)
+        kwargs = channel.basic_publish.call_args.kwargs
+        assert kwargs["body"] == b'{"a": 1}'
+        assert kwargs["properties"].headers == {"device_id": 1}
+
+    @pytest.mark.asyncio
+    async def test_publish_compressed(self):
+        await self.channel.publish(
+            b"\x1f\x8b...", correlation_id="", content_type="application/json", content_encoding="gzip"
+        )
+
+        channel = next(c for c in self.channel._channels if c.basic_publish.called)
+        assert channel.basic_publish.call_args.kwargs["properties"].content_encoding == "gzip"
+
+    @pytest.mark.asyncio
+    async def test_publish_message_id(self):
+        await self.channel.publish(
+            {}, correlation_id="", content_type="application/json", message_id="reading-42"
+        )
+
+        channel = next(c for c in self.channel._channels if c.basic_publish.called)
+        assert channel.basic_publish.call_args.kwargs["properties"].message_id == "reading-42"
+
+    @pytest.mark.asyncio
+    async def test_publish_round_robin(self):
+        for _ in range(4):
+            await self.channel.publish({}, correlation_id="", content_type="application/json")
+
+        for channel in self.channel._channels:
+            assert channel.basic_publish.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_publish_skips_closed_channels(self):
+        self.channel._channels[0].is_open = False
+        await self.channel.publish({}, correlation_id="", content_type="application/json")
+
+        self.channel._channels[0].basic_publish.assert_not_called()
+        self.channel._channels[1].basic_publish.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_publish_closed(self):
+        self.channel._connection.is_open = False
+        with pytest.raises(BrokerUnavailableError):
+            await self.channel.publish({}, correlation_id="", content_type="application/json")
+
+    @pytest.mark.asyncio
+    async def test_publish_batch(self):
+        published = await self.channel.publish_batch(
+            [{"a": 1}, {"b": 2}], correlation_id="", content_type="application/json"
+        )
+
+        assert published == 2
+        channel = next(c for c in self.channel._channels if c.basic_publish.called)
+        assert channel.basic_publish.call_count == 2
+
+
+class TestMessagePublisherShards:
+    @pytest.fixture(autouse=True)
+    def channelfix(self) -> MessageChannel:
+        self.channel = MessageChannel()
+        self.channel._connection = MagicMock(is_open=True)
+        self.channel._channels = [MagicMock(is_open=True, channel_number=1)]
+        self.channel._confirms = False
+        self.channel._spool = None
+        self.channel._shards = 4
+
+    def test_routing_key_is_stable_per_device(self):
+        keys = {self.channel.routing_key(device_id) for device_id in range(1000)}
+        assert keys == {shard_routing_key(shard) for shard in range(4)}
+        assert self.channel.routing_key(42) == self.channel.routing_key(42)
+
+    def test_routing_key_without_shards(self):
+        self.channel._shards = 0
+        assert self.channel.routing_key(42) == self.channel._routing_key
+
+    @pytest.mark.asyncio
+    async def test_publish_with_routing_key(self):
+        routing_key = self.channel.routing_key(42)
+        await self.channel.publish({}, correlation_id="", content_type="application/json", routing_key=routing_key)
+
+        kwargs = self.channel._channels[0].basic_publish.call_args.kwargs
+        assert kwargs["routing_key"] == routing_key
+
+    @pytest.mark.asyncio
+    async def test_shard_keeps_its_channel(self):
+        self.channel._channels = [
+            MagicMock(is_open=True, channel_number=1),
+            MagicMock(is_open=True, channel_number=2),
+        ]
+        routing_key = self.channel.routing_key(42)
+        for _ in range(4):
+            await self.channel.publish({}, correlation_id="", content_type="application/json", routing_key=routing_key)
+
+        counts = sorted(c.basic_publish.call_count for c in self.channel._channels)
+        assert counts == [0, 4], "The device messages in order, on one channel"
+
+    def test_routing_key_alarm(self):
+        self.channel._priority_lane = True
+        assert self.channel.routing_key(42, alarm=True) == self.channel._alarms_routing_key
+        assert self.channel.routing_key(42) != self.channel._alarms_routing_key
+
+    def test_routing_key_alarm_without_lane(self):
+        assert self.channel.routing_key(42, alarm=True) == self.channel.routing_key(42)
+
+
+class TestMessagePublisherConfirms:
+    @pytest.fixture(autouse=True)
+    def channelfix(self) -> MessageChannel:
+        self.channel = MessageChannel()
+        self.channel._connection = MagicMock(is_open=True)
+        self.channel._channels = [MagicMock(is_open=True, channel_number=1)]
+        self.channel._confirms = True
+        self.channel._confirm_window = 3
+        self.channel._confirm_timeout = 0.5
+        self.channel._spool = None
+        self.channel._delivery_tags = {1: 0}
+        self.channel._unconfirmed = {1: {}}
+
+    def confirm(self, method) -> None:
+        self.channel._on_delivery_confirmation(MagicMock(channel_number=1, method=method))
+
+    @pytest.mark.asyncio
+    async def test_publish_acked(self):
+        asyncio.get_running_loop().call_soon(self.confirm, Basic.Ack(delivery_tag=1))
+        await self.channel.publish({}, correlation_id="", content_type="application/json")
+
+        assert self.channel.in_flight == 0
+
+    @pytest.mark.asyncio
+    async def test_publish_nacked(self):
+        asyncio.get_running_loop().call_soon(self.confirm, Basic.Nack(delivery_tag=1))
+        with pytest.raises(BrokerUnavailableError):
+            await self.channel.publish({}, correlation_id="", content_type="application/json")
+
+        assert self.channel.in_flight == 0
+
+    @pytest.mark.asyncio
+    async def test_publish_not_confirmed_stays_in_window(self):
+        with pytest.raises(BrokerUnavailableError):
+            await self.channel.publish({}, correlation_id="", content_type="application/json")
+
+        assert self.channel.in_flight == 1
+        self.confirm(Basic.Ack(delivery_tag=1))
+        assert self.channel.in_flight == 0
+
+    @pytest.mark.asyncio
+    async def test_stop_waits_for_confirms(self):
+        future = asyncio.get_running_loop().create_future()
+        self.channel._unconfirmed[1] = {1: future}
+        connection = MagicMock(is_open=True, is_closing=False, is_closed=False)
+        connection.close.side_effect = lambda: closed.append(future.done())
+        self.channel._connection = connection
+        closed: list[bool] = []
+        asyncio.get_running_loop().call_later(0.05, self.confirm, Basic.Ack(delivery_tag=1))
+
+        await self.channel.stop()
+        assert closed == [True], "Closed once the broker confirmed"
+
+    @pytest.mark.asyncio
+    async def test_stop_waits_for_a_bounded_time(self):
+        self.channel._unconfirmed[1] = {1: asyncio.get_running_loop().create_future()}
+        self.channel._confirm_timeout = 0.01
+        connection = MagicMock(is_open=True, is_closing=False, is_closed=False)
+        self.channel._connection = connection
+
+        await self.channel.stop()
+        connection.close.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_publish_window_full(self):
+        self.channel._unconfirmed[1] = {
+            tag: asyncio.get_running_loop().create_future() for tag in (1, 2, 3)
+        }
+        with pytest.raises(BrokerUnavailableError):
+            await self.channel.publish({}, correlation_id="", content_type="application/json")
+
+        self.channel._channels[0].basic_publish.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_publish_batch_multiple_ack(self):
+        asyncio.get_running_loop().call_soon(
+            self.confirm, Basic.Ack(delivery_tag=2, multiple=True)
+        )
+        published = await self.channel.publish_batch(
+            [{"a": 1}, {"b": 2}], correlation_id="", content_type="application/json"
+        )
+
+        assert published == 2
+        assert self.channel.in_flight == 0
+
+    @pytest.mark.asyncio
+    async def test_publish_batch_confirmed_prefix(self):
+        loop = asyncio.get_running_loop()
+        loop.call_soon(self.confirm, Basic.Ack(delivery_tag=1))
+        loop.call_soon(self.confirm, Basic.Nack(delivery_tag=2))
+        loop.call_soon(self.confirm, Basic.Ack(delivery_tag=3))
+        published = await self.channel.publish_batch(
+            [{"a": 1}, {"b": 2}, {"c": 3}], correlation_id="", content_type="application/json"
+        )
+
+        assert published == 1
+
+    @pytest.mark.asyncio
+    async def test_channel_closed_releases_window(self):
+        future = asyncio.get_running_loop().create_future()
+        self.channel._unconfirmed[1] = {1: future}
+        self.channel._closing = True
+        self.channel._on_channel_closed(self.channel._channels[0], Exception())
+
+        assert self.channel.in_flight == 0
+        assert future.result() is False
+
+
+def unpack_envelope(body: bytes) -> list[tuple[bytes, dict]]:
+    records, offset = [], 0
+    while offset < len(body):
+        (length,) = struct.unpack_from(">I", body, offset)
+        records.append(decode_record(body[offset + 4 : offset + 4 + length]))
+        offset += 4 + length
+    return records
+
+
+class TestMessagePublisherCoalesce:
+    @pytest.fixture(autouse=True)
+    def channelfix(self) -> MessageChannel:
+        self.channel = MessageChannel()
+        self.channel._connection = MagicMock(is_open=True)
+        self.channel._channels = [MagicMock(is_open=True, channel_number=1)]
+        self.channel._confirms = True
+        self.channel._confirm_window = 3
+        self.channel._confirm_timeout = 0.5
+        self.channel._spool = None
+        self.channel._delivery_tags = {1: 0}
+        self.channel._unconfirmed = {1: {}}
+        self.channel._coalesce = True
+        self.channel._coalesce_max_items = 3
+        self.channel._coalesce_linger = 0.01
+        self.channel._coalesced = {}
+        self.channel._flush_handle = None
+
+    def confirm(self, method) -> None:
+        self.channel._on_delivery_confirmation(MagicMock(channel_number=1, method=method))
+
+    @pytest.mark.asyncio
+    async def test_publish_in_one_envelope(self):
+        asyncio.get_running_loop().call_later(0.02, self.confirm, Basic.Ack(delivery_tag=1))
+        await asyncio.gather(
+            self.channel.publish({"a": 1}, correlation_id="abc", content_type="application/json"),
+            self.channel.publish(
+                b'{"b": 2}', correlation_id="def", content_type="application/json", headers={"device_id": 2}
+            ),
+        )
+
+        channel = self.channel._channels[0]
+        channel.basic_publish.assert_called_once()
+        kwargs = channel.basic_publish.call_args.kwargs
+        assert kwargs["properties"].content_type == ENVELOPE_CONTENT_TYPE
+        assert unpack_envelope(kwargs["body"]) == [
+            (b'{"a": 1}', {"correlation_id": "abc", "content_type": "application/json"}),
+            (b'{"b": 2}', {"correlation_id": "def", "content_type": "application/json", "headers": {"device_id": 2}}),
+        ]
+
+    @pytest.mark.asyncio
+    async def test_envelope_keeps_message_id(self):
+        asyncio.get_running_loop().call_later(0.02, self.confirm, Basic.Ack(delivery_tag=1))
+        await self.channel.publish({}, correlation_id="", content_type="application/json", message_id="m-1")
+
+        kwargs = self.channel._channels[0].basic_publish.call_args.kwargs
+        [(_, properties)] = unpack_envelope(kwargs["body"])
+        assert properties["message_id"] == "m-1"
+
+    @pytest.mark.asyncio
+    async def test_alarm_not_coalesced(self):
+        asyncio.get_running_loop().call_later(0.001, self.confirm, Basic.Ack(delivery_tag=1))
+        await self.channel.publish(
+            {"a": 1},
+            correlation_id="",
+            content_type="application/json",
+            routing_key=self.channel._alarms_routing_key,
+        )
+
+        kwargs = self.channel._channels[0].basic_publish.call_args.kwargs
+        assert kwargs["properties"].content_type == "application/json"
+        assert kwargs["routing_key"] == self.channel._alarms_routing_key
+        assert self.channel._coalesced == {}
+
+    @pytest.mark.asyncio
+    async def test_flush_when_full(self):
+        published = asyncio.create_task(
+            self.channel.publish_batch(
+                [{"a": 1}, {"b": 2}, {"c": 3}, {"d": 4}], correlation_id="", content_type="application/json"
             )
         )
+        await asyncio.sleep(0)
+
+        # The first envelope is published without waiting for the linger time
+        self.channel._channels[0].basic_publish.assert_called_once()
+        self.confirm(Basic.Ack(delivery_tag=1))
+        await asyncio.sleep(0.02)
+        self.confirm(Basic.Ack(delivery_tag=2))
+        assert await published == 4
+        assert self.channel._channels[0].basic_publish.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_envelope_nacked(self):
+        asyncio.get_running_loop().call_later(0.02, self.confirm, Basic.Nack(delivery_tag=1))
+        with pytest.raises(BrokerUnavailableError):
+            await self.channel.publish({}, correlation_id="", content_type="application/json")
+
+    @pytest.mark.asyncio
+    async def test_envelope_channel_closed(self):
+        self.channel._connection.is_open = False
+        with pytest.raises(BrokerUnavailableError):
+            await self.channel.publish({}, correlation_id="", content_type="application/json")
+
+
+class TestMessagePublisherSpool:
+    @pytest_asyncio.fixture(autouse=True)
+    async def channelfix(self, tmp_path) -> MessageChannel:
+        self.channel = MessageChannel()
+        self.channel._connection = MagicMock(is_open=False)
+        self.channel._channels = [MagicMock(is_open=True, channel_number=1)]
+        self.channel._confirms = False
+        self.channel._closing = False
+        self.channel._spool = Spool(directory=str(tmp_path), fsync_interval=0.001)
+        self.channel._spool.open()
+        yield
+        await self.channel._spool.close()
+
+    @pytest.mark.asyncio
+    async def test_publish_spooled_when_closed(self):
+        await self.channel.publish({"a": 1}, correlation_id="abc", content_type="application/json")
+
+        self.channel._channels[0].basic_publish.assert_not_called()
+        assert not self.channel._spool.is_empty()
+
+    @pytest.mark.asyncio
+    async def test_spool_drained_in_order(self):
+        await self.channel.publish({"a": 1}, correlation_id="abc", content_type="application/json")
+        await self.channel.publish_batch(
+            [{"b": 2}, {"c": 3}], correlation_id="def", content_type="application/json"
+        )
+
+        self.channel._connection.is_open = True
+        await self.channel._drain_spool()
+
+        calls = self.channel._channels[0].basic_publish.call_args_list
+        assert [c.kwargs["body"] for c in calls] == [b'{"a": 1}', b'{"b": 2}', b'{"c": 3}']
+        assert calls[0].kwargs["properties"].correlation_id == "abc"
+        assert self.channel._spool.is_empty()
+
+    @pytest.mark.asyncio
+    async def test_spool_keeps_routing_key(self):
+        await self.channel.publish({"a": 1}, correlation_id="", content_type="application/json", routing_key="handler.1.R")
+
+        self.channel._connection.is_open = True
+        await self.channel._drain_spool()
+
+        kwargs = self.channel._channels[0].basic_publish.call_args.kwargs
+        assert kwargs["routing_key"] == "handler.1.R"
+
+    @pytest.mark.asyncio
+    async def test_spool_keeps_headers(self):
+        await self.channel.publish(
+            b'{"a": 1}', correlation_id="abc", content_type="application/json", headers={"device_id": 1}
+        )
+
+        self.channel._connection.is_open = True
+        await self.channel._drain_spool()
+
+        kwargs = self.channel._channels[0].basic_publish.call_args.kwargs
+        assert kwargs["body"] == b'{"a": 1}'
+        assert kwargs["properties"].headers == {"device_id": 1}
+
+    @pytest.mark.asyncio
+    async def test_spool_keeps_message_id(self):
+        await self.channel.publish({}, correlation_id="", content_type="application/json", message_id="m-1")
+
+        self.channel._connection.is_open = True
+        await self.channel._drain_spool()
+
+        kwargs = self.channel._channels[0].basic_publish.call_args.kwargs
+        assert kwargs["properties"].message_id == "m-1"
+
+    @pytest.mark.asyncio
+    async def test_publish_behind_spool_keeps_order(self):
+        await self.channel.publish({"a": 1}, correlation_id="", content_type="application/json")
+        self.channel._connection.is_open = True
+        self.channel._schedule_drain = MagicMock()
+
+        await self.channel.publish({"b": 2}, correlation_id="", content_type="application/json")
+
+        self.channel._channels[0].basic_publish.assert_not_called()
+
+
+class TestMessagePublisherDelivery:
+    @pytest_asyncio.fixture(autouse=True)
+    async def channelfix(self, tmp_path) -> MessageChannel:
+        self.channel = MessageChannel()
+        self.channel._connection = MagicMock(is_open=True)
+        self.channel._channels = [MagicMock(is_open=True, channel_number=1)]
+        self.channel._confirms = True
+        self.channel._closing = False
+        self.channel._delivery_tags = {1: 0}
+        self.channel._unconfirmed = {1: {}}
+        self.channel._spool = Spool(directory=str(tmp_path), fsync_interval=0.001)
+        self.channel._spool.open()
+        self.channel._schedule_drain = MagicMock()
+        yield
+        await self.channel._spool.close()
+
+    @pytest.mark.asyncio
+    async def test_transient_not_persistent_nor_waited(self):
+        await self.channel.publish(
+            {"a": 1}, correlation_id="", content_type="application/json", delivery="transient"
+        )
+
+        kwargs = self.channel._channels[0].basic_publish.call_args.kwargs
+        assert kwargs["properties"].delivery_mode == 1
+
+    @pytest.mark.asyncio
+    async def test_transient_batch(self):
+        published = await self.channel.publish_batch(
+            [{"a": 1}, {"b": 2}], correlation_id="", content_type="application/json", delivery="transient"
+        )
+
+        assert published == 2
+        assert self.channel._channels[0].basic_publish.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_transient_not_spooled_when_closed(self):
+        self.channel._connection.is_open = False
+        with pytest.raises(BrokerUnavailableError):
+            await self.channel.publish({}, correlation_id="", content_type="application/json", delivery="transient")
+
+        assert self.channel._spool.is_empty()
+
+    @pytest.mark.asyncio
+    async def test_spooled_while_broker_up(self):
+        await self.channel.publish({"a": 1}, correlation_id="", content_type="application/json", delivery="spooled")
+
+        self.channel._channels[0].basic_publish.assert_not_called()
+        assert not self.channel._spool.is_empty()
+        assert not self.channel._backlog
+
+    @pytest.mark.asyncio
+    async def test_spooled_does_not_hold_confirmed(self):
+        await self.channel.publish({"a": 1}, correlation_id="", content_type="application/json", delivery="spooled")
+        publishing = asyncio.create_task(
+            self.channel.publish({"b": 2}, correlation_id="", content_type="application/json")
+        )
+        await asyncio.sleep(0)
+
+        kwargs = self.channel._channels[0].basic_publish.call_args.kwargs
+        assert kwargs["body"] == b'{"b": 2}'
+        self.channel._on_delivery_confirmation(MagicMock(channel_number=1, method=Basic.Ack(delivery_tag=1)))
+        await publishing
+
+    @pytest.mark.asyncio
+    async def test_backlog_holds_until_drained(self):
+        self.channel._connection.is_open = False
+        await self.channel.publish({"a": 1}, correlation_id="", content_type="application/json")
+        assert self.channel._backlog
+
+        self.channel._connection.is_open = True
+        self.channel._confirms = False
+        await self.channel.publish({"b": 2}, correlation_id="", content_type="application/json")
+        self.channel._channels[0].basic_publish.assert_not_called()
+
+        await self.channel._drain_spool()
+        assert not self.channel._backlog
+        await self.channel.publish({"c": 3}, correlation_id="", content_type="application/json")
+
+        bodies = [c.kwargs["body"] for c in self.channel._channels[0].basic_publish.call_args_list]
+        assert bodies == [b'{"a": 1}', b'{"b": 2}', b'{"c": 3}']
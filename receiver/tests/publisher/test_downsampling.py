@@ -0,0 +1,133 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from src.config import DownsampleRule
+from src.downsampling import Downsampler
+from src.message_handler import MessageHandler
+from src.queues.channels import MessageChannel
+
+
+def downsampler(rule: DownsampleRule, emit: AsyncMock | None = None) -> Downsampler:
+    return Downsampler(emit or AsyncMock(), types={"sensor": rule}, devices={}, max_devices=10)
+
+
+class TestDownsampler:
+    def test_rules(self):
+        by_type = DownsampleRule(mode="last")
+        by_device = DownsampleRule(mode="mean")
+        sampler = Downsampler(AsyncMock(), types={"sensor": by_type}, devices={7: by_device})
+        assert sampler.rule(1, "sensor") is by_type
+        assert sampler.rule(7, "sensor") is by_device
+        assert sampler.rule(1, "camera") is None
+        assert sampler.rule(1, None) is None
+
+    @pytest.mark.asyncio
+    async def test_without_rule(self):
+        sampler = downsampler(DownsampleRule(mode="last"))
+        assert sampler.offer(1, "camera", {"a": 1})
+
+    @pytest.mark.asyncio
+    async def test_last(self):
+        emit = AsyncMock()
+        sampler = downsampler(DownsampleRule(mode="last", window=0.01), emit)
+        assert not any(sampler.offer(1, "sensor", {"t": value}, "c-1") for value in (1, 2, 3))
+        emit.assert_not_called()
+
+        await asyncio.sleep(0.03)
+        emit.assert_called_once_with(1, "sensor", {"t": 3}, "c-1")
+
+    @pytest.mark.asyncio
+    async def test_mean(self):
+        emit = AsyncMock()
+        sampler = downsampler(DownsampleRule(mode="mean", window=0.01), emit)
+        sampler.offer(1, "sensor", {"t": 1, "unit": "C", "on": True})
+        sampler.offer(1, "sensor", {"t": 2, "unit": "C", "on": False})
+        sampler.offer(2, "sensor", {"t": 10})
+
+        await asyncio.sleep(0.03)
+        assert sorted(emit.call_args_list, key=lambda c: c.args[0]) == [
+            ((1, "sensor", {"t": 1.5, "unit": "C", "on": False}, ""),),
+            ((2, "sensor", {"t": 10.0}, ""),),
+        ]
+
+    @pytest.mark.asyncio
+    async def test_window_restarts(self):
+        emit = AsyncMock()
+        sampler = downsampler(DownsampleRule(mode="last", window=0.01), emit)
+        sampler.offer(1, "sensor", {"t": 1})
+        await asyncio.sleep(0.03)
+        sampler.offer(1, "sensor", {"t": 2})
+        await asyncio.sleep(0.03)
+        assert [c.args[2] for c in emit.call_args_list] == [{"t": 1}, {"t": 2}]
+
+    def test_deadband(self):
+        sampler = downsampler(DownsampleRule(mode="deadband", window=0, threshold=0.5))
+        assert sampler.offer(1, "sensor", {"t": 20.0, "state": "ok"})
+        assert not sampler.offer(1, "sensor", {"t": 20.4, "state": "ok"})
+        assert sampler.offer(1, "sensor", {"t": 20.6, "state": "ok"})
+        assert sampler.offer(1, "sensor", {"t": 20.6, "state": "door open"})
+        assert sampler.offer(1, "sensor", {"t": 20.6, "state": "door open", "h": 1})
+
+    def test_deadband_heartbeat(self, monkeypatch):
+        now = [100.0]
+        monkeypatch.setattr("src.downsampling.monotonic", lambda: now[0])
+        sampler = downsampler(DownsampleRule(mode="deadband", window=60, threshold=1))
+        assert sampler.offer(1, "sensor", {"t": 20})
+        now[0] += 30
+        assert not sampler.offer(1, "sensor", {"t": 20})
+        now[0] += 30
+        assert sampler.offer(1, "sensor", {"t": 20})
+
+    @pytest.mark.asyncio
+    async def test_flush(self):
+        emit = AsyncMock()
+        sampler = downsampler(DownsampleRule(mode="last", window=60), emit)
+        sampler.offer(1, "sensor", {"t": 1})
+        await sampler.flush()
+        emit.assert_called_once_with(1, "sensor", {"t": 1}, "")
+
+    @pytest.mark.asyncio
+    async def test_emit_failure(self):
+        emit = AsyncMock(side_effect=Exception("broker down"))
+        sampler = downsampler(DownsampleRule(mode="last", window=60), emit)
+        sampler.offer(1, "sensor", {"t": 1})
+        await sampler.flush()  # Logged, not raised
+
+
+class TestMessageHandlerDownsampling:
+    @pytest.fixture
+    def handler(self) -> MessageHandler:
+        channel = AsyncMock(spec=MessageChannel)
+        channel.routing_key = MagicMock(return_value="handler.RECEIVER")
+        handler = MessageHandler(channel)
+        handler._downsampler = Downsampler(
+            handler._emit, types={"sensor": DownsampleRule(mode="last", window=60)}, devices={}
+        )
+        return handler
+
+    @pytest.mark.asyncio
+    async def test_held_until_close(self, handler: MessageHandler):
+        await handler.process_message(1, {"t": 1}, device_type="sensor")
+        await handler.process_message(1, {"t": 2}, device_type="sensor")
+        handler._channel.publish.assert_not_called()
+
+        await handler.close()
+        handler._channel.publish.assert_called_once_with(
+            {"t": 2, "device_id": 1},
+            correlation_id="",
+            content_type="application/json",
+            routing_key="handler.RECEIVER",
+            delivery="confirmed",
+        )
+
+    @pytest.mark.asyncio
+    async def test_alarm_not_downsampled(self, handler: MessageHandler):
+        await handler.process_message(1, {"t": 1}, alarm=True, device_type="sensor")
+        handler._channel.publish.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_other_types_not_downsampled(self, handler: MessageHandler):
+        await handler.process_message(1, {"t": 1}, device_type="camera")
+        handler._channel.publish.assert_called_once()
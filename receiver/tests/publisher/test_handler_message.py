@@ -1,17 +1,181 @@
-from unittest.mock import Mock
+from unittest.mock import AsyncMock, MagicMock
 
+import pytest
+
+from src.delivery import DeliveryPolicy
+from src.errors import BrokerUnavailableError
 from src.queues.channels import MessageChannel
 from src.message_handler import MessageHandler
+from src.models import RawMessage
+
+
+def mock_channel() -> AsyncMock:
+    channel = AsyncMock(spec=MessageChannel)
+    channel.routing_key = MagicMock(return_value="handler.RECEIVER")
+    return channel
 
 
 class TestMessageHandler:
-    def test_process_message(self):
-        message_handler = MessageHandler()
-        message_handler._channel = Mock(spec=MessageChannel)
-        message_handler.process_message(1, {"message": "Hello!"})
+    @pytest.mark.asyncio
+    async def test_process_message(self):
+        message_handler = MessageHandler(mock_channel())
+        await message_handler.process_message(1, {"message": "Hello!"})
 
         message_handler._channel.publish.assert_called_with(
             {'message': 'Hello!', 'device_id': 1},
             correlation_id='',
-            content_type='application/json'
+            content_type='application/json',
+            routing_key='handler.RECEIVER',
+            message_id=None,
+            delivery='confirmed',
+            )
+
+    @pytest.mark.asyncio
+    async def test_process_message_with_message_id(self):
+        message_handler = MessageHandler(mock_channel())
+        await message_handler.process_message(1, {"message": "Hello!"}, "reading-42")
+
+        assert message_handler._channel.publish.call_args.kwargs["message_id"] == "reading-42"
+
+    @pytest.mark.asyncio
+    async def test_process_raw_message(self):
+        message_handler = MessageHandler(mock_channel())
+        await message_handler.process_message(1, RawMessage(b'{"message": "Hello!"}', "gzip"))
+
+        message_handler._channel.publish.assert_called_with(
+            b'{"message": "Hello!"}',
+            correlation_id='',
+            content_type='application/json',
+            headers={'device_id': 1},
+            routing_key='handler.RECEIVER',
+            content_encoding='gzip',
+            message_id=None,
+            delivery='confirmed',
+            )
+
+    @pytest.mark.asyncio
+    async def test_process_binary_message(self):
+        message_handler = MessageHandler(mock_channel())
+        await message_handler.process_message(1, RawMessage(b"\x80", content_type="application/cbor"))
+
+        message_handler._channel.publish.assert_called_with(
+            b"\x80",
+            correlation_id='',
+            content_type='application/cbor',
+            headers={'device_id': 1},
+            routing_key='handler.RECEIVER',
+            content_encoding=None,
+            message_id=None,
+            delivery='confirmed',
             )
+
+    @pytest.mark.asyncio
+    async def test_process_message_broker_unavailable(self):
+        message_handler = MessageHandler(mock_channel())
+        message_handler._channel.publish.side_effect = BrokerUnavailableError("down")
+
+        with pytest.raises(BrokerUnavailableError):
+            await message_handler.process_message(1, {"message": "Hello!"})
+
+    @pytest.mark.asyncio
+    async def test_process_message_publish_error(self):
+        message_handler = MessageHandler(mock_channel())
+        message_handler._channel.publish.side_effect = AttributeError("no channel")
+
+        with pytest.raises(BrokerUnavailableError):
+            await message_handler.process_message(1, {"message": "Hello!"})
+
+    @pytest.mark.asyncio
+    async def test_process_message_unexpected_error(self):
+        message_handler = MessageHandler(mock_channel())
+        message_handler._channel.publish.side_effect = ValueError("bug")
+
+        with pytest.raises(ValueError):
+            await message_handler.process_message(1, {"message": "Hello!"})
+
+    @pytest.mark.asyncio
+    async def test_process_batch_publish_error(self):
+        message_handler = MessageHandler(mock_channel())
+        message_handler._channel.publish_batch.side_effect = AttributeError("no channel")
+
+        with pytest.raises(BrokerUnavailableError):
+            await message_handler.process_batch(1, [{"a": 1}])
+
+    @pytest.mark.asyncio
+    async def test_process_batch(self):
+        message_handler = MessageHandler(mock_channel())
+        message_handler._channel.publish_batch.return_value = 2
+
+        results = await message_handler.process_batch(1, [{"a": 1}, "not an object", {"b": 2}])
+
+        message_handler._channel.publish_batch.assert_called_with(
+            [{'a': 1, 'device_id': 1}, {'b': 2, 'device_id': 1}],
+            correlation_id='',
+            content_type='application/json',
+            routing_key='handler.RECEIVER',
+            delivery='confirmed',
+            )
+        assert [r.status for r in results] == ["accepted", "rejected", "accepted"]
+
+    @pytest.mark.asyncio
+    async def test_process_batch_partially_published(self):
+        message_handler = MessageHandler(mock_channel())
+        message_handler._channel.publish_batch.return_value = 1
+
+        results = await message_handler.process_batch(1, [{"a": 1}, {"b": 2}])
+
+        assert [r.status for r in results] == ["accepted", "rejected"]
+        assert results[1].detail is not None
+
+    @pytest.mark.asyncio
+    async def test_process_batch_alarms_first(self):
+        message_handler = MessageHandler(mock_channel())
+        message_handler._channel.routing_key.side_effect = (
+            lambda device_id, alarm=False: "handler.alarms.RECEIVER" if alarm else "handler.RECEIVER"
+        )
+        message_handler._channel.publish_batch.side_effect = lambda items, **kwargs: len(items)
+
+        results = await message_handler.process_batch(
+            1, [{"a": 1}, {"priority": "alarm"}], classify=lambda item: "priority" in item
+        )
+
+        calls = message_handler._channel.publish_batch.call_args_list
+        assert [(c.args[0], c.kwargs["routing_key"]) for c in calls] == [
+            ([{"priority": "alarm", "device_id": 1}], "handler.alarms.RECEIVER"),
+            ([{"a": 1, "device_id": 1}], "handler.RECEIVER"),
+        ]
+        assert [r.status for r in results] == ["accepted", "accepted"]
+
+    @pytest.mark.asyncio
+    async def test_process_batch_telemetry_unavailable_after_alarms(self):
+        message_handler = MessageHandler(mock_channel())
+        message_handler._channel.publish_batch.side_effect = [1, BrokerUnavailableError("down")]
+
+        results = await message_handler.process_batch(
+            1, [{"a": 1}, {"priority": "alarm"}], classify=lambda item: "priority" in item
+        )
+
+        # The alarm was handed to the broker, only the telemetry item is to be retried
+        assert [r.status for r in results] == ["rejected", "accepted"]
+
+
+class TestDeliveryPolicy:
+    def test_mode(self):
+        policy = DeliveryPolicy("confirmed", {"meter": "spooled"}, {7: "transient"})
+
+        assert policy.mode(1) == "confirmed"
+        assert policy.mode(1, "meter") == "spooled"
+        assert policy.mode(7, "meter") == "transient"
+
+    @pytest.mark.asyncio
+    async def test_process_message_delivery(self, monkeypatch):
+        monkeypatch.setattr(
+            "src.message_handler.delivery_policy", DeliveryPolicy("confirmed", {"gps": "transient"}, {})
+        )
+        message_handler = MessageHandler(mock_channel())
+
+        await message_handler.process_message(1, {}, device_type="gps")
+        assert message_handler._channel.publish.call_args.kwargs["delivery"] == "transient"
+
+        await message_handler.process_message(1, {}, alarm=True, device_type="gps")
+        assert message_handler._channel.publish.call_args.kwargs["delivery"] == "confirmed"
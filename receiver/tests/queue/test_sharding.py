@@ -0,0 +1,22 @@
+from collections import Counter
+
+from src.queues.sharding import jump_hash
+
+
+def test_jump_hash_in_range():
+    assert all(0 <= jump_hash(key, 7) < 7 for key in range(1000))
+
+
+def test_jump_hash_single_bucket():
+    assert {jump_hash(key, 1) for key in range(100)} == {0}
+
+
+def test_jump_hash_balanced():
+    counts = Counter(jump_hash(key, 4) for key in range(10000))
+    assert all(2000 < count < 3000 for count in counts.values())
+
+
+def test_jump_hash_moves_only_to_the_new_bucket():
+    for key in range(1000):
+        before, after = jump_hash(key, 4), jump_hash(key, 5)
+        assert after == before or after == 4
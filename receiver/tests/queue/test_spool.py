@@ -0,0 +1,161 @@
+import pytest
+
+from src.errors import BrokerUnavailableError
+from src.queues.spool import Spool, decode_record, encode_record
+
+
+class TestSpool:
+    @pytest.fixture()
+    def spool(self, tmp_path) -> Spool:
+        return Spool(
+            directory=str(tmp_path),
+            segment_size=64,
+            max_bytes=1024,
+            fsync_interval=0.001,
+            fsync_batch=2,
+        )
+
+    @pytest.mark.asyncio
+    async def test_append_and_replay_in_order(self, spool: Spool):
+        spool.open()
+        await spool.append(b"first", b"second")
+        await spool.append(b"third")
+        await spool.seal()
+
+        records = [record for segment in spool.segments() for _, record in spool.replay(segment)]
+        assert records == [b"first", b"second", b"third"]
+        await spool.close()
+
+    @pytest.mark.asyncio
+    async def test_rotates_segments(self, spool: Spool):
+        spool.open()
+        for i in range(10):
+            await spool.append(b"x" * 20 + str(i).encode())
+        await spool.seal()
+
+        assert len(spool.segments()) > 1
+        records = [record for segment in spool.segments() for _, record in spool.replay(segment)]
+        assert records == [b"x" * 20 + str(i).encode() for i in range(10)]
+        await spool.close()
+
+    @pytest.mark.asyncio
+    async def test_is_empty_after_remove(self, spool: Spool):
+        spool.open()
+        assert spool.is_empty()
+        await spool.append(b"record")
+        assert not spool.is_empty()
+
+        await spool.seal()
+        for segment in spool.segments():
+            spool.remove(segment)
+        assert spool.is_empty()
+        assert spool.size == 0
+        await spool.close()
+
+    @pytest.mark.asyncio
+    async def test_replay_resumes_from_drained_offset(self, spool: Spool):
+        spool.open()
+        await spool.append(b"first", b"second")
+        await spool.seal()
+
+        [segment] = spool.segments()
+        end, _ = next(spool.replay(segment))
+        spool.drained(segment, end)
+        assert [record for _, record in spool.replay(segment)] == [b"second"]
+        await spool.close()
+
+    @pytest.mark.asyncio
+    async def test_recovers_segments(self, spool: Spool, tmp_path):
+        spool.open()
+        await spool.append(b"record")
+        await spool.close()
+
+        recovered = Spool(directory=str(tmp_path))
+        recovered.open()
+        assert not recovered.is_empty()
+        [segment] = recovered.segments()
+        assert [record for _, record in recovered.replay(segment)] == [b"record"]
+        await recovered.close()
+
+    @pytest.mark.asyncio
+    async def test_workers_claim_their_own_slot(self, spool: Spool, tmp_path):
+        spool.open()
+        await spool.append(b"record")
+
+        other = Spool(directory=str(tmp_path))
+        other.open()
+        assert other.is_empty()
+        await other.close()
+        await spool.close()
+
+        # The slot of a stopped worker is taken over with its segments
+        restarted = Spool(directory=str(tmp_path))
+        restarted.open()
+        assert not restarted.is_empty()
+        await restarted.close()
+
+    @pytest.mark.asyncio
+    async def test_drained_offset_survives_restart(self, spool: Spool, tmp_path):
+        spool.open()
+        await spool.append(b"first", b"second")
+        await spool.seal()
+        [segment] = spool.segments()
+        end, _ = next(spool.replay(segment))
+        spool.drained(segment, end)
+        await spool.close()
+
+        restarted = Spool(directory=str(tmp_path))
+        restarted.open()
+        [segment] = restarted.segments()
+        assert [record for _, record in restarted.replay(segment)] == [b"second"]
+        restarted.remove(segment)
+        assert not list(segment.parent.glob(f"*{Spool.OFFSET_SUFFIX}"))
+        await restarted.close()
+
+    @pytest.mark.asyncio
+    async def test_orphaned_slot_is_adopted(self, spool: Spool, tmp_path):
+        spool.open()
+        second = Spool(directory=str(tmp_path))
+        second.open()  # worker-1
+        await second.append(b"first", b"second")
+        await second.seal()
+        [segment] = second.segments()
+        end, _ = next(second.replay(segment))
+        second.drained(segment, end)
+        await second.close()
+        await spool.close()
+
+        # Fewer workers now: worker-0 drains the segments of worker-1 too
+        restarted = Spool(directory=str(tmp_path))
+        restarted.open()
+        [segment] = restarted.segments()
+        assert segment.parent.name == "worker-0"
+        assert [record for _, record in restarted.replay(segment)] == [b"second"]
+        assert not list((tmp_path / "worker-1").glob(f"*{Spool.SUFFIX}"))
+        await restarted.close()
+
+    @pytest.mark.asyncio
+    async def test_truncated_record_is_skipped(self, spool: Spool):
+        spool.open()
+        await spool.append(b"first", b"second")
+        await spool.seal()
+
+        [segment] = spool.segments()
+        with open(segment, "r+b") as file:
+            file.truncate(segment.stat().st_size - 2)
+        assert [record for _, record in spool.replay(segment)] == [b"first"]
+        await spool.close()
+
+    @pytest.mark.asyncio
+    async def test_full(self, spool: Spool):
+        spool.open()
+        with pytest.raises(BrokerUnavailableError):
+            await spool.append(b"x" * 2048)
+        await spool.close()
+
+
+def test_record_roundtrip():
+    record = encode_record(b'{"a": 1}\n', {"correlation_id": "abc", "content_type": "application/json"})
+    body, header = decode_record(record)
+    assert body == b'{"a": 1}\n'
+    assert header == {"correlation_id": "abc", "content_type": "application/json"}
@@ -0,0 +1,99 @@
+from unittest.mock import AsyncMock
+
+import pytest
+from fastapi.testclient import TestClient
+
+import src.route.dedupe as dedupe
+from src.main import app
+from src.message_handler import MessageHandler, get_handler
+from src.route.dedupe import DedupeWindow, dedupe_window
+from src.route.dependencies import create_device_access_token
+
+
+class TestDedupeWindow:
+    def test_seen_after_add(self):
+        window = DedupeWindow(window=60, max_keys=10)
+        assert not window.seen(1, "a")
+        window.add(1, "a")
+        assert window.seen(1, "a")
+        assert not window.seen(2, "a")  # The keys are per device
+
+    def test_keys_expire(self, monkeypatch):
+        now = [100.0]
+        monkeypatch.setattr(dedupe, "monotonic", lambda: now[0])
+        window = DedupeWindow(window=60, max_keys=10)
+        window.add(1, "a")
+        now[0] += 61
+        assert not window.seen(1, "a")
+        window.add(1, "b")
+        assert len(window) == 1  # The expired key is dropped
+
+    def test_bounded(self):
+        window = DedupeWindow(window=60, max_keys=2)
+        for key in "abc":
+            window.add(1, key)
+        assert len(window) == 2
+        assert not window.seen(1, "a")
+        assert window.seen(1, "c")
+
+    def test_disabled(self):
+        window = DedupeWindow(window=0, max_keys=10)
+        window.add(1, "a")
+        assert not window.seen(1, "a")
+
+    def test_pending_until_end(self):
+        window = DedupeWindow(window=60, max_keys=10)
+        window.begin(1, "a")
+        assert window.pending(1, "a") and not window.seen(1, "a")
+        window.end(1, "a", accepted=False)
+        assert not window.pending(1, "a") and not window.seen(1, "a")
+
+        window.begin(1, "a")
+        window.end(1, "a", accepted=True)
+        assert not window.pending(1, "a") and window.seen(1, "a")
+
+
+class TestIdempotentListener:
+    @pytest.fixture()
+    def handler(self):
+        handler = AsyncMock(spec=MessageHandler)
+        app.dependency_overrides[get_handler] = lambda: handler
+        dedupe_window.clear()
+        yield handler
+        dedupe_window.clear()
+        app.dependency_overrides.pop(get_handler)
+
+    def test_retry_is_not_published_again(self, client: TestClient, handler):
+        token = create_device_access_token(51)
+        headers = {"Authorization": f"Bearer {token}", "Idempotency-Key": "reading-1"}
+        first = client.post("/", headers=headers, json={"a": 1})
+        retry = client.post("/", headers=headers, json={"a": 1})
+
+        assert first.status_code == retry.status_code == 202
+        assert "Idempotent-Replayed" not in first.headers
+        assert retry.headers["Idempotent-Replayed"] == "true"
+        handler.process_message.assert_called_once_with(51, {"a": 1}, "reading-1", alarm=False, device_type=None)
+
+    def test_failed_publish_can_be_retried(self, client: TestClient, handler):
+        token = create_device_access_token(52)
+        headers = {"Authorization": f"Bearer {token}", "X-Message-ID": "reading-1"}
+        handler.process_message.side_effect = [ConnectionError("down"), None]
+        with pytest.raises(ConnectionError):
+            client.post("/", headers=headers, json={"a": 1})
+        assert client.post("/", headers=headers, json={"a": 1}).status_code == 202
+        assert handler.process_message.call_count == 2
+
+    def test_concurrent_retry_is_not_published(self, client: TestClient, handler):
+        token = create_device_access_token(54)
+        headers = {"Authorization": f"Bearer {token}", "Idempotency-Key": "reading-1"}
+        dedupe_window.begin(54, "reading-1")  # The first one being published
+        response = client.post("/", headers=headers, json={"a": 1})
+
+        assert response.status_code == 409
+        assert response.headers["Retry-After"] == "1"
+        handler.process_message.assert_not_called()
+
+    def test_key_too_long(self, client: TestClient, handler):
+        token = create_device_access_token(53)
+        headers = {"Authorization": f"Bearer {token}", "Idempotency-Key": "k" * 1000}
+        assert client.post("/", headers=headers, json={"a": 1}).status_code == 422
@@ -0,0 +1,45 @@
+import gzip
+import zlib
+
+import pytest
+import zstandard  # type: ignore
+
+from src.route.encoding import (
+    DecompressedTooLargeError,
+    UnsupportedEncodingError,
+    decompress,
+)
+
+
+def test_gzip():
+    assert decompress(gzip.compress(b'{"a": 1}'), "gzip", 100) == b'{"a": 1}'
+
+
+def test_gzip_up_to_the_limit():
+    assert decompress(gzip.compress(b"0" * 100), "gzip", 100) == b"0" * 100
+
+
+def test_gzip_bomb():
+    with pytest.raises(DecompressedTooLargeError):
+        decompress(gzip.compress(b"0" * 10_000_000), "gzip", 1024)
+
+
+def test_gzip_truncated():
+    with pytest.raises(zlib.error):
+        decompress(gzip.compress(b'{"a": 1}')[:-6], "gzip", 100)
+
+
+def test_unsupported():
+    with pytest.raises(UnsupportedEncodingError):
+        decompress(b"", "br", 100)
+
+
+def test_zstd():
+    body = zstandard.ZstdCompressor().compress(b'{"a": 1}')
+    assert decompress(body, "zstd", 100) == b'{"a": 1}'
+
+
+def test_zstd_bomb():
+    body = zstandard.ZstdCompressor().compress(b"0" * 10_000_000)
+    with pytest.raises(DecompressedTooLargeError):
+        decompress(body, "zstd", 1024)
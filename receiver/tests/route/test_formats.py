@@ -0,0 +1,29 @@
+import cbor2  # type: ignore
+import msgpack  # type: ignore
+import pytest
+
+from src.route.formats import CBOR_CONTENT_TYPE, MSGPACK_CONTENT_TYPE, decode, is_map
+
+
+@pytest.mark.parametrize(
+    "body, content_type, expected",
+    [
+        (b"\x80", MSGPACK_CONTENT_TYPE, True),
+        (b"\xde\x00\x00", MSGPACK_CONTENT_TYPE, True),
+        (b"\x90", MSGPACK_CONTENT_TYPE, False),
+        (b"\xa0", CBOR_CONTENT_TYPE, True),
+        (b"\xbf\xff", CBOR_CONTENT_TYPE, True),
+        (b"\x80", CBOR_CONTENT_TYPE, False),
+        (b"", CBOR_CONTENT_TYPE, False),
+    ],
+)
+def test_is_map(body: bytes, content_type: str, expected: bool):
+    assert is_map(body, content_type) is expected
+
+
+def test_decode_msgpack():
+    assert decode(msgpack.packb({"a": 1}), MSGPACK_CONTENT_TYPE) == {"a": 1}
+
+
+def test_decode_cbor():
+    assert decode(cbor2.dumps({"a": 1}), CBOR_CONTENT_TYPE) == {"a": 1}
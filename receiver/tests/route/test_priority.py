@@ -0,0 +1,59 @@
+from unittest.mock import AsyncMock
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src.config import settings
+from src.main import app
+from src.message_handler import MessageHandler, get_handler
+from src.route.dependencies import create_device_access_token
+from src.route.priority import is_alarm
+
+
+@pytest.fixture
+def lane(monkeypatch):
+    monkeypatch.setattr(settings, "PRIORITY_LANE", True)
+    monkeypatch.setattr(settings, "ALARM_DEVICE_TYPES", ["smoke"])
+
+
+class TestIsAlarm:
+    def test_disabled(self):
+        assert not is_alarm("smoke", "alarm", {"priority": "alarm"})
+
+    def test_device_type(self, lane):
+        assert is_alarm("smoke", None, {})
+        assert not is_alarm("thermometer", None, {})
+
+    def test_header(self, lane):
+        assert is_alarm(None, " Alarm ", {})
+        assert not is_alarm(None, "low", {})
+
+    def test_payload_field(self, lane):
+        assert is_alarm(None, None, {"priority": "critical"})
+        assert is_alarm(None, None, {"priority": True})
+        assert not is_alarm(None, None, {"priority": "low"})
+        assert not is_alarm(None, None, {"value": 1})
+
+    def test_raw_payload(self, lane):
+        assert not is_alarm(None, None, b"\x81\xa8priority\xa5alarm")
+
+
+class TestAlarmListener:
+    @pytest.fixture
+    def handler(self):
+        handler = AsyncMock(spec=MessageHandler)
+        app.dependency_overrides[get_handler] = lambda: handler
+        yield handler
+        app.dependency_overrides.pop(get_handler)
+
+    def test_alarm_header(self, client: TestClient, handler, lane):
+        headers = {"Authorization": f"Bearer {create_device_access_token(71)}", "X-Priority": "alarm"}
+        response = client.post("/", headers=headers, json={"smoke": 1})
+        assert response.status_code == 202
+        handler.process_message.assert_called_once_with(71, {"smoke": 1}, None, alarm=True, device_type=None)
+
+    def test_telemetry(self, client: TestClient, handler, lane):
+        headers = {"Authorization": f"Bearer {create_device_access_token(71)}"}
+        response = client.post("/", headers=headers, json={"temperature": 1})
+        assert response.status_code == 202
+        handler.process_message.assert_called_once_with(71, {"temperature": 1}, None, alarm=False, device_type=None)
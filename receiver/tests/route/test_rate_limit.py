@@ -0,0 +1,88 @@
+from unittest.mock import AsyncMock
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src.main import app
+from src.message_handler import MessageHandler, get_handler
+from src.route.dependencies import create_device_access_token
+from src.route.rate_limit import RateLimiter, rate_limiter
+
+
+class TestRateLimiter:
+    def test_burst_then_limited(self):
+        limiter = RateLimiter(rate=1, burst=3, max_devices=10, overrides={})
+        assert [limiter.acquire(1) for _ in range(3)] == [0, 0, 0]
+        assert 0 < limiter.acquire(1) <= 1
+
+    def test_devices_have_their_own_bucket(self):
+        limiter = RateLimiter(rate=1, burst=1, max_devices=10, overrides={})
+        assert limiter.acquire(1) == 0
+        assert limiter.acquire(2) == 0
+        assert limiter.acquire(1) > 0
+
+    def test_refill(self, monkeypatch):
+        now = [100.0]
+        monkeypatch.setattr("src.route.rate_limit.monotonic", lambda: now[0])
+        limiter = RateLimiter(rate=2, burst=2, max_devices=10, overrides={})
+        limiter.acquire(1, cost=2)
+        assert limiter.acquire(1) == pytest.approx(0.5)
+        now[0] += 0.5
+        assert limiter.acquire(1) == 0
+
+    def test_cost_above_burst_leaves_debt(self, monkeypatch):
+        now = [100.0]
+        monkeypatch.setattr("src.route.rate_limit.monotonic", lambda: now[0])
+        limiter = RateLimiter(rate=1, burst=5, max_devices=10, overrides={})
+        assert limiter.acquire(1, cost=10) == 0
+        assert limiter.acquire(1) == pytest.approx(6)
+
+    def test_device_type_override(self):
+        limiter = RateLimiter(rate=1, burst=1, max_devices=10, overrides={"camera": (1, 3)})
+        assert [limiter.acquire(1, "camera") for _ in range(3)] == [0, 0, 0]
+        assert limiter.acquire(2, "sensor") == 0
+        assert limiter.acquire(2, "sensor") > 0
+
+    def test_evicts_idle_devices(self):
+        limiter = RateLimiter(rate=1, burst=1, max_devices=2, overrides={})
+        limiter.acquire(1)
+        limiter.acquire(2)
+        limiter.acquire(3)
+        assert list(limiter._buckets) == [2, 3]
+
+    def test_disabled(self):
+        limiter = RateLimiter(rate=0, burst=1, max_devices=10, overrides={})
+        assert all(limiter.acquire(1) == 0 for _ in range(10))
+
+
+class TestRateLimitedListener:
+    @pytest.fixture()
+    def handler(self):
+        handler = AsyncMock(spec=MessageHandler)
+        app.dependency_overrides[get_handler] = lambda: handler
+        limiter = dict(rate_limiter.__dict__)
+        rate_limiter._rate, rate_limiter._burst = 1, 2
+        rate_limiter.clear()
+        yield handler
+        rate_limiter.__dict__.update(limiter)
+        rate_limiter.clear()
+        app.dependency_overrides.pop(get_handler)
+
+    def test_listener_returns_429(self, client: TestClient, handler):
+        token = create_device_access_token(21)
+        headers = {"Authorization": f"Bearer {token}"}
+        for _ in range(2):
+            assert client.post("/", headers=headers, json={"message": "Hello!"}).status_code == 202
+
+        response = client.post("/", headers=headers, json={"message": "Hello!"})
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "1"
+        assert handler.process_message.call_count == 2
+
+    def test_batch_counts_every_item(self, client: TestClient, handler):
+        token = create_device_access_token(22)
+        headers = {"Authorization": f"Bearer {token}"}
+        assert client.post("/batch", headers=headers, json=[{"a": 1}, {"b": 2}, {"c": 3}]).status_code == 202
+
+        response = client.post("/batch", headers=headers, json=[{"a": 1}])
+        assert response.status_code == 429
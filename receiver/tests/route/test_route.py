@@ -1,10 +1,18 @@
+import gzip
 from time import sleep
+from unittest.mock import AsyncMock
 
+import cbor2  # type: ignore
+import msgpack  # type: ignore
 import pytest
 from fastapi.testclient import TestClient
 
+from src.config import settings
+from src.errors import BrokerUnavailableError
+from src.main import app
+from src.message_handler import MessageHandler, get_handler
 from src.route.dependencies import create_device_access_token
-from src.models import MessageTest
+from src.models import MessageTest, RawMessage
 
 
 class TestListnerEndPoint:
@@ -52,6 +60,188 @@ class TestListnerEndPoint:
         sleep(3)
 
 
+class TestListenerPayload:
+    @pytest.fixture(scope="class")
+    def token(self):
+        token = create_device_access_token(1)
+        return token
+
+    @pytest.fixture()
+    def handler(self):
+        handler = AsyncMock(spec=MessageHandler)
+        app.dependency_overrides[get_handler] = lambda: handler
+        yield handler
+        app.dependency_overrides.pop(get_handler)
+
+    @pytest.fixture()
+    def passthrough(self):
+        settings.RAW_PASSTHROUGH = True
+        yield
+        settings.RAW_PASSTHROUGH = False
+
+    def test_listener_parsed_payload(self, token: str, client: TestClient, handler):
+        response = client.post("/", headers={"Authorization": f"Bearer {token}"}, json={"message": "Hello!"})
+        assert response.status_code == 202
+        handler.process_message.assert_called_once_with(1, {"message": "Hello!"}, None, alarm=False, device_type=None)
+
+    def test_listener_payload_not_object(self, token: str, client: TestClient, handler):
+        response = client.post("/", headers={"Authorization": f"Bearer {token}"}, json=["Hello!"])
+        assert response.status_code == 422
+        handler.process_message.assert_not_called()
+
+    def test_listener_raw_passthrough(self, token: str, client: TestClient, handler, passthrough):
+        body = b'{"message":  "Hello!"}'
+        response = client.post("/", headers={"Authorization": f"Bearer {token}"}, content=body)
+        assert response.status_code == 202
+        handler.process_message.assert_called_once_with(1, RawMessage(body), None, alarm=False, device_type=None)
+
+    def test_listener_gzip_payload(self, token: str, client: TestClient, handler):
+        headers = {"Authorization": f"Bearer {token}", "Content-Encoding": "gzip"}
+        response = client.post("/", headers=headers, content=gzip.compress(b'{"message": "Hello!"}'))
+        assert response.status_code == 202
+        handler.process_message.assert_called_once_with(1, {"message": "Hello!"}, None, alarm=False, device_type=None)
+
+    def test_listener_gzip_bomb(self, token: str, client: TestClient, handler):
+        headers = {"Authorization": f"Bearer {token}", "Content-Encoding": "gzip"}
+        body = gzip.compress(b'{"a": "' + b"0" * (settings.MAX_DECOMPRESSED_BYTES + 1) + b'"}')
+        response = client.post("/", headers=headers, content=body)
+        assert response.status_code == 413
+        handler.process_message.assert_not_called()
+
+    def test_listener_invalid_gzip(self, token: str, client: TestClient, handler):
+        headers = {"Authorization": f"Bearer {token}", "Content-Encoding": "gzip"}
+        response = client.post("/", headers=headers, content=b'{"message": "Hello!"}')
+        assert response.status_code == 400
+
+    def test_listener_unsupported_encoding(self, token: str, client: TestClient, handler):
+        headers = {"Authorization": f"Bearer {token}", "Content-Encoding": "br"}
+        response = client.post("/", headers=headers, content=b"...")
+        assert response.status_code == 415
+
+    def test_listener_raw_passthrough_keeps_compressed(self, token: str, client: TestClient, handler, passthrough):
+        settings.MESSAGES_KEEP_COMPRESSED = True
+        try:
+            body = gzip.compress(b'{"message": "Hello!"}')
+            headers = {"Authorization": f"Bearer {token}", "Content-Encoding": "gzip"}
+            response = client.post("/", headers=headers, content=body)
+        finally:
+            settings.MESSAGES_KEEP_COMPRESSED = False
+        assert response.status_code == 202
+        handler.process_message.assert_called_once_with(1, RawMessage(body, "gzip"), None, alarm=False, device_type=None)
+
+    def test_listener_raw_passthrough_not_object(self, token: str, client: TestClient, handler, passthrough):
+        response = client.post("/", headers={"Authorization": f"Bearer {token}"}, content=b'["Hello!"]')
+        assert response.status_code == 422
+        handler.process_message.assert_not_called()
+
+    def test_listener_msgpack_payload(self, token: str, client: TestClient, handler):
+        body = msgpack.packb({"message": "Hello!"})
+        headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/x-msgpack"}
+        response = client.post("/", headers=headers, content=body)
+        assert response.status_code == 202
+        handler.process_message.assert_called_once_with(
+            1, RawMessage(body, content_type="application/msgpack"), None, alarm=False, device_type=None
+        )
+
+    def test_listener_cbor_payload(self, token: str, client: TestClient, handler):
+        body = cbor2.dumps({"message": "Hello!"})
+        headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/cbor"}
+        response = client.post("/", headers=headers, content=body)
+        assert response.status_code == 202
+        handler.process_message.assert_called_once_with(
+            1, RawMessage(body, content_type="application/cbor"), None, alarm=False, device_type=None
+        )
+
+    def test_listener_msgpack_not_map(self, token: str, client: TestClient, handler):
+        headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/msgpack"}
+        response = client.post("/", headers=headers, content=msgpack.packb(["Hello!"]))
+        assert response.status_code == 422
+        handler.process_message.assert_not_called()
+
+    def test_listener_invalid_cbor(self, token: str, client: TestClient, handler):
+        headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/cbor"}
+        response = client.post("/", headers=headers, content=b"\xa1\x61")
+        assert response.status_code == 422
+
+    def test_listener_binary_raw_passthrough(self, token: str, client: TestClient, handler, passthrough):
+        body = b"\x81\xa7message\xa6Hello!"  # MessagePack {"message": "Hello!"}
+        headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/msgpack"}
+        response = client.post("/", headers=headers, content=body)
+        assert response.status_code == 202
+        handler.process_message.assert_called_once_with(
+            1, RawMessage(body, content_type="application/msgpack"), None, alarm=False, device_type=None
+        )
+
+    def test_listener_binary_raw_passthrough_not_map(self, token: str, client: TestClient, handler, passthrough):
+        headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/cbor"}
+        response = client.post("/", headers=headers, content=b"\x81\x01")  # CBOR [1]
+        assert response.status_code == 422
+
+
+class TestListenerBrokerUnavailable:
+    @pytest.fixture(scope="class")
+    def token(self):
+        token = create_device_access_token(1)
+        return token
+
+    @pytest.fixture()
+    def unavailable(self):
+        handler = AsyncMock(spec=MessageHandler)
+        handler.process_message.side_effect = BrokerUnavailableError("down", retry_after=7)
+        handler.process_batch.side_effect = BrokerUnavailableError("down", retry_after=7)
+        app.dependency_overrides[get_handler] = lambda: handler
+        yield handler
+        app.dependency_overrides.pop(get_handler)
+
+    def test_listener_returns_503(self, token: str, client: TestClient, unavailable):
+        response = client.post("/", headers={"Authorization": f"Bearer {token}"}, json={"message": "Hello!"})
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "7"
+
+    def test_batch_returns_503(self, token: str, client: TestClient, unavailable):
+        response = client.post("/batch", headers={"Authorization": f"Bearer {token}"}, json=[{"message": "Hello!"}])
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "7"
+
+
+# The accepted items need a RabbitMQ server running
+class TestBatchListenerEndPoint:
+    @pytest.fixture(scope="class")
+    def token(self):
+        token = create_device_access_token(1)
+        return token
+
+    def test_batch_json_array(self, token: str, client: TestClient):
+        payload = [{"message": "Hello!"}, {"message": "World!"}]
+        response = client.post("/batch", headers={"Authorization": f"Bearer {token}"}, json=payload)
+        assert response.status_code == 202
+        assert response.json()["accepted"] == 2
+
+    def test_batch_ndjson(self, token: str, client: TestClient):
+        body = '{"message": "Hello!"}\nnot json\n{"message": "World!"}\n'
+        response = client.post(
+            "/batch",
+            headers={"Authorization": f"Bearer {token}", "Content-Type": "application/x-ndjson"},
+            content=body,
+        )
+        assert response.status_code == 202
+        data = response.json()
+        assert data["accepted"] == 2
+        assert data["results"][1]["status"] == "rejected"
+
+    def test_batch_not_array(self, token: str, client: TestClient):
+        response = client.post("/batch", headers={"Authorization": f"Bearer {token}"}, json={"message": "Hello!"})
+        assert response.status_code == 422
+
+    def test_batch_empty(self, token: str, client: TestClient):
+        response = client.post("/batch", headers={"Authorization": f"Bearer {token}"}, json=[])
+        assert response.status_code == 422
+
+    def test_batch_invalid_token(self, client: TestClient):
+        response = client.post("/batch", headers={"Authorization": "Bearer invalid_token"}, json=[{"message": "Hello!"}])
+        assert response.status_code == 403
+
+
 class TestTestToken:
     @pytest.fixture(scope="class")
     def token(self):
@@ -68,4 +258,22 @@ class TestTestToken:
     
     def test_test_token_not_bearer(self, client: TestClient) -> None:
         response = client.post("/test-token", headers={"Authorization ": "invalid_token"},)
-        assert response.status_code == 401
\ No newline at end of file
+        assert response.status_code == 401
+
+class TestReadiness:
+    def test_ready_broker_down(self, client: TestClient) -> None:
+        app.state.message_channel.status = lambda: False
+        response = client.get("/ready")
+        assert response.status_code == 503
+        assert response.json() == {"ready": False, "broker": False}
+
+    def test_ready(self, client: TestClient) -> None:
+        app.state.message_channel.status = lambda: True
+        response = client.get("/ready")
+        assert response.status_code == 200
+        assert response.json()["ready"] is True
+
+    def test_handler_built_in_lifespan(self, client: TestClient) -> None:
+        handler = app.state.message_handler
+        assert isinstance(handler, MessageHandler)
+        assert handler._channel is app.state.message_channel
@@ -0,0 +1,119 @@
+import gzip
+from unittest.mock import AsyncMock
+
+import httpx
+import jwt
+import pytest
+from fastapi.testclient import TestClient
+
+import src.route.schemas as schemas
+from src.config import settings
+from src.main import app
+from src.message_handler import MessageHandler, get_handler
+from src.models import RawMessage
+from src.route.dependencies import create_device_access_token
+from src.route.schemas import SchemaRegistry, schema_registry
+
+SCHEMA = {
+    "type": "object",
+    "properties": {"temperature": {"type": "number"}},
+    "required": ["temperature"],
+}
+
+
+class TestSchemaRegistry:
+    def test_validate(self):
+        registry = SchemaRegistry()
+        registry.set_schema(1, "sensor", SCHEMA, [10, 11])
+        assert registry.validate(10, {"temperature": 21.5}) is None
+        assert "temperature" in registry.validate(11, {"humidity": 40})
+        assert registry.validate(12, {"humidity": 40}) is None  # No schema for the device
+
+    def test_validate_raw_message(self):
+        registry = SchemaRegistry()
+        registry.set_schema(1, "sensor", SCHEMA, [10])
+        assert registry.validate(10, RawMessage(b'{"temperature": 1}')) is None
+        assert registry.validate(10, RawMessage(gzip.compress(b'{"a": 1}'), "gzip")) is not None
+        assert registry.validate(10, RawMessage(b"not json")) == "Body could not be decoded"
+
+    def test_schema_removed(self):
+        registry = SchemaRegistry()
+        registry.set_schema(1, "sensor", SCHEMA, [10])
+        registry.on_device_event({"method": "schema", "owner_id": 1, "type": "sensor", "schema": None})
+        assert registry.validator(10) is None
+
+    def test_device_type_updated(self):
+        registry = SchemaRegistry()
+        registry.set_schema(1, "sensor", SCHEMA, [10])
+        registry.on_device_event({"method": "update", "device_id": 20, "type": "sensor", "owner_id": 1})
+        registry.on_device_event({"method": "update", "device_id": 10, "type": "other", "owner_id": 1})
+        assert registry.validator(20) is not None
+        assert registry.validator(10) is None
+
+    def test_schemas_are_per_owner(self):
+        registry = SchemaRegistry()
+        registry.set_schema(1, "sensor", SCHEMA, [10])
+        registry.on_device_event({"method": "update", "device_id": 20, "type": "sensor", "owner_id": 2})
+        assert registry.validator(20) is None
+
+    def test_invalid_schema_is_skipped(self):
+        registry = SchemaRegistry()
+        registry.set_schema(1, "sensor", {"type": "not a type"}, [10])
+        assert registry.validator(10) is None
+
+    @pytest.mark.asyncio
+    async def test_sync(self, monkeypatch):
+        def respond(request: httpx.Request) -> httpx.Response:
+            token = request.headers["Authorization"].removeprefix("Bearer ")
+            claims = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+            assert claims["scope"] == schemas.DEVICE_SCHEMAS_SCOPE
+            return httpx.Response(
+                200,
+                json={"schemas": [{"owner_id": 1, "type": "sensor", "schema": SCHEMA, "device_ids": [10]}]},
+            )
+
+        client = httpx.AsyncClient
+        monkeypatch.setattr(settings, "USERAPI_INTERNAL_URL", "http://userapi")
+        monkeypatch.setattr(
+            schemas.httpx,
+            "AsyncClient",
+            lambda **kwargs: client(transport=httpx.MockTransport(respond), **kwargs),
+        )
+        registry = SchemaRegistry()
+        await registry.sync()
+        assert registry.validator(10) is not None
+
+
+class TestSchemaValidatedListener:
+    @pytest.fixture()
+    def handler(self):
+        handler = AsyncMock(spec=MessageHandler)
+        app.dependency_overrides[get_handler] = lambda: handler
+        schema_registry.set_schema(1, "sensor", SCHEMA, [61])
+        yield handler
+        schema_registry.clear()
+        app.dependency_overrides.pop(get_handler)
+
+    def test_invalid_body_is_rejected(self, client: TestClient, handler):
+        headers = {"Authorization": f"Bearer {create_device_access_token(61)}"}
+        response = client.post("/", headers=headers, json={"humidity": 40})
+        assert response.status_code == 422
+        handler.process_message.assert_not_called()
+
+        assert client.post("/", headers=headers, json={"temperature": 21}).status_code == 202
+
+    def test_batch_rejects_invalid_items(self, client: TestClient):
+        channel = AsyncMock()
+        channel.routing_key = lambda device_id, alarm=False: "handler.RECEIVER"
+        channel.publish_batch.return_value = 1
+        app.dependency_overrides[get_handler] = lambda: MessageHandler(channel)
+        schema_registry.set_schema(1, "sensor", SCHEMA, [61])
+        try:
+            headers = {"Authorization": f"Bearer {create_device_access_token(61)}"}
+            response = client.post("/batch", headers=headers, json=[{"temperature": 1}, {"humidity": 2}])
+        finally:
+            schema_registry.clear()
+            app.dependency_overrides.pop(get_handler)
+
+        assert [r["status"] for r in response.json()["results"]] == ["accepted", "rejected"]
+        assert "temperature" in response.json()["results"][1]["detail"]
@@ -0,0 +1,139 @@
+from time import sleep
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import src.route.schemas as schemas
+from src.config import settings
+from src.models import TokenPayload
+from src.route.dependencies import create_device_access_token
+from src.route.token_cache import TokenCache, token_cache
+
+
+class TestTokenCache:
+    def test_miss_then_hit(self):
+        cache = TokenCache(maxsize=10, ttl=60, negative_ttl=60)
+        assert cache.get("token") == (False, None)
+        cache.set("token", TokenPayload(sub=1))
+        assert cache.get("token") == (True, TokenPayload(sub=1))
+
+    def test_negative_entry(self):
+        cache = TokenCache(maxsize=10, ttl=60, negative_ttl=60)
+        cache.set("invalid", None)
+        assert cache.get("invalid") == (True, None)
+
+    def test_entries_expire(self):
+        cache = TokenCache(maxsize=10, ttl=60, negative_ttl=0.01)
+        cache.set("invalid", None)
+        sleep(0.02)
+        assert cache.get("invalid") == (False, None)
+        assert len(cache) == 0
+
+    def test_evicts_least_recently_used(self):
+        cache = TokenCache(maxsize=2, ttl=60, negative_ttl=60)
+        cache.set("a", TokenPayload(sub=1))
+        cache.set("b", TokenPayload(sub=2))
+        cache.get("a")
+        cache.set("c", TokenPayload(sub=3))
+        assert cache.get("b") == (False, None)
+        assert cache.get("a") == (True, TokenPayload(sub=1))
+        assert cache.get("c") == (True, TokenPayload(sub=3))
+
+    def test_remove_event_revokes_device(self):
+        cache = TokenCache(maxsize=10, ttl=60, negative_ttl=60)
+        cache.set("a", TokenPayload(sub=1))
+        cache.set("b", TokenPayload(sub=2))
+        cache.on_device_event({"device_id": 1, "method": "remove"})
+        assert cache.get("a") == (False, None)
+        assert cache.get("b") == (True, TokenPayload(sub=2))
+        assert cache.is_revoked(1)
+
+        cache.on_device_event({"device_id": 1, "method": "add"})
+        assert not cache.is_revoked(1)
+
+    def test_revocations_kept_until_loaded(self):
+        cache = TokenCache(maxsize=2, ttl=0.01, negative_ttl=60)
+        for device_id in (1, 2, 3):
+            cache.revoke(device_id)
+        sleep(0.02)
+        assert all(cache.is_revoked(device_id) for device_id in (1, 2, 3))
+
+        cache.load_device_types({1: None, 4: "camera"})
+        assert not cache.is_revoked(1)
+        assert cache.is_revoked(2), "Missing from the devices loaded"
+        assert not cache.is_revoked(4)
+
+    def test_devices_not_loaded_are_revoked(self):
+        cache = TokenCache(maxsize=10, ttl=60, negative_ttl=60)
+        cache.load_device_types({1: "camera"})
+        assert cache.is_revoked(5)
+
+        cache.on_device_event({"device_id": 5, "method": "add"})
+        assert not cache.is_revoked(5)
+        cache.on_device_event({"device_id": 1, "method": "remove"})
+        assert cache.is_revoked(1)
+
+    def test_update_event_sets_device_type(self):
+        cache = TokenCache(maxsize=10, ttl=60, negative_ttl=60)
+        cache.set("a", TokenPayload(sub=1, type="sensor"))
+        cache.on_device_event({"device_id": 1, "method": "update", "type": "camera"})
+        assert cache.get("a") == (False, None)
+        assert cache.device_type(1, "sensor") == "camera"
+        assert cache.device_type(2, "sensor") == "sensor"
+
+    @pytest.mark.asyncio
+    async def test_sync_loads_device_types(self, monkeypatch):
+        def respond(request: httpx.Request) -> httpx.Response:
+            assert request.url.path == "/devices/types/devices"
+            cache.on_device_event({"device_id": 7, "method": "add"})  # Meanwhile
+            return httpx.Response(200, json={"devices": {"1": "camera", "2": None}})
+
+        client = httpx.AsyncClient
+        monkeypatch.setattr(settings, "USERAPI_INTERNAL_URL", "http://userapi")
+        monkeypatch.setattr(
+            schemas.httpx,
+            "AsyncClient",
+            lambda **kwargs: client(transport=httpx.MockTransport(respond), **kwargs),
+        )
+        cache = TokenCache(maxsize=10, ttl=60, negative_ttl=60)
+        cache.set("a", TokenPayload(sub=1, type="sensor"))
+        await cache.sync()
+        assert cache.get("a") == (False, None)
+        assert cache.is_revoked(3), "Not a device of the user API"
+        assert not cache.is_revoked(7), "Added during the sync"
+        assert cache.device_type(1, "sensor") == "camera"
+        assert cache.device_type(2, "sensor") is None
+        assert cache.device_type(3, "sensor") == "sensor"
+
+
+class TestValidateTokenCache:
+    @pytest.fixture()
+    def cache(self):
+        token_cache.clear()
+        yield token_cache
+        token_cache.clear()
+        token_cache._revoked.clear()
+        token_cache._types.clear()
+        token_cache._loaded = False
+
+    def test_valid_token_is_cached(self, client: TestClient, cache: TokenCache):
+        token = create_device_access_token(11)
+        client.post("/", headers={"Authorization": f"Bearer {token}"}, json={"message": "Hello!"})
+        assert cache.get(token) == (True, TokenPayload(sub=11))
+
+    def test_invalid_token_is_cached(self, client: TestClient, cache: TokenCache):
+        response = client.post("/", headers={"Authorization": "Bearer invalid_token"}, json={})
+        assert response.status_code == 403
+        assert cache.get("invalid_token") == (True, None)
+
+        response = client.post("/", headers={"Authorization": "Bearer invalid_token"}, json={})
+        assert response.status_code == 403
+
+    def test_removed_device_is_rejected(self, client: TestClient, cache: TokenCache):
+        token = create_device_access_token(12)
+        cache.set(token, TokenPayload(sub=12))
+        cache.on_device_event({"device_id": 12, "method": "remove"})
+
+        response = client.post("/", headers={"Authorization": f"Bearer {token}"}, json={"message": "Hello!"})
+        assert response.status_code == 403
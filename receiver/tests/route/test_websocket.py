@@ -0,0 +1,104 @@
+from unittest.mock import AsyncMock
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from src.errors import BrokerUnavailableError
+from src.main import app
+from src.message_handler import MessageHandler, get_handler
+from src.models import RawMessage
+from src.route.dependencies import create_device_access_token
+from src.route.rate_limit import rate_limiter
+from src.route.token_cache import token_cache
+
+
+class TestWebSocketListener:
+    @pytest.fixture(scope="class")
+    def token(self):
+        return create_device_access_token(31)
+
+    @pytest.fixture()
+    def handler(self):
+        handler = AsyncMock(spec=MessageHandler)
+        app.dependency_overrides[get_handler] = lambda: handler
+        yield handler
+        app.dependency_overrides.pop(get_handler)
+
+    def test_frames_are_published_and_acked(self, token: str, client: TestClient, handler):
+        headers = {"Authorization": f"Bearer {token}"}
+        with client.websocket_connect("/ws", headers=headers) as websocket:
+            for i in range(3):
+                websocket.send_json({"reading": i})
+            acks = [websocket.receive_json() for _ in range(3)]
+
+        assert acks == [{"seq": n, "status": 202} for n in (1, 2, 3)]
+        assert [c.args for c in handler.process_message.call_args_list] == [
+            (31, {"reading": i}) for i in range(3)
+        ]
+
+    def test_token_query_parameter(self, token: str, client: TestClient, handler):
+        with client.websocket_connect(f"/ws?token={token}") as websocket:
+            websocket.send_json({"reading": 1})
+            assert websocket.receive_json() == {"seq": 1, "status": 202}
+
+    def test_invalid_token_is_rejected(self, client: TestClient, handler):
+        with pytest.raises(WebSocketDisconnect) as e:
+            with client.websocket_connect("/ws", headers={"Authorization": "Bearer invalid"}):
+                pass
+        assert e.value.code == 1008
+
+    def test_invalid_frame_is_acked_with_its_error(self, token: str, client: TestClient, handler):
+        with client.websocket_connect(f"/ws?token={token}") as websocket:
+            websocket.send_text('["not", "an", "object"]')
+            websocket.send_json({"reading": 1})
+            assert websocket.receive_json()["status"] == 422
+            assert websocket.receive_json() == {"seq": 2, "status": 202}
+        handler.process_message.assert_called_once_with(31, {"reading": 1}, alarm=False, device_type=None)
+
+    def test_binary_frames(self, token: str, client: TestClient, handler):
+        body = b"\x81\xa7message\xa6Hello!"  # MessagePack {"message": "Hello!"}
+        with client.websocket_connect(f"/ws?token={token}&content_type=application/msgpack") as websocket:
+            websocket.send_bytes(body)
+            assert websocket.receive_json() == {"seq": 1, "status": 202}
+        handler.process_message.assert_called_once_with(
+            31, RawMessage(body, content_type="application/msgpack"), alarm=False, device_type=None
+        )
+
+    def test_broker_unavailable(self, token: str, client: TestClient, handler):
+        handler.process_message.side_effect = BrokerUnavailableError("down", retry_after=7)
+        with client.websocket_connect(f"/ws?token={token}") as websocket:
+            websocket.send_json({"reading": 1})
+            ack = websocket.receive_json()
+        assert ack["status"] == 503
+        assert ack["retry_after"] == 7
+
+    def test_rate_limited(self, token: str, client: TestClient, handler):
+        limiter = dict(rate_limiter.__dict__)
+        rate_limiter._rate, rate_limiter._burst = 1, 1
+        rate_limiter.clear()
+        try:
+            with client.websocket_connect(f"/ws?token={token}") as websocket:
+                websocket.send_json({"reading": 1})
+                websocket.send_json({"reading": 2})
+                acks = [websocket.receive_json() for _ in range(2)]
+        finally:
+            rate_limiter.__dict__.update(limiter)
+            rate_limiter.clear()
+        assert acks[0] == {"seq": 1, "status": 202}
+        assert acks[1]["status"] == 429
+        assert acks[1]["retry_after"] == 1
+
+    def test_removed_device_is_disconnected(self, client: TestClient, handler):
+        token = create_device_access_token(32)
+        try:
+            with client.websocket_connect(f"/ws?token={token}") as websocket:
+                token_cache.revoke(32)
+                websocket.send_json({"reading": 1})
+                with pytest.raises(WebSocketDisconnect) as e:
+                    websocket.receive_json()
+        finally:
+            token_cache._revoked.discard(32)
+            token_cache.clear()
+        assert e.value.code == 1008
+        handler.process_message.assert_not_called()
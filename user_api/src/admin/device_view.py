@@ -11,6 +11,7 @@ from starlette_admin.exceptions import FormValidationError
 from starlette_admin.fields import HasOne, IntegerField, StringField, TextAreaField
 
 # from starlette_admin._types import RowActionsDisplayType
+from src.admin.events import collect_removed_devices, publish_device_events
 from src.core.config import settings
 from src.core.security import create_device_access_token
 from src.models import Device, Environment, Message, User
@@ -143,7 +144,7 @@ class DeviceView(ModelView):
 
     async def after_create(self, request: Request, obj: Device) -> None:
         session: Session | AsyncSession = request.state.session
-        obj.token = create_device_access_token(obj.id)
+        obj.token = create_device_access_token(obj.id, obj.type)
         session.add(obj)
         if isinstance(session, AsyncSession):
             await session.commit()
@@ -182,5 +183,11 @@ class DeviceView(ModelView):
         except Exception as e:
             self.handle_exception(e)
 
+    async def before_delete(self, request: Request, obj: Device) -> None:
+        collect_removed_devices(request, [obj.id])
+
+    async def after_delete(self, request: Request, obj: Device) -> None:
+        await publish_device_events(request)
+
     # async def repr(self, obj: Any, request: Request) -> str:
     #     return f"{obj.id}"
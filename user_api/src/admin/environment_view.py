@@ -10,6 +10,7 @@ from starlette_admin.contrib.sqlmodel import ModelView
 from starlette_admin.exceptions import FormValidationError
 from starlette_admin.fields import HasMany, HasOne, IntegerField, TextAreaField
 
+from src.admin.events import collect_removed_devices, publish_device_events
 from src.models import Device, Environment, User
 from src.utils import generate_random_number
 
@@ -141,3 +142,9 @@ class EnvironmentView(ModelView):
                 raise FormValidationError({"error": "Unknown error"})
         except Exception as e:
             self.handle_exception(e)
+
+    async def before_delete(self, request: Request, obj: Environment) -> None:
+        collect_removed_devices(request, [device.id for device in obj.devices])
+
+    async def after_delete(self, request: Request, obj: Environment) -> None:
+        await publish_device_events(request)
@@ -0,0 +1,35 @@
+import anyio
+from starlette.requests import Request
+
+
+def collect_removed_devices(request: Request, device_ids: list[int]) -> None:
+    """
+    Keeps the ids of the devices a delete removes, read before the delete as the
+    cascade takes them away, see publish_device_events.
+    """
+    if not hasattr(request.state, "removed_devices"):
+        request.state.removed_devices = []
+    request.state.removed_devices.extend(device_ids)
+
+
+def collect_added_devices(request: Request, device_ids: list[int]) -> None:
+    """Keeps the ids of the devices accepted again, e.g. of a user reactivated."""
+    if not hasattr(request.state, "added_devices"):
+        request.state.added_devices = []
+    request.state.added_devices.extend(device_ids)
+
+
+async def publish_device_events(request: Request) -> None:
+    """
+    Revokes the devices tokens in the Receiver service and accepts the added ones
+    again, once the change committed.
+    """
+    events = request.state.device_events
+    device_ids = getattr(request.state, "removed_devices", [])
+    request.state.removed_devices = []
+    if device_ids:
+        await anyio.to_thread.run_sync(events.device_removed, *device_ids)
+    device_ids = getattr(request.state, "added_devices", [])
+    request.state.added_devices = []
+    if device_ids:
+        await anyio.to_thread.run_sync(events.device_added, *device_ids)
@@ -17,6 +17,11 @@ from starlette_admin.fields import (
     TextAreaField,
 )
 
+from src.admin.events import (
+    collect_added_devices,
+    collect_removed_devices,
+    publish_device_events,
+)
 from src.core.security import get_password_hash
 from src.models import Device, Environment, User
 from src.utils import generate_random_number
@@ -167,7 +172,14 @@ class UserView(ModelView):
             data["hashed_password"] = get_password_hash(data["hashed_password"])
 
             obj = await self.find_by_pk(request, pk)
+            was_active = obj.is_active
             await self._populate_obj(request, obj, data, True)
+            if obj.is_active != was_active:  # Its devices follow it
+                device_ids = [device.id for device in obj.devices]
+                if obj.is_active:
+                    collect_added_devices(request, device_ids)
+                else:
+                    collect_removed_devices(request, device_ids)
             session.add(obj)
             await self.before_edit(request, data, obj)
             if isinstance(session, AsyncSession):
@@ -187,3 +199,12 @@ class UserView(ModelView):
                 raise FormValidationError({"error": "Unknown error"})
         except Exception as e:
             self.handle_exception(e)
+
+    async def before_delete(self, request: Request, obj: User) -> None:
+        collect_removed_devices(request, [device.id for device in obj.devices])
+
+    async def after_edit(self, request: Request, obj: User) -> None:
+        await publish_device_events(request)
+
+    async def after_delete(self, request: Request, obj: User) -> None:
+        await publish_device_events(request)
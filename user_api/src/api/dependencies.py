@@ -59,6 +59,30 @@ def get_current_user(session: SessionDep, token: TokenDep) -> User:
 CurrentUser = Annotated[User, Depends(get_current_user)]
 
 
+DEVICE_SCHEMAS_SCOPE = "device-schemas"
+
+
+def get_device_schemas_service(token: TokenDep) -> str:
+    """Authenticates a service (e.g. a Receiver) allowed to read every device type schema."""
+    logger = logging.getLogger("get_device_schemas_service")
+
+    try:
+        payload = jwt.decode(
+            token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
+        )
+    except InvalidTokenError:
+        logger.error("Could not validate credentials")
+        raise HTTPException(status_code=403, detail="Could not validate credentials")
+
+    if payload.get("scope") != DEVICE_SCHEMAS_SCOPE:
+        logger.error("Token without the %s scope", DEVICE_SCHEMAS_SCOPE)
+        raise HTTPException(status_code=403, detail="Not enough privileges")
+    return str(payload.get("sub"))
+
+
+SchemasService = Annotated[str, Depends(get_device_schemas_service)]
+
+
 def get_current_active_superuser(current_user: CurrentUser) -> User:
     logger = logging.getLogger("get_current_active_superuser")
     logger.info("Getting current active superuser")
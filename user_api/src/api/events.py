@@ -0,0 +1,91 @@
+import logging
+from threading import Lock
+from typing import Annotated, Any
+
+from asgi_correlation_id import correlation_id
+from fastapi import Depends, Request
+
+from src.queues.channels import DeviceEventsChannel
+
+
+class DeviceEvents:
+    """
+    One per process, opened in the app lifespan, see RpcHandler. The events are
+    published from the background tasks threads, one at a time.
+    """
+
+    def __init__(self) -> None:
+        self.channel: DeviceEventsChannel | None = None
+        self._lock = Lock()
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.connect()
+
+    def connect(self) -> None:
+        try:
+            self.channel = DeviceEventsChannel()
+        except Exception as e:
+            self.logger.error("Error connecting the device events channel: %s", e)
+            self.channel = None
+
+    def status(self) -> bool:
+        return self.channel is not None and self.channel.status()
+
+    def close(self) -> None:
+        with self._lock:
+            if self.channel is not None and self.channel.status():
+                self.channel.close()
+            self.channel = None
+
+    def _publish(self, event: dict[Any, Any]) -> None:
+        with self._lock:
+            if not self.status():
+                self.connect()
+            try:
+                if self.channel is None:
+                    raise ConnectionError("Device events channel is not open")
+                self.channel.publish(event, correlation_id=correlation_id.get() or "")
+            except Exception as e:
+                self.logger.error("Error publishing device event: %s", e)
+                self.channel = None
+
+    def device_added(self, *device_ids: int) -> None:
+        for device_id in device_ids:
+            self._publish({"device_id": device_id, "method": "add"})
+
+    def device_removed(self, *device_ids: int) -> None:
+        for device_id in device_ids:
+            self._publish({"device_id": device_id, "method": "remove"})
+
+    def device_updated(
+        self, device_id: int, device_type: str | None, owner_id: int | None = None
+    ) -> None:
+        event = {"device_id": device_id, "method": "update", "type": device_type}
+        if owner_id is not None:
+            event["owner_id"] = owner_id  # The device type schemas are per user
+        self._publish(event)
+
+    def schema_updated(
+        self,
+        owner_id: int,
+        device_type: str,
+        payload_schema: dict | None,
+        device_ids: list[int],
+    ) -> None:
+        """Publishes the schema of a device type, None when removed, with its devices."""
+        self._publish(
+            {
+                "method": "schema",
+                "owner_id": owner_id,
+                "type": device_type,
+                "schema": payload_schema,
+                "device_ids": device_ids,
+            }
+        )
+
+
+def get_device_events(request: Request) -> DeviceEvents:
+    return request.app.state.device_events  # type: ignore
+
+
+deviceEvents = Annotated[DeviceEvents, Depends(get_device_events)]
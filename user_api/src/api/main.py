@@ -1,6 +1,14 @@
 from fastapi import APIRouter
 
-from src.api.routes import devices, environments, login, messages, users, utils
+from src.api.routes import (
+    devices,
+    environments,
+    login,
+    messages,
+    schemas,
+    users,
+    utils,
+)
 
 api_router = APIRouter()
 api_router.include_router(login.router, tags=["Login"])
@@ -9,5 +17,6 @@ api_router.include_router(users.router, prefix="/users")
 api_router.include_router(
     environments.router, prefix="/environments", tags=["Environments"]
 )
+api_router.include_router(schemas.router, prefix="/devices/types", tags=["Devices"])
 api_router.include_router(devices.router, prefix="/devices", tags=["Devices"])
 api_router.include_router(messages.router, prefix="/messages", tags=["Messages"])
@@ -6,6 +6,7 @@ from sqlmodel import func, select
 
 from src import crud
 from src.api import dependencies as deps
+from src.api.events import deviceEvents
 from src.api.rpc import rpcCall
 from src.models import (
     DefaultResponseMessage,
@@ -149,6 +150,7 @@ async def create_device(
     current_user: deps.CurrentUser,
     background_tasks: BackgroundTasks,
     rpcCall: rpcCall,
+    events: deviceEvents,
 ) -> Device | HTTPException:
     """
     Create a new Device, **"name"** and **"environment_id"** are required.
@@ -182,6 +184,13 @@ async def create_device(
     background_tasks.add_task(
         rpcCall.add_device_handler_cache, device.id
     )  # add to Handler service cache
+    background_tasks.add_task(
+        events.device_added, device.id
+    )  # and to the caches of the other Handler workers
+    if device.type:
+        background_tasks.add_task(
+            events.device_updated, device.id, device.type, device.owner_id
+        )  # the receivers validate it with its type schema
 
     logger.info("Device %s created", device.id)
     return device
@@ -198,6 +207,8 @@ async def update_device(
     device_id: int,
     device_in: DeviceUpdate,
     current_user: deps.CurrentUser,
+    background_tasks: BackgroundTasks,
+    events: deviceEvents,
 ) -> Device | HTTPException:
     """
     Update the Device information. If the **"environment_id"** is changed,
@@ -236,6 +247,11 @@ async def update_device(
         logger.error(e)
         raise HTTPException(status_code=422, detail="Bad body format")
 
+    if "type" in device_in.model_fields_set:
+        background_tasks.add_task(
+            events.device_updated, device.id, device.type, device.owner_id
+        )  # the receivers apply the new type policies
+
     logger.info("Device %s updated", device_id)
     return device
 
@@ -252,6 +268,7 @@ async def delete_device(
     current_user: deps.CurrentUser,
     background_tasks: BackgroundTasks,
     rpcCall: rpcCall,
+    events: deviceEvents,
 ) -> DefaultResponseMessage | HTTPException:
     """
     Delete a Device by its ID and **consequently** all its messages.
@@ -278,6 +295,9 @@ async def delete_device(
     background_tasks.add_task(
         rpcCall.remove_device_handler_cache, device_id
     )  # remove from Handler service cache
+    background_tasks.add_task(
+        events.device_removed, device_id
+    )  # revoke the device token in the Receiver service
 
     logger.info("Device %s deleted", device_id)
     return DefaultResponseMessage(message="Device deleted")
@@ -293,7 +313,12 @@ async def delete_device(
     response_model=DefaultResponseMessage,
 )
 async def delete_environment_devices(
-    *, session: deps.SessionDep, environment_id: int, current_user: deps.CurrentUser
+    *,
+    session: deps.SessionDep,
+    environment_id: int,
+    current_user: deps.CurrentUser,
+    background_tasks: BackgroundTasks,
+    events: deviceEvents,
 ) -> DefaultResponseMessage | HTTPException:
     """
     Delete all Devices from a Environment, **consequently** all its messages.
@@ -319,7 +344,17 @@ async def delete_environment_devices(
         )
         raise HTTPException(status_code=403, detail="Not enough permissions")
 
+    device_ids = [
+        device.id
+        for device in crud.get_devices_by_environment_id(
+            db=session, environment_id=environment_id
+        )
+    ]
     crud.delete_devices_per_environment_id(db=session, environment_id=environment_id)
 
+    background_tasks.add_task(
+        events.device_removed, *device_ids
+    )  # revoke the devices tokens in the Receiver service
+
     logger.info("Devices from environment %s deleted", environment_id)
     return DefaultResponseMessage(message="Devices deleted")
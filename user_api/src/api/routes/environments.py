@@ -1,11 +1,12 @@
 import logging
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, BackgroundTasks, HTTPException
 from pydantic import ValidationError
 from sqlmodel import func, select
 
 import src.api.dependencies as deps
 from src import crud
+from src.api.events import deviceEvents
 from src.models import (
     DefaultResponseMessage,
     Environment,
@@ -173,7 +174,12 @@ async def update_environment(
     response_model=DefaultResponseMessage,
 )
 async def delete_environment(
-    *, session: deps.SessionDep, environment_id: int, current_user: deps.CurrentUser
+    *,
+    session: deps.SessionDep,
+    environment_id: int,
+    current_user: deps.CurrentUser,
+    background_tasks: BackgroundTasks,
+    events: deviceEvents,
 ) -> DefaultResponseMessage | HTTPException:
     """
     Delete Environment, **it will** delete its devices and **consequently** its messages.
@@ -197,7 +203,12 @@ async def delete_environment(
         )
         raise HTTPException(status_code=403, detail="Not enough permissions")
 
+    device_ids = [device.id for device in environment.devices]
     crud.delete_environment(db=session, environment=environment)
 
+    background_tasks.add_task(
+        events.device_removed, *device_ids
+    )  # revoke the devices tokens in the Receiver service
+
     logger.info("Environment %s deleted", environment_id)
     return DefaultResponseMessage(message="Environment deleted successfully")
@@ -0,0 +1,198 @@
+import logging
+
+import fastjsonschema
+from fastapi import APIRouter, BackgroundTasks, HTTPException
+
+from src import crud
+from src.api import dependencies as deps
+from src.api.events import deviceEvents
+from src.models import (
+    DefaultResponseMessage,
+    DeviceTypeSchema,
+    DeviceTypeSchemaResponse,
+    DeviceTypeSchemasListResponse,
+    DeviceTypeSchemaUpdate,
+)
+
+router = APIRouter()
+
+
+@router.get(
+    "/",
+    responses={401: deps.responses_401},
+    response_model=DeviceTypeSchemasListResponse,
+)
+async def get_user_device_type_schemas(
+    *, session: deps.SessionDep, current_user: deps.CurrentUser
+) -> DeviceTypeSchemasListResponse | HTTPException:
+    """
+    Retrieve all the device type Schemas from logged User.
+    """
+    logger = logging.getLogger("GET devices/types/")
+    logger.info("getting all device type schemas from user %s", current_user.username)
+
+    schemas = crud.get_device_type_schemas(db=session, owner_id=current_user.id)
+
+    logger.info("Returning %s device type schemas", len(schemas))
+    return DeviceTypeSchemasListResponse(
+        owner_id=current_user.id, count=len(schemas), data=schemas
+    )
+
+
+@router.get("/schemas", include_in_schema=False)
+async def get_all_device_type_schemas(
+    *, session: deps.SessionDep, service: deps.SchemasService
+) -> dict:
+    """
+    Snapshot of every device type Schema with its devices, loaded by the Receivers
+    when they (re)connect to the device events.
+    """
+    logger = logging.getLogger("GET devices/types/schemas")
+    logger.info("Service %s loading the device type schemas", service)
+
+    schemas = [
+        {
+            "owner_id": schema.owner_id,
+            "type": schema.device_type,
+            "schema": schema.payload_schema,
+            "device_ids": [
+                device.id
+                for device in crud.get_devices_by_type(
+                    db=session, type=schema.device_type, owner_id=schema.owner_id
+                )
+            ],
+        }
+        for schema in crud.get_device_type_schemas(db=session)
+    ]
+
+    logger.info("Returning %s device type schemas", len(schemas))
+    return {"schemas": schemas}
+
+
+@router.get("/devices", include_in_schema=False)
+async def get_all_device_types(
+    *, session: deps.SessionDep, service: deps.SchemasService
+) -> dict:
+    """
+    Snapshot of the type of every device, loaded by the Receivers when they
+    (re)connect to the device events, instead of trusting the type in the tokens.
+    """
+    logger = logging.getLogger("GET devices/types/devices")
+    logger.info("Service %s loading the device types", service)
+
+    devices = crud.get_device_types(db=session)
+
+    logger.info("Returning the types of %s devices", len(devices))
+    return {"devices": devices}
+
+
+@router.get(
+    "/{device_type}/schema",
+    responses={401: deps.responses_401, 404: deps.responses_404},
+    response_model=DeviceTypeSchemaResponse,
+)
+async def get_device_type_schema(
+    *, device_type: str, session: deps.SessionDep, current_user: deps.CurrentUser
+) -> DeviceTypeSchema | HTTPException:
+    """
+    Retrieve the JSON Schema the messages of a device type must match.
+    """
+    logger = logging.getLogger("GET devices/types/schema")
+    logger.info("getting schema %s from user %s", device_type, current_user.username)
+
+    schema = crud.get_device_type_schema(
+        db=session, owner_id=current_user.id, device_type=device_type
+    )
+    if schema is None:
+        logger.warning("Schema %s not found", device_type)
+        raise HTTPException(status_code=404, detail="Schema not found")
+
+    return schema
+
+
+@router.put(
+    "/{device_type}/schema",
+    responses={401: deps.responses_401, 422: deps.responses_422},
+    response_model=DeviceTypeSchemaResponse,
+)
+async def set_device_type_schema(
+    *,
+    device_type: str,
+    schema_in: DeviceTypeSchemaUpdate,
+    session: deps.SessionDep,
+    current_user: deps.CurrentUser,
+    background_tasks: BackgroundTasks,
+    events: deviceEvents,
+) -> DeviceTypeSchema | HTTPException:
+    """
+    Create or replace the JSON Schema of a device type. The Receivers reject
+    with 422 the messages of the devices of this **"type"** that do not match it.
+    """
+    logger = logging.getLogger("PUT devices/types/schema")
+    logger.info("Setting schema %s from user %s", device_type, current_user.username)
+
+    if len(device_type) > 55:
+        raise HTTPException(status_code=422, detail="Device type too long")
+    try:
+        fastjsonschema.compile(schema_in.payload_schema)
+    except fastjsonschema.JsonSchemaDefinitionException as e:
+        logger.warning("Invalid schema %s: %s", device_type, e)
+        raise HTTPException(status_code=422, detail=f"Invalid JSON Schema: {e}")
+
+    schema = crud.set_device_type_schema(
+        db=session,
+        owner_id=current_user.id,
+        device_type=device_type,
+        payload_schema=schema_in.payload_schema,
+    )
+    device_ids = [
+        device.id
+        for device in crud.get_devices_by_type(
+            db=session, type=device_type, owner_id=current_user.id
+        )
+    ]
+    background_tasks.add_task(
+        events.schema_updated,
+        current_user.id,
+        device_type,
+        schema.payload_schema,
+        device_ids,
+    )  # the receivers start validating the messages
+
+    logger.info("Schema %s set", device_type)
+    return schema
+
+
+@router.delete(
+    "/{device_type}/schema",
+    responses={401: deps.responses_401, 404: deps.responses_404},
+    response_model=DefaultResponseMessage,
+)
+async def delete_device_type_schema(
+    *,
+    device_type: str,
+    session: deps.SessionDep,
+    current_user: deps.CurrentUser,
+    background_tasks: BackgroundTasks,
+    events: deviceEvents,
+) -> DefaultResponseMessage | HTTPException:
+    """
+    Delete the JSON Schema of a device type, its messages are no longer validated.
+    """
+    logger = logging.getLogger("DELETE devices/types/schema")
+    logger.info("Deleting schema %s from user %s", device_type, current_user.username)
+
+    schema = crud.get_device_type_schema(
+        db=session, owner_id=current_user.id, device_type=device_type
+    )
+    if schema is None:
+        logger.warning("Schema %s not found", device_type)
+        raise HTTPException(status_code=404, detail="Schema not found")
+
+    crud.delete_device_type_schema(db=session, db_schema=schema)
+    background_tasks.add_task(
+        events.schema_updated, current_user.id, device_type, None, []
+    )
+
+    logger.info("Schema %s deleted", device_type)
+    return DefaultResponseMessage(message="Schema deleted")
@@ -7,6 +7,7 @@ from sqlmodel import func, select
 
 import src.api.dependencies as deps
 from src import crud
+from src.api.events import deviceEvents
 from src.core.config import settings
 from src.core.security import verify_password
 from src.mail.utils import generate_new_account_email, send_email
@@ -125,7 +126,10 @@ def update_my_password(
     responses={401: deps.responses_401, 403: deps.responses_403},
 )
 async def deactivate_me(
-    session: deps.SessionDep, current_user: deps.CurrentUser
+    session: deps.SessionDep,
+    current_user: deps.CurrentUser,
+    background_tasks: BackgroundTasks,
+    events: deviceEvents,
 ) -> DefaultResponseMessage | HTTPException:
     """
     Deactivate own user.
@@ -140,6 +144,10 @@ async def deactivate_me(
         )
     crud.deactivate_user(db=session, user=current_user)
 
+    background_tasks.add_task(
+        events.device_removed, *[device.id for device in current_user.devices]
+    )  # revoke the devices tokens until reactivated, see crud.get_device_types
+
     logger.info("User %s deactivated successfully", current_user.username)
     return DefaultResponseMessage(message="User deactivated successfully")
 
@@ -335,7 +343,12 @@ async def update_user(
     response_model=DefaultResponseMessage,
 )
 async def delete_user(
-    *, id: int, session: deps.SessionDep, current_user: deps.CurrentUser
+    *,
+    id: int,
+    session: deps.SessionDep,
+    current_user: deps.CurrentUser,
+    background_tasks: BackgroundTasks,
+    events: deviceEvents,
 ) -> DefaultResponseMessage | HTTPException:
     """
     Deactivate some user.
@@ -358,5 +371,9 @@ async def delete_user(
 
     crud.deactivate_user(db=session, user=user)
 
+    background_tasks.add_task(
+        events.device_removed, *[device.id for device in user.devices]
+    )  # revoke the devices tokens until reactivated, see crud.get_device_types
+
     logger.info("User %s deactivated successfully", id)
     return DefaultResponseMessage(message="User deactivated successfully")
@@ -1,32 +1,73 @@
-from typing import Annotated
+import logging
+from threading import Lock
+from typing import Annotated, Any
 
 from asgi_correlation_id import correlation_id
-from fastapi import Depends
+from fastapi import Depends, Request
 
 from src.queues.channels import RpcChannel
 
 
 class RpcHandler:
+    """
+    One per process, opened in the app lifespan. The blocking channel is not thread
+    safe, so the calls (made from the background tasks threads) take turns on it,
+    and it is reopened on the next call after the broker connection is lost.
+    """
+
     def __init__(self) -> None:
-        self.rpc: RpcChannel = RpcChannel()
+        self.rpc: RpcChannel | None = None
+        self._lock = Lock()
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.connect()
+
+    def connect(self) -> None:
+        try:
+            self.rpc = RpcChannel()
+        except Exception as e:
+            self.logger.error("Error connecting the RPC channel: %s", e)
+            self.rpc = None
+
+    def status(self) -> bool:
+        return self.rpc is not None and self.rpc.status()
+
+    def close(self) -> None:
+        with self._lock:
+            if self.rpc is not None and self.rpc.status():
+                self.rpc.close()
+            self.rpc = None
+
+    def _call(self, message: dict[Any, Any]) -> str | None:
+        with self._lock:
+            if not self.status():
+                self.connect()
+            if self.rpc is None:
+                return None
+            try:
+                return self.rpc.publish(
+                    message, correlation_id=correlation_id.get() or ""
+                )
+            except Exception as e:
+                self.logger.error("Error on RPC request: %s", e)
+                self.rpc = None
+                return None
 
     def add_device_handler_cache(self, device_id: int) -> bool:
-        response = self.rpc.publish(
-            {"device_id": device_id, "method": "add"},
-            correlation_id=correlation_id.get() or "",
-        )
+        response = self._call({"device_id": device_id, "method": "add"})
         if response:
             return True
         return False
 
     def remove_device_handler_cache(self, device_id: int) -> bool:
-        response = self.rpc.publish(
-            {"device_id": device_id, "method": "remove"},
-            correlation_id=correlation_id.get() or "",
-        )
+        response = self._call({"device_id": device_id, "method": "remove"})
         if response:
             return True
         return False
 
 
-rpcCall = Annotated[RpcHandler, Depends(RpcHandler)]
+def get_rpc_handler(request: Request) -> RpcHandler:
+    return request.app.state.rpc_handler  # type: ignore
+
+
+rpcCall = Annotated[RpcHandler, Depends(get_rpc_handler)]
@@ -83,6 +83,9 @@ class Settings(BaseSettings):
     RPC_QUEUE: str
     RPC_TIMEOUT: int = 3
 
+    # Device events, consumed by the receiver caches
+    DEVICE_EVENTS_EXCHANGE: str = "device_events"
+
     @computed_field  # type: ignore
     @property
     def LOG_ROUTING_KEY(self) -> str:
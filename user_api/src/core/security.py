@@ -27,8 +27,12 @@ def create_access_token(subject: str | Any, expires_delta: timedelta) -> str:
     return encoded_jwt
 
 
-def create_device_access_token(device_id: int | Any) -> str:
+def create_device_access_token(
+    device_id: int | Any, device_type: str | None = None
+) -> str:
     to_encode = {"sub": str(device_id)}
+    if device_type is not None:
+        to_encode["type"] = device_type  # Lets the receiver apply per type policies
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
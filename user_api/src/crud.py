@@ -9,6 +9,7 @@ from src.utils import generate_random_number
 from .models import (
     Device,
     DeviceCreation,
+    DeviceTypeSchema,
     DeviceUpdate,
     Environment,
     EnvironmentCreation,
@@ -162,7 +163,10 @@ def create_device(*, db: Session, device_input: DeviceCreation) -> Device:
 
     device = Device.model_validate(
         device_input,
-        update={"id": _id, "token": security.create_device_access_token(_id)},
+        update={
+            "id": _id,
+            "token": security.create_device_access_token(_id, device_input.type),
+        },
     )
     db.add(device)
     db.commit()
@@ -205,6 +209,16 @@ def get_devices_by_owner_id(*, db: Session, owner_id: int) -> Sequence[Device]:
     return session_devices
 
 
+def get_device_types(*, db: Session) -> dict[int, str | None]:
+    """The devices accepted by the Receivers: the ones of the active users."""
+    statement = (
+        select(Device.id, Device.type)
+        .join(User, Device.owner_id == User.id)
+        .where(User.is_active)
+    )
+    return dict(db.exec(statement).all())
+
+
 def get_devices_by_environment_id(
     *, db: Session, environment_id: int
 ) -> Sequence[Device]:
@@ -234,6 +248,45 @@ def delete_device(*, db: Session, device: Device) -> None:
     db.commit()
 
 
+# -------------------------- DEVICE TYPE SCHEMA -----------------------------------
+def get_device_type_schema(
+    *, db: Session, owner_id: int, device_type: str
+) -> DeviceTypeSchema | None:
+    return db.get(DeviceTypeSchema, (owner_id, device_type))
+
+
+def get_device_type_schemas(
+    *, db: Session, owner_id: int | None = None
+) -> Sequence[DeviceTypeSchema]:
+    statement = select(DeviceTypeSchema)
+    if owner_id is not None:
+        statement = statement.where(DeviceTypeSchema.owner_id == owner_id)
+    return db.exec(statement).all()
+
+
+def set_device_type_schema(
+    *, db: Session, owner_id: int, device_type: str, payload_schema: dict
+) -> DeviceTypeSchema:
+    db_schema = get_device_type_schema(
+        db=db, owner_id=owner_id, device_type=device_type
+    )
+    if db_schema is None:
+        db_schema = DeviceTypeSchema(
+            owner_id=owner_id, device_type=device_type, payload_schema=payload_schema
+        )
+    else:
+        db_schema.payload_schema = payload_schema
+    db.add(db_schema)
+    db.commit()
+    db.refresh(db_schema)
+    return db_schema
+
+
+def delete_device_type_schema(*, db: Session, db_schema: DeviceTypeSchema) -> None:
+    db.delete(db_schema)
+    db.commit()
+
+
 # -------------------------- MESSAGE -----------------------------------
 def get_message_by_id(*, db: Session, message_id: int) -> Message | None:
     statement = select(Message).where(Message.id == message_id)
@@ -1,17 +1,22 @@
 import logging
 from collections.abc import AsyncGenerator
 from contextlib import asynccontextmanager
+from typing import Any
 
 from asgi_correlation_id import CorrelationIdMiddleware
 from asgi_correlation_id.middleware import is_valid_uuid4
 from fastapi import FastAPI, Request
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
+from sqlalchemy import text
 
 import src.doc as doc
 from src.admin import admin
+from src.api.events import DeviceEvents
 from src.api.main import api_router
+from src.api.rpc import RpcHandler
 from src.core.config import settings
+from src.core.db import engine
 from src.errors import unhandled_exception_handler
 from src.logger.setup import setup_logging_config
 
@@ -19,10 +24,16 @@ setup_logging_config()
 
 
 @asynccontextmanager
-async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
+async def lifespan(app: FastAPI) -> AsyncGenerator[dict[str, Any], None]:
     logger = logging.getLogger("lifespan")
     logger.info("StartUP")
-    yield
+    # Opened once per worker process, the requests share them
+    app.state.rpc_handler = RpcHandler()
+    app.state.device_events = DeviceEvents()
+    # Also in the request state, for the admin views: their mounted app has its own
+    yield {"device_events": app.state.device_events}
+    app.state.rpc_handler.close()
+    app.state.device_events.close()
     logger.info("ShutDown")
 
 
@@ -64,6 +75,33 @@ async def favicon() -> FileResponse:
     return FileResponse("src/static/icon.ico")
 
 
+# Probes -------------------------------------------------------------------
+@app.get("/ready", include_in_schema=False)
+def ready(request: Request) -> JSONResponse:
+    """
+    Readiness probe: 200 once the database answers and the broker channels are open,
+    503 otherwise.
+    """
+    logger = logging.getLogger("Ready Probe")
+    try:
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+        database = True
+    except Exception as e:
+        logger.error("Database not ready: %s", e)
+        database = False
+
+    broker = (
+        request.app.state.rpc_handler.status()
+        and request.app.state.device_events.status()
+    )
+    ready = database and broker
+    return JSONResponse(
+        {"ready": ready, "database": database, "broker": broker},
+        status_code=200 if ready else 503,
+    )
+
+
 # Test route ---------------------------------------------------------------
 @app.get("/test", include_in_schema=False)
 async def root(request: Request) -> dict[str, str]:
@@ -151,6 +151,68 @@ class Device(DeviceBase, BaseModel, table=True):
         return f"{self.name} {self.model}"
 
 
+# --------------------------- DEVICE TYPE SCHEMA MODELS ----------------
+class DeviceTypeSchemaUpdate(SQLModel):
+    payload_schema: dict
+
+    model_config = {
+        "json_schema_extra": {
+            "examples": [
+                {
+                    "payload_schema": {
+                        "type": "object",
+                        "properties": {"value": {"type": "number"}},
+                        "required": ["value"],
+                    }
+                }
+            ]
+        }
+    }
+
+
+class DeviceTypeSchemaResponse(SQLModel):
+    device_type: str
+    payload_schema: dict
+    updated_on: datetime | None = None
+
+    model_config = {
+        "json_schema_extra": {
+            "examples": [
+                {
+                    "device_type": "sensor",
+                    "payload_schema": {
+                        "type": "object",
+                        "properties": {"value": {"type": "number"}},
+                        "required": ["value"],
+                    },
+                    "updated_on": "2024-07-12T15:00:00Z",
+                }
+            ]
+        }
+    }
+
+
+class DeviceTypeSchemasListResponse(SQLModel):
+    owner_id: int
+    count: int
+    data: list["DeviceTypeSchemaResponse"]
+
+
+class DeviceTypeSchema(SQLModel, table=True):
+    """The JSON Schema the messages of a user device type must match, enforced by the receivers."""
+
+    owner_id: int = Field(
+        foreign_key="user.id", primary_key=True, nullable=False, ondelete="CASCADE"
+    )
+    device_type: str = Field(primary_key=True, max_length=55)
+    payload_schema: dict = Field(nullable=False, sa_type=sa.JSON)
+    updated_on: str = Field(
+        default=None,
+        sa_type=sa.TIMESTAMP(timezone=True),
+        sa_column_kwargs={"onupdate": sa.func.now(), "server_default": sa.func.now()},
+    )
+
+
 # --------------------------- MESSAGE MODELS ---------------------------
 class MessageBase(SQLModel):
     message: dict
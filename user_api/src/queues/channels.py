@@ -1,6 +1,5 @@
 import json
 import logging
-from time import sleep
 from typing import Any
 
 import pika  # type: ignore
@@ -21,10 +20,9 @@ class LogChannel(ABSQueueChannel):
         self._routing_key: str = settings.LOG_ROUTING_KEY
 
     def connect(self) -> None:
+        # The blocking connection and channel return once the broker opened them
         self._connection = get_queue_access()
-        sleep(1)
         self._channel = self._connection.open_channel(tag=self.__class__.__name__)
-        sleep(1)
 
     def status(self) -> bool:
         try:
@@ -97,7 +95,6 @@ class RpcChannel:
     def connect(self) -> None:
         self.logger.info("Connecting to Queue")
         self._connection = get_queue_access()
-        sleep(1)
 
     def status(self) -> bool:
         try:
@@ -110,6 +107,9 @@ class RpcChannel:
     def stop(self) -> None:
         self._channel.close()
 
+    def close(self) -> None:
+        self._connection.close_connection()
+
     def setup(self) -> None:
         self._channel = self._connection.open_channel(tag=self.__class__.__name__)
 
@@ -181,3 +181,71 @@ class RpcChannel:
 
 def get_rpc_channel() -> RpcChannel:
     return RpcChannel()
+
+
+class DeviceEventsChannel:
+    """
+    Publishes the device lifecycle events (add, remove, ...) to a fanout exchange,
+    so the services that cache devices (e.g. the receiver token cache) stay in sync.
+    """
+
+    def __init__(self) -> None:
+        self._connection: PublishingManager
+        self._channel: Channel
+        self._exchange = settings.DEVICE_EVENTS_EXCHANGE
+
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.connect()
+        if self._connection.status():
+            self.setup()
+
+    def connect(self) -> None:
+        self.logger.info("Connecting to Queue")
+        self._connection = get_queue_access()
+
+    def status(self) -> bool:
+        try:
+            if self._channel.is_open:
+                return True
+        except AttributeError as e:
+            self.logger.error(f"Error checking status: {e}")
+        return False
+
+    def stop(self) -> None:
+        self._channel.close()
+
+    def close(self) -> None:
+        self._connection.close_connection()
+
+    def setup(self) -> None:
+        self._channel = self._connection.open_channel(tag=self.__class__.__name__)
+        self._channel.exchange_declare(
+            exchange=self._exchange,
+            exchange_type="fanout",
+            durable=True,
+        )
+
+    def publish(self, message: dict[Any, Any], correlation_id: str) -> None:
+        properties = pika.BasicProperties(
+            app_id=settings.USERAPI_ID,
+            content_type="application/json",
+            correlation_id=correlation_id,
+        )
+        self._connection.publish(
+            self._channel.basic_publish(
+                exchange=self._exchange,
+                routing_key="",
+                body=json.dumps(message).encode(),
+                properties=properties,
+            )
+        )
+        self.logger.info(
+            "Device event %s %s",
+            message["method"],
+            message.get("device_id", message.get("type")),  # schema events, per type
+        )
+
+
+def get_device_events_channel() -> DeviceEventsChannel:
+    return DeviceEventsChannel()
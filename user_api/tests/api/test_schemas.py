@@ -0,0 +1,150 @@
+from datetime import datetime, timedelta
+
+import jwt
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from src import crud
+from src.core import security
+from src.core.config import settings
+from src.models import DeviceCreation, EnvironmentCreation
+
+SCHEMA = {
+    "type": "object",
+    "properties": {"value": {"type": "number"}},
+    "required": ["value"],
+}
+
+
+def service_token_headers(scope: str) -> dict[str, str]:
+    token = jwt.encode(
+        {"sub": "RECEIVER", "scope": scope, "exp": datetime.now() + timedelta(minutes=1)},
+        settings.SECRET_KEY,
+        algorithm=security.ALGORITHM,
+    )
+    return {"Authorization": f"Bearer {token}"}
+
+
+class TestDeviceTypeSchemas:
+    @pytest.fixture(autouse=True, scope="class")
+    def devicesbatch(self, db: Session, client: TestClient, normal_token_headers) -> dict:
+        response = client.get("/users/me", headers=normal_token_headers)
+        user_id = response.json()["id"]
+
+        environment = EnvironmentCreation(name="Environment", description="Description")
+        environment = crud.create_environment(
+            db=db,
+            environment_input=environment,
+            owner_id=user_id
+            )
+
+        device_ids = []
+        for i in range(3):
+            device = DeviceCreation(
+                owner_id=user_id,
+                environment_id=environment.id,
+                name=f"Device_{i}",
+                type="sensor" if i else "actuator",
+            )
+            device_ids.append(crud.create_device(db=db, device_input=device).id)
+
+        return {"user_id": user_id, "device_ids": device_ids}
+
+    def test_set_schema(self, client: TestClient, normal_token_headers: dict) -> None:
+        response = client.put(
+            "/devices/types/sensor/schema",
+            headers=normal_token_headers,
+            json={"payload_schema": SCHEMA},
+        )
+        assert response.status_code == 200
+        assert response.json()["device_type"] == "sensor"
+        assert response.json()["payload_schema"] == SCHEMA
+
+    def test_get_schema(self, client: TestClient, normal_token_headers: dict) -> None:
+        response = client.get("/devices/types/sensor/schema", headers=normal_token_headers)
+        assert response.status_code == 200
+        assert response.json()["payload_schema"] == SCHEMA
+
+    def test_get_user_schemas(self, client: TestClient, normal_token_headers: dict) -> None:
+        response = client.get("/devices/types/", headers=normal_token_headers)
+        assert response.status_code == 200
+        assert response.json()["count"] == 1
+
+    def test_replace_schema(self, client: TestClient, normal_token_headers: dict) -> None:
+        new_schema = {"type": "object"}
+        response = client.put(
+            "/devices/types/sensor/schema",
+            headers=normal_token_headers,
+            json={"payload_schema": new_schema},
+        )
+        assert response.status_code == 200
+        assert response.json()["payload_schema"] == new_schema
+
+        response = client.put(
+            "/devices/types/sensor/schema",
+            headers=normal_token_headers,
+            json={"payload_schema": SCHEMA},
+        )
+        assert response.status_code == 200
+
+    def test_set_invalid_schema(self, client: TestClient, normal_token_headers: dict) -> None:
+        response = client.put(
+            "/devices/types/sensor/schema",
+            headers=normal_token_headers,
+            json={"payload_schema": {"type": "not-a-type"}},
+        )
+        assert response.status_code == 422
+
+    def test_get_schema_not_found(self, client: TestClient, normal_token_headers: dict) -> None:
+        response = client.get("/devices/types/actuator/schema", headers=normal_token_headers)
+        assert response.status_code == 404
+
+    def test_get_schema_other_user(self, client: TestClient, superuser_token_headers: dict) -> None:
+        response = client.get("/devices/types/sensor/schema", headers=superuser_token_headers)
+        assert response.status_code == 404
+
+    def test_get_schema_no_token(self, client: TestClient) -> None:
+        response = client.get("/devices/types/sensor/schema")
+        assert response.status_code == 401
+
+    def test_service_snapshot(self, client: TestClient, devicesbatch) -> None:
+        response = client.get(
+            "/devices/types/schemas", headers=service_token_headers("device-schemas")
+        )
+        assert response.status_code == 200
+        schemas = response.json()["schemas"]
+        assert len(schemas) == 1
+        assert schemas[0]["owner_id"] == devicesbatch["user_id"]
+        assert schemas[0]["type"] == "sensor"
+        assert schemas[0]["schema"] == SCHEMA
+        assert sorted(schemas[0]["device_ids"]) == devicesbatch["device_ids"][1:]
+
+    def test_service_device_types(self, client: TestClient, devicesbatch) -> None:
+        response = client.get(
+            "/devices/types/devices", headers=service_token_headers("device-schemas")
+        )
+        assert response.status_code == 200
+        devices = response.json()["devices"]
+        first, *others = devicesbatch["device_ids"]
+        assert devices[str(first)] == "actuator"
+        assert all(devices[str(device_id)] == "sensor" for device_id in others)
+
+    def test_service_snapshot_wrong_scope(
+            self, client: TestClient, normal_token_headers: dict) -> None:
+        response = client.get("/devices/types/schemas", headers=service_token_headers("other"))
+        assert response.status_code == 403
+
+        response = client.get("/devices/types/schemas", headers=normal_token_headers)
+        assert response.status_code == 403
+
+    def test_delete_schema(self, client: TestClient, normal_token_headers: dict) -> None:
+        response = client.delete("/devices/types/sensor/schema", headers=normal_token_headers)
+        assert response.status_code == 200
+
+        response = client.get("/devices/types/sensor/schema", headers=normal_token_headers)
+        assert response.status_code == 404
+
+    def test_delete_schema_not_found(self, client: TestClient, normal_token_headers: dict) -> None:
+        response = client.delete("/devices/types/sensor/schema", headers=normal_token_headers)
+        assert response.status_code == 404
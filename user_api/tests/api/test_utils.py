@@ -19,3 +19,16 @@ class TestEmailTestRouter:
     def test_test_email_invalid_superuser(self, client: TestClient, normal_token_headers):
         response = client.post("utils/test-email/", headers=normal_token_headers)
         assert response.status_code == 403
+
+
+class TestReadiness:
+    def test_ready(self, client: TestClient):
+        response = client.get("/ready")
+        assert response.status_code == 200
+        assert response.json() == {"ready": True, "database": True, "broker": True}
+
+    def test_ready_broker_down(self, client: TestClient, monkeypatch):
+        monkeypatch.setattr(client.app.state.device_events, "status", lambda: False)
+        response = client.get("/ready")
+        assert response.status_code == 503
+        assert response.json()["broker"] is False
@@ -151,6 +151,25 @@ def test_get_devices_by_owner_id(
         assert device.created_on is not None, f"device: {device}"
 
 
+def test_get_device_types_of_active_users(
+    db: Session, userfix: dict, environmentfix: dict, devicefix
+) -> None:
+    user_in = UserCreation(**userfix)
+    environment_in = EnvironmentCreation(**environmentfix)
+    user = crud.create_user(db=db, user_input=user_in)
+    environment = crud.create_environment(db=db, environment_input=environment_in, owner_id=user.id)
+    device_in = DeviceCreation(**devicefix, owner_id=user.id, environment_id=environment.id)
+    device = crud.create_device(db=db, device_input=device_in)
+
+    assert crud.get_device_types(db=db)[device.id] == device.type
+
+    crud.deactivate_user(db=db, user=user)
+    assert device.id not in crud.get_device_types(db=db), "Owner deactivated"
+
+    crud.activate_user(db=db, user=user)
+    assert device.id in crud.get_device_types(db=db), "Owner reactivated"
+
+
 def test_get_devices_by_environment_id(
     db: Session, userfix: dict, environmentfix: dict, devicefix
 ) -> None: